@@ -759,7 +759,7 @@ class Results():
 
         inj = self.INJ.pivot(index="t", columns="n", values="INJ")
         inj = inj.loc[self.model_horizon, self.data.nodes.index]
-        flow = np.dot(self.grid.ptdf, inj.T)
+        flow = np.dot(self.grid.ptdf, inj.T.values.astype(self.grid.precision))
         n_0_flows = pd.DataFrame(index=self.data.lines.index, columns=self.model_horizon, data=flow)
         n_0_flows.index.name = 'index'
         self.cache_to_disk(n_0_flows, "n_0_flows")
@@ -769,8 +769,9 @@ class Results():
         """N-1 power flows on lines (cb) under outages (co).
 
         Calculates the power flows on all lines under the outages with significant impact.
-        This is calculated with :meth:`~pomato.grid.create_filtered_n_1_ptdf`
-        where this is described in greater detail.
+        This is calculated with :meth:`~pomato.grid.GridTopology.iter_filtered_n_1_ptdf`, 
+        see :meth:`~pomato.grid.GridTopology.create_filtered_n_1_ptdf` where this is 
+        described in greater detail.
 
         Parameters
         ----------
@@ -794,14 +795,16 @@ class Results():
             self.logger.debug("Returning cached result for n_1_flows.")
             return self.read_cached_result("n_1_flows")
         
-        data = self.grid.create_filtered_n_1_ptdf(sensitivity=sensitivity)
-        ptdf = data.loc[:, self.data.nodes.index]
         inj = self.INJ.pivot(index="t", columns="n", values="INJ")
         inj = inj.loc[self.model_horizon, self.data.nodes.index]
-        flow = np.dot(ptdf, inj.T)
-        n_1_flows = pd.DataFrame(columns=self.model_horizon, data=flow)
-        n_1_flows["cb"] = data.cb
-        n_1_flows["co"] = data.co
+        # The N-1 ptdf is processed in chunks and only the flows are kept.
+        cb, co, flow = [], [], []
+        for cb_chunk, co_chunk, _, ptdf in self.grid.iter_filtered_n_1_ptdf(sensitivity=sensitivity):
+            cb.append(cb_chunk)
+            co.append(co_chunk)
+            flow.append(np.dot(ptdf, inj.T.values.astype(self.grid.precision)))
+        n_1_flows = pd.DataFrame(columns=self.model_horizon, data=np.vstack(flow))
+        n_1_flows["cb"], n_1_flows["co"] = self.grid.cbco_labels(np.hstack(cb), np.hstack(co))
 
         self.logger.info("Done Calculating N-1 Flows")
         n_1_flows = n_1_flows.loc[:, ["cb", "co"] + self.model_horizon]
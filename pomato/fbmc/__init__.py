@@ -41,4 +41,5 @@ or relaxed according to minRAM/security/ATC margins.
 
 
 """
+from pomato.fbmc.fb_parameters import FBParameters
 from pomato.fbmc.fbmc_module import FBMCModule
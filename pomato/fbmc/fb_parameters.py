@@ -0,0 +1,123 @@
+"""Container of the flow based parameters of POMATO."""
+import numpy as np
+import pandas as pd
+
+
+class FBParameters():
+    """Flow based parameters, stored by CNEC and timestep.
+
+    The FB parameters consist of a zonal ptdf and a RAM for each CNEC (critical network element
+    and contingency) and timestep. With a static GSK the zonal ptdf is identical for all
+    timesteps and therefore stored once, only with a dynamic GSK a zonal ptdf per timestep
+    is stored. CNECs that are removed for a timestep, e.g. by the redundancy removal, are
+    masked.
+
+    The long DataFrame format, with a row per CNEC and timestep, is created lazily by
+    :meth:`~to_frame` or per timestep by :meth:`~frame`. The market model data is written
+    timestep by timestep with :meth:`~to_csv`.
+
+    Parameters
+    ----------
+    cb, co : np.ndarray
+        Critical branch and outage label of each CNEC.
+    zones : list-like
+        Zones, i.e. the columns of the zonal ptdf.
+    timesteps : list-like
+        Timesteps of the FB parameters.
+    ptdf : np.ndarray
+        Zonal ptdf, CNEC x Zone for a static or CNEC x Timestep x Zone for a dynamic GSK.
+    ram : np.ndarray
+        RAM, CNEC x Timestep.
+    gsk_strategy : str
+        GSK used to derive the zonal ptdf.
+
+    Attributes
+    ----------
+    mask : np.ndarray
+        CNEC x Timestep boolean array, False for CNECs that are removed in a timestep.
+    """
+    columns = ["cb", "co", "ram", "timestep", "gsk_strategy"]
+
+    def __init__(self, cb, co, zones, timesteps, ptdf, ram, gsk_strategy):
+        self.cb = np.asarray(cb, dtype=object)
+        self.co = np.asarray(co, dtype=object)
+        self.zones = list(zones)
+        self.timesteps = list(timesteps)
+        self.ptdf = ptdf
+        self.ram = ram
+        self.gsk_strategy = gsk_strategy
+        self.mask = np.ones(ram.shape, dtype=bool)
+
+    @property
+    def dynamic(self):
+        """Zonal ptdf per timestep."""
+        return self.ptdf.ndim == 3
+
+    @property
+    def empty(self):
+        """No CNEC in any timestep, analog to :attr:`pandas.DataFrame.empty`."""
+        return not self.mask.any()
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def zonal_ptdf(self, timestep):
+        """Return the zonal ptdf (CNEC x Zone) of timestep, including masked CNECs."""
+        if self.dynamic:
+            return self.ptdf[:, self.timesteps.index(timestep), :]
+        return self.ptdf
+
+    def _frame(self, cnec, time):
+        """Return the long DataFrame of the CNEC and timestep positions."""
+        frame = pd.DataFrame({"cb": self.cb[cnec], "co": self.co[cnec], "ram": self.ram[cnec, time],
+                              "timestep": np.asarray(self.timesteps, dtype=object)[time],
+                              "gsk_strategy": self.gsk_strategy})
+        ptdf = self.ptdf[cnec, time, :] if self.dynamic else self.ptdf[cnec, :]
+        frame = pd.concat([frame, pd.DataFrame(ptdf, columns=self.zones)], axis=1)
+        return frame
+
+    def to_frame(self, index="cbco"):
+        """Return the FB parameters as DataFrame with a row per (unmasked) CNEC and timestep.
+
+        Rows are ordered by timestep and CNEC.
+
+        Parameters
+        ----------
+        index : str, optional
+            Either *cbco*, the index is *cb_co*, or *position*, the index is the position
+            in the FB parameters without mask, i.e. timestep*number_of_cnecs + cnec.
+
+        Returns
+        -------
+        fb_parameters : pandas.DataFrame
+            Columns cb, co, ram, timestep, gsk_strategy and the zonal ptdf.
+        """
+        time, cnec = np.nonzero(self.mask.T)
+        frame = self._frame(cnec, time)
+        if index == "position":
+            frame.index = time*len(self.cb) + cnec
+        else:
+            frame.index = frame.cb.astype(str) + "_" + frame.co.astype(str)
+        return frame
+
+    def frame(self, timestep):
+        """Return the FB parameters of one timestep as DataFrame, see :meth:`~to_frame`."""
+        t = self.timesteps.index(timestep)
+        cnec = np.flatnonzero(self.mask[:, t])
+        frame = self._frame(cnec, np.full(len(cnec), t))
+        frame.index = frame.cb.astype(str) + "_" + frame.co.astype(str)
+        return frame
+
+    def keep(self, positions):
+        """Mask all CNECs except positions, as returned by :meth:`~to_frame` with index *position*."""
+        mask = np.zeros(self.mask.shape, dtype=bool)
+        time, cnec = np.unravel_index(np.asarray(positions, dtype=int), (len(self.timesteps), len(self.cb)))
+        mask[cnec, time] = True
+        self.mask &= mask
+
+    def to_csv(self, path, **kwargs):
+        """Write the FB parameters, as returned by :meth:`~to_frame`, timestep by timestep to csv."""
+        header = True
+        for timestep in self.timesteps:
+            self.frame(timestep).to_csv(path, mode="w" if header else "a", header=header, **kwargs)
+            header = False
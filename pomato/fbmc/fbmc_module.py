@@ -1,10 +1,15 @@
 import itertools
 import logging
+import types
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
 import pomato
+from pomato.fbmc.fb_parameters import FBParameters
 from pomato.grid import GridModel
 
 class FBMCModule():
@@ -19,6 +24,9 @@ class FBMCModule():
     These are denoted as flow based paramters and represent the main output of this module. 
 
 
+    The intermediate results of :meth:`~create_fb_parameters` are cached as stages in 
+    the *stages* attribute, see :meth:`~create_fb_parameters`. 
+
     Parameters
     ----------
     wdir : pathlib.Path
@@ -43,12 +51,14 @@ class FBMCModule():
         self.data = data
 
         self.grid_model = GridModel(self.wdir, self.grid, self.data, self.data.options)
+        self.stages = {}
 
     def create_dynamic_gsk(self, basecase, timestep):
         """Returns GSK based on the included basecase.
 
         As the dynamic GSK depends on the generation schedule, it needs 
-        the timestep as input arguments
+        the timestep as input arguments. See :meth:`~create_dynamic_gsk_stack` 
+        to obtain the GSK of multiple timesteps at once.
         
         Parameters
         ----------
@@ -63,25 +73,105 @@ class FBMCModule():
             A Zone X Node array that will yield a zonal ptdf when multiplied
             with the nodal ptdf. 
         """
-        
-        gsk = pd.DataFrame(index=self.grid.nodes.index)
+        return self.create_dynamic_gsk_stack(basecase, [timestep])[0]
+
+    def create_dynamic_gsk_weights(self, basecase, timesteps):
+        """Returns the participation of each node in the NEX of its zone for multiple timesteps.
+
+        The generation of conventional plants, i.e. plants that are not of type *ts* or *es*, 
+        is pivoted once into a plant x time array, aggregated to nodes with a sparse 
+        plant-to-node and to zones with a sparse node-to-zone map. Each node participates 
+        proportionally to its generation within its zone, or equally in zones without 
+        generation. 
+
+        Parameters
+        ----------
+        basecase : :class:`~pomato.data.Result`
+            The basecase, that is used for the calculation of the FB paramters.
+        timesteps : list-like
+            Timesteps, for which the GSK is calculated.
+
+        Returns
+        -------
+        weights : np.ndarray
+            Node x Timestep array of GSK values.
+        zone : np.ndarray
+            Position of the zone of each node in the zones index, -1 for nodes without zone. 
+        """
+        nodes, zones = self.grid.nodes.index, self.data.zones.index
         plant_types = self.data.options["plant_types"]
         condition = (~self.data.plants.plant_type.isin(plant_types["ts"])) & \
                     (~self.data.plants.plant_type.isin(plant_types["es"]))
-        
-        gen = basecase.G.copy()
-        gen = gen[(gen.t == timestep)&(gen.p.isin(self.data.plants.index[condition]))]
-        gen.loc[:, "n"] = self.data.plants.loc[gen.p, "node"].values
-        for zone in self.data.zones.index:
-            gsk[zone] = 0
-            nodes_in_zone = self.grid.nodes.index[self.grid.nodes.zone == zone]
-            tmp = gen.loc[gen.n.isin(nodes_in_zone), ["G", "n"]].groupby("n").sum().copy()
-            if tmp.G.sum() > 0:
-                tmp.loc[:, "G"] /= tmp.G.sum()
-                gsk.loc[tmp.index, zone] = tmp.G.values
-            else:
-                 gsk.loc[nodes_in_zone, zone] = 1/len(nodes_in_zone)
-        return gsk.values
+        plants = self.data.plants.index[condition]
+
+        gen = basecase.G[basecase.G.t.isin(timesteps) & basecase.G.p.isin(plants)]
+        plant_codes = pd.Categorical(gen.p, categories=plants).codes
+        time_codes = pd.Categorical(gen.t, categories=timesteps).codes
+        generation = np.zeros((len(plants), len(timesteps)))
+        np.add.at(generation, (plant_codes, time_codes), gen.G.values.astype(float))
+
+        plant_node = nodes.get_indexer(self.data.plants.loc[plants, "node"])
+        node_map = scipy.sparse.csr_matrix((np.ones(np.sum(plant_node >= 0)), 
+                                            (plant_node[plant_node >= 0], np.flatnonzero(plant_node >= 0))),
+                                           shape=(len(nodes), len(plants)))
+        node_generation = node_map @ generation
+
+        zone = zones.get_indexer(self.grid.nodes.zone)
+        zone_map = scipy.sparse.csr_matrix((np.ones(np.sum(zone >= 0)), (zone[zone >= 0], np.flatnonzero(zone >= 0))),
+                                           shape=(len(zones), len(nodes)))
+        zone_generation = zone_map @ node_generation
+        nodes_per_zone = np.asarray(zone_map.sum(axis=1)).reshape(-1)
+
+        weights = np.zeros((len(nodes), len(timesteps)))
+        in_zone = zone >= 0
+        total = zone_generation[zone[in_zone]]
+        # Zones without generation participate with a flat GSK.
+        weights[in_zone] = np.where(total > 0, node_generation[in_zone] / np.where(total > 0, total, 1), 
+                                    1/nodes_per_zone[zone[in_zone], np.newaxis])
+        return weights, zone
+
+    def create_dynamic_gsk_stack(self, basecase, timesteps):
+        """Returns the dynamic GSK of multiple timesteps.
+
+        See :meth:`~create_dynamic_gsk_weights`.
+
+        Parameters
+        ----------
+        basecase : :class:`~pomato.data.Result`
+            The basecase, that is used for the calculation of the FB paramters.
+        timesteps : list-like
+            Timesteps, for which the GSK is calculated.
+
+        Returns
+        -------
+        gsk : np.ndarray
+            A Timestep x Node x Zone array, for each timestep the GSK as returned by 
+            :meth:`~create_dynamic_gsk`. 
+        """
+        weights, zone = self.create_dynamic_gsk_weights(basecase, timesteps)
+        gsk = np.zeros((len(timesteps), len(self.grid.nodes.index), len(self.data.zones.index)))
+        in_zone = np.flatnonzero(zone >= 0)
+        gsk[:, in_zone, zone[in_zone]] = weights[in_zone].T
+        return gsk
+
+    def create_dynamic_zonal_ptdf(self, basecase, timesteps):
+        """Returns the zonal ptdf with dynamic GSK of multiple timesteps.
+
+        The nodal ptdf is multiplied with the GSK weights of the nodes of each zone, 
+        without creating the full GSK stack, see :meth:`~create_dynamic_gsk_weights`.
+
+        Returns
+        -------
+        zonal_ptdf : np.ndarray
+            A Line x Timestep x Zone array.
+        """
+        weights, zone = self.create_dynamic_gsk_weights(basecase, timesteps)
+        zonal_ptdf = np.zeros((len(self.grid.lines), len(timesteps), len(self.data.zones.index)), 
+                              dtype=self.grid.precision)
+        for z in range(len(self.data.zones.index)):
+            nodes_in_zone = np.flatnonzero(zone == z)
+            zonal_ptdf[:, :, z] = np.dot(self.grid.ptdf[:, nodes_in_zone], weights[nodes_in_zone])
+        return zonal_ptdf
         
     def create_gsk(self, option="gmax"):
         """Returns static GSK.
@@ -193,18 +283,19 @@ class FBMCModule():
 
         return all_cbs
 
-    def create_base_fbmc_parameters(self, critical_branches, lodf_sensitivity=10e-2):
-        """Create the nodal ptdf for the FB paramters.
+    def create_fbmc_cbco(self, critical_branches, lodf_sensitivity=10e-2):
+        """Select the CBCOs of the FB parameters.
         
         Which lines are considered critical and their critical outages are independent 
-        from the basecase. Therefore the ptdf for all CBCOs are obtained once and used throughout 
+        from the basecase. Therefore the CBCOs are selected once and used throughout 
         this method.
-        
+
         The process is similar to :meth:`~pomato.grid.GridTopology.create_filtered_n_1_ptdf`, 
         for a list of CBs, that are obtained in :meth:`~return_critical_branches`,
-        outages are selected based on a lodf threshold. The method returns the nodal ptdf Nodes x CBCOs 
-        matrix and a pd.DataFrame with all additional information. 
-        
+        outages are selected based on a lodf threshold. Each CBCO is part of the FB parameters 
+        twice, with positive and negative sign. The rows are ordered as [basecase, -basecase, 
+        (N-1, -N-1) for each line].
+
         Parameters
         ----------
         critical_branches : list-like, 
@@ -217,41 +308,271 @@ class FBMCModule():
         
         Returns
         -------
-        nodal_fbmc_ptdf : numpy.array
-            nodal PTDF for each CBCO
+        cbco : types.SimpleNamespace
+            Line (*cb*) and outage (*co*) positions of each CBCO, where the outage is -1 for the 
+            basecase, and for each row of the FB parameters the CBCO (*rows*) and *sign*.
         fbmc_data : pandas.DataFrame
-            The ptdf, together with all information, like CBCO, capacity, nodes.
+            DataFrame with the cb and co label of each row.
         """
         self.grid.lines["cb"] = False
         self.grid.lines.loc[self.grid.lines.index.isin(critical_branches), "cb"] = True
         select_lines = self.grid.lines.index[(self.grid.lines["cb"])&(self.grid.lines.contingency)]
-        select_outages = {}
-        for line in select_lines:
-            select_outages[line] = list(self.grid.lodf_filter(line, lodf_sensitivity))
-
         index_position = [self.grid.lines.index.get_loc(line) for line in select_lines]
-        base_ptdf = self.grid.ptdf[index_position, :]
-        full_ptdf = [base_ptdf, -base_ptdf]
-        label_lines = list(select_lines)+list(select_lines)
-        label_outages = ["basecase" for line in label_lines]
+        cb, co = self.grid.filtered_n_1_cbco(lodf_sensitivity, index_position)
+
+        number_of_lines = len(index_position)
+        basecase = co < 0
+        line_number = np.full(len(self.grid.lines), -1)
+        line_number[index_position] = np.arange(number_of_lines)
+        line_number = line_number[cb[~basecase]]
+        outages_per_line = np.bincount(line_number, minlength=number_of_lines)
+        first_outage = np.cumsum(outages_per_line) - outages_per_line
+        position, negative_position = np.empty(len(cb), dtype=int), np.empty(len(cb), dtype=int)
+        position[basecase] = np.arange(number_of_lines)
+        negative_position[basecase] = np.arange(number_of_lines) + number_of_lines
+        position[~basecase] = (2*number_of_lines + 2*first_outage[line_number] 
+                               + np.arange(len(line_number)) - first_outage[line_number])
+        negative_position[~basecase] = position[~basecase] + outages_per_line[line_number]
+
+        rows, sign = np.empty(2*len(cb), dtype=int), np.empty(2*len(cb), dtype=int)
+        rows[position], rows[negative_position] = np.arange(len(cb)), np.arange(len(cb))
+        sign[position], sign[negative_position] = 1, -1
+
+        cb_labels, co_labels = self.grid.cbco_labels(cb, co)
+        fbmc_data = pd.DataFrame(columns=list(self.data.zones.index))
+        fbmc_data["cb"] = cb_labels[rows].astype(object)
+        fbmc_data["co"] = co_labels[rows].astype(object)
+        return types.SimpleNamespace(cb=cb, co=co, rows=rows, sign=sign), fbmc_data
 
-        for line in select_lines:
-            outages = select_outages[line]
-            tmp_ptdf = np.vstack([self.grid.create_n_1_ptdf_cbco(line, out) for out in outages])
-            full_ptdf.extend([tmp_ptdf, -1*tmp_ptdf])
-            label_lines.extend([line for i in range(0, 2*len(outages))])
-            label_outages.extend(outages*2)
+    def create_cbco_ptdf(self, cbco, ptdf):
+        """Return the rows of the FB parameters for a matrix with a row per line.
 
-        nodal_fbmc_ptdf = np.concatenate(full_ptdf)
-        nodal_fbmc_ptdf = nodal_fbmc_ptdf.reshape(len(label_lines), len(list(self.grid.nodes.index)))
+        As the contingency ptdf is linear in the ptdf, :math:`PTDF_{cb} + LODF_{cb,co} PTDF_{co}`, 
+        this applies to any matrix with a row per line, e.g. the zonal ptdf, yielding the zonal 
+        CBCO ptdf without the nodal CBCO ptdf, or line flows, yielding the N-1 flows. See 
+        :meth:`~pomato.grid.GridTopology.create_n_1_ptdf_batch`.
 
-        fbmc_data = pd.DataFrame(columns=list(self.data.zones.index))
-        fbmc_data["cb"] = label_lines
-        fbmc_data["co"] = label_outages
+        Parameters
+        ----------
+        cbco : types.SimpleNamespace
+            CBCOs and rows as returned by :meth:`~create_fbmc_cbco`.
+        ptdf : np.ndarray
+            Matrix with a row per line, e.g. nodal ptdf, zonal ptdf or flows.
 
-        return nodal_fbmc_ptdf, fbmc_data
+        Returns
+        -------
+        cbco_ptdf : np.ndarray
+            Matrix with a row for each row of the FB parameters.
+        """
+        ptdf = np.asarray(ptdf, dtype=self.grid.precision)
+        basecase = cbco.co < 0
+        values = np.empty((len(cbco.cb), ptdf.shape[1]), dtype=self.grid.precision)
+        values[basecase] = ptdf[cbco.cb[basecase]]
+        values[~basecase] = self.grid.create_n_1_ptdf_batch(cbco.cb[~basecase], cbco.co[~basecase], ptdf=ptdf)
+        return values[cbco.rows] * cbco.sign[:, np.newaxis].astype(self.grid.precision)
+
+    def create_base_fbmc_parameters(self, critical_branches, lodf_sensitivity=10e-2):
+        """Create the nodal ptdf for the FB paramters.
+        
+        The CBCOs are selected by :meth:`~create_fbmc_cbco`. The method returns the nodal ptdf 
+        Nodes x CBCOs matrix and a pd.DataFrame with all additional information. 
+        
+        The FB parameters themselves are calculated zonal-first, see :meth:`~create_cbco_ptdf`, 
+        the nodal ptdf is not required for them. 
+
+        Parameters
+        ----------
+        critical_branches : list-like, 
+            Lines considered critical network elements, which are considered for the FB parameters.  
+        lodf_sensitivity : float, optional
+            The sensitivity defines the threshold from which outages are
+            considered critical. A outage that can impact the lineflow,
+            relative to its maximum capacity, more than the sensitivity is
+            considered critical.
+        
+        Returns
+        -------
+        nodal_fbmc_ptdf : numpy.array
+            nodal PTDF for each CBCO
+        fbmc_data : pandas.DataFrame
+            The ptdf, together with all information, like CBCO, capacity, nodes.
+        """
+        cbco, fbmc_data = self.create_fbmc_cbco(critical_branches, lodf_sensitivity)
+        return self.create_cbco_ptdf(cbco, self.grid.ptdf), fbmc_data
    
+    def _memoize_stage(self, key, create_stage):
+        """Return the cached result of a stage or create it with create_stage.
+
+        Only the last result of each stage is kept, the stage is identified by the first 
+        element of the key. 
+        """
+        stage = key[0]
+        if stage in self.stages and self.stages[stage][0] == key:
+            self.logger.debug("Using cached %s stage.", stage)
+        else:
+            self.stages[stage] = (key, create_stage())
+        return self.stages[stage][1]
+
+    def basecase_key(self, basecase, timesteps, results=("INJ", "EX")):
+        """Return a key identifying the basecase by its title and a hash of its results in timesteps.
+
+        Parameters
+        ----------
+        basecase : :class:`~pomato.data.Results`
+            Market result used as basecase. 
+        timesteps : list
+            Timesteps of the FB parameters. 
+        results : list-like, optional
+            Results, i.e. variables, of the basecase that are hashed.
+        """
+        key = [basecase.result_attributes["title"]]
+        for result in results:
+            data = getattr(basecase, result)
+            key.append(pd.util.hash_pandas_object(data[data.t.isin(timesteps)], index=False).sum())
+        return tuple(key)
+
+    def create_precalc_fbmc_cbco(self, critical_branches, lodf_sensitivity):
+        """Create the CBCOs, see :meth:`~create_fbmc_cbco`, and filter by the precalculated CBCOs.
+
+        If a precalculated list of CBCOs is used for the grid but not for the FB parameters, 
+        the CBCOs are limited to the ones of the SCOPF grid parameters, 
+        see :meth:`~pomato.grid.GridModel.create_scopf_grid_parameters`. 
+        """
+        self.logger.info("COs are selected from nodal PTDFs with %d%% threshold", lodf_sensitivity*100)
+        cbco, fbmc_data = self.create_fbmc_cbco(critical_branches, lodf_sensitivity)
+
+        if (self.options["grid"]["precalc_filename"]) and (not self.options["fbmc"]["precalc_filename"]):
+            precalc_cbco = self.grid_model.create_scopf_grid_parameters()
+            condition = fbmc_data[["cb", "co"]].apply(tuple, axis=1).isin(precalc_cbco[["cb", "co"]].apply(tuple, axis=1).values).values
+            condition = condition | (fbmc_data.co == "basecase").values
+            cbco.rows, cbco.sign, fbmc_data = cbco.rows[condition], cbco.sign[condition], fbmc_data.loc[condition, :]
+        return cbco, fbmc_data
+
+    def create_reference_flows(self, cbco, basecase, timesteps):
+        """Calculate the basecase flows on each CBCO and the net positions of the basecase.
+
+        Returns
+        -------
+        f_ref_base_case : np.ndarray
+            CBCO x Timestep basecase flows.
+        nex : pandas.DataFrame
+            Timestep x Zone net positions of the basecase.
+        """
+        # Reference flows are calculated per line and then for each CBCO.
+        inj = basecase.INJ[basecase.INJ.t.isin(timesteps)].pivot(index="t", columns="n", values="INJ")
+        inj = inj.loc[timesteps, basecase.data.nodes.index]
+        if self.parallel_timesteps(timesteps):
+            f_ref_base_case = self.create_cbco_ptdf_parallel(cbco, inj.T.values)
+        else:
+            f_ref_base_case = self.create_cbco_ptdf(cbco, np.dot(self.grid.ptdf, inj.T.values.astype(self.grid.precision)))
+        nex = basecase.net_position().loc[timesteps, :]
+        return f_ref_base_case, nex
+
+    def create_zonal_cbco_ptdf(self, cbco, basecase, timesteps, gsk_strategy, nex):
+        """Calculate the zonal ptdf of each CBCO and the flows resulting from the basecase net positions.
+
+        Returns
+        -------
+        zonal_cbco_ptdf : np.ndarray
+            CBCO x Zone zonal ptdf or CBCO x Timestep x Zone for the dynamic GSK.
+        f_da : np.ndarray
+            CBCO x Timestep flows resulting from the net positions in the basecase. 
+        """
+        self.logger.info("Calculating zonal ptdf using %s gsk strategy.", gsk_strategy)
+        zones = len(self.data.zones.index)
+        if gsk_strategy == "dynamic" and self.parallel_timesteps(timesteps):
+            gsk = self.create_dynamic_gsk_stack(basecase, timesteps).transpose(1, 0, 2)
+            zonal_cbco_ptdf = self.create_cbco_ptdf_parallel(cbco, gsk)
+            f_da = np.einsum("ctz,tz->ct", zonal_cbco_ptdf, nex.values.astype(self.grid.precision))
+        elif gsk_strategy == "dynamic":
+            # Zonal ptdf for all timesteps as (lines x timesteps*zones) matrix.
+            zonal_ptdf = self.create_dynamic_zonal_ptdf(basecase, timesteps).reshape(len(self.grid.lines), -1)
+            zonal_cbco_ptdf = self.create_cbco_ptdf(cbco, zonal_ptdf).reshape(-1, len(timesteps), zones)
+            f_da = np.einsum("ctz,tz->ct", zonal_cbco_ptdf, nex.values.astype(self.grid.precision))
+        else:
+            zonal_ptdf = np.dot(self.grid.ptdf, self.create_gsk(gsk_strategy))
+            zonal_cbco_ptdf = self.create_cbco_ptdf(cbco, zonal_ptdf)
+            f_da = np.dot(zonal_cbco_ptdf, nex.values.T)
+        return zonal_cbco_ptdf, f_da
+
+    def parallel_timesteps(self, timesteps):
+        """Return True if the timesteps are processed in chunks by multiple workers.
+
+        This is the case if the option *workers* is larger than one and there is more than one chunk 
+        of *chunk_size* timesteps.
+        """
+        workers = self.options["fbmc"]["workers"]
+        return bool(workers) and workers > 1 and len(timesteps) > self.options["fbmc"]["chunk_size"]
+
+    def create_cbco_ptdf_parallel(self, cbco, x):
+        """Calculate the CBCO ptdf times x over chunks of timesteps in a process pool.
+
+        The nodal ptdf of each CBCO is calculated once, see :meth:`~create_cbco_ptdf`, and 
+        shared with the workers through shared memory. Each worker multiplies it with a 
+        chunk of *chunk_size* timesteps of x, the chunks are merged in timestep order. As the 
+        chunks do not depend on the number of workers, the result is deterministic.
+
+        Parameters
+        ----------
+        cbco : types.SimpleNamespace
+            CBCOs and rows as returned by :meth:`~create_fbmc_cbco`.
+        x : np.ndarray
+            Node x Timestep, e.g. nodal injections, or Node x Timestep x Zone, e.g. the dynamic GSK.
+
+        Returns
+        -------
+        cbco_ptdf : np.ndarray
+            CBCO x Timestep or CBCO x Timestep x Zone array.
+        """
+        if not hasattr(cbco, "ptdf"):
+            # Nodal ptdf of the unique CBCOs, rows and sign are applied on the result.
+            unique_cbco = types.SimpleNamespace(cb=cbco.cb, co=cbco.co, rows=np.arange(len(cbco.cb)),
+                                                sign=np.ones(len(cbco.cb), dtype=int))
+            cbco.ptdf = self.create_cbco_ptdf(unique_cbco, self.grid.ptdf)
+
+        workers, chunk_size = self.options["fbmc"]["workers"], self.options["fbmc"]["chunk_size"]
+        x = np.asarray(x, dtype=self.grid.precision)
+        chunks = [x[:, start:start + chunk_size] for start in range(0, x.shape[1], chunk_size)]
+        self.logger.info("Processing %d timesteps in %d chunks with %d workers.", x.shape[1], len(chunks), workers)
+        
+        memory = shared_memory.SharedMemory(create=True, size=cbco.ptdf.nbytes)
+        try:
+            shared_ptdf = np.ndarray(cbco.ptdf.shape, dtype=cbco.ptdf.dtype, buffer=memory.buf)
+            shared_ptdf[:] = cbco.ptdf
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(_cbco_ptdf_chunk, [(memory.name, cbco.ptdf.shape, cbco.ptdf.dtype, chunk) 
+                                                          for chunk in chunks])
+                values = np.concatenate(list(results), axis=1)
+            del shared_ptdf
+        finally:
+            memory.close()
+            memory.unlink()
+        sign = cbco.sign.reshape((-1,) + (1,)*(values.ndim - 1)).astype(self.grid.precision)
+        return values[cbco.rows] * sign
+
     def create_flowbased_parameters(self, basecase, timesteps=None):
+        """Create Flow-Based Paramters as DataFrame.
+
+        Wrapper around :meth:`~create_fb_parameters` that returns the FB parameters in the 
+        long format, a row per CBCO and timestep. See :meth:`~create_fb_parameters`.
+
+        Parameters
+        ----------
+        basecase : :class:`~pomato.data.Results`
+            Market resultsfrom which the FB paramters are deducted. 
+        timesteps : list, optional
+            Timesteps for which the FB parameters are calculated, defaults to the 
+            model horizon of the basecase. 
+
+        Returns
+        -------
+        fb_parameters : pandas.DataFrame
+            Flow Based Parameters which are a zonal ptdf for each and ram, depending
+            on the reference flows derived from the basecase for each timestep. 
+        """
+        return self.create_fb_parameters(basecase, timesteps).to_frame()
+
+    def create_fb_parameters(self, basecase, timesteps=None):
         """Create Flow-Based Paramters.
 
         Creates the FB Paramters for the supplied basecase. Optional arguments are 
@@ -272,6 +593,11 @@ class FBMCModule():
 
         This either indicates an error in the calculation or the need for relaxation via the 
         minRAM option. 
+
+        The calculation is split into stages: selection of critical branches, CBCOs, 
+        reference flows, zonal ptdf (GSK) and RAM adjustment. The result of each stage 
+        is cached and keyed on its inputs, therefore changing the minRAM or FRM 
+        options only reruns the RAM adjustment. 
         
         Parameters
         ----------
@@ -280,7 +606,7 @@ class FBMCModule():
 
         Returns
         -------
-        fb_parameters : pandas.DataFrame
+        fb_parameters : :class:`~pomato.fbmc.FBParameters`
             Flow Based Parameters which are a zonal ptdf for each and ram, depending
             on the reference flows derived from the basecase for each timestep. 
         """
@@ -298,51 +624,41 @@ class FBMCModule():
         else:
             flowbased_region = self.options["fbmc"]["flowbased_region"]
 
-        self.logger.info("CBs are selected from zone-to-zone PTDFs with %d%% threshold", cne_sensitivity*100)
-        critical_branches = self.return_critical_branches(cne_sensitivity, flowbased_region=flowbased_region)
-        self.logger.info("COs are selected from nodal PTDFs with %d%% threshold", lodf_sensitivity*100)
-        nodal_fbmc_ptdf, fbmc_data = self.create_base_fbmc_parameters(critical_branches, lodf_sensitivity)
+        # Stages are keyed on their inputs, the key of each stage includes the key of the stages it depends on.
+        def create_critical_branches():
+            self.logger.info("CBs are selected from zone-to-zone PTDFs with %d%% threshold", cne_sensitivity*100)
+            return self.return_critical_branches(cne_sensitivity, flowbased_region=flowbased_region)
+        cne_key = ("cne", self.grid.topology_hash, pd.util.hash_pandas_object(self.grid.lines.capacity).sum(),
+                   cne_sensitivity, tuple(flowbased_region), self.options["fbmc"]["only_crossborder"])
+        critical_branches = self._memoize_stage(cne_key, create_critical_branches)
 
+        cbco_key = ("cbco", cne_key, lodf_sensitivity, str(self.options["fbmc"]["precalc_filename"]), 
+                    str(self.options["grid"]["precalc_filename"]))
         if (self.options["grid"]["precalc_filename"]) and (not self.options["fbmc"]["precalc_filename"]):
-            cbco = self.grid_model.create_scopf_grid_parameters()
-            condition = fbmc_data[["cb", "co"]].apply(tuple, axis=1).isin(cbco[["cb", "co"]].apply(tuple, axis=1).values).values
-            nodal_fbmc_ptdf, fbmc_data = nodal_fbmc_ptdf[condition | (fbmc_data.co == "basecase") , :], \
-                                                         fbmc_data.loc[condition | (fbmc_data.co == "basecase") , :]
+            cbco_key += self.grid_model.grid_parameters_key("scopf")
+        cbco, fbmc_data = self._memoize_stage(
+            cbco_key, lambda: self.create_precalc_fbmc_cbco(critical_branches, lodf_sensitivity))
 
-        inj = basecase.INJ[basecase.INJ.t.isin(timesteps)].pivot(index="t", columns="n", values="INJ")
-        inj = inj.loc[timesteps, basecase.data.nodes.index]
-        f_ref_base_case = np.dot(nodal_fbmc_ptdf, inj.T)
+        reference_flow_key = ("reference_flows", cbco_key, tuple(timesteps)) + self.basecase_key(basecase, timesteps)
+        f_ref_base_case, nex = self._memoize_stage(
+            reference_flow_key, lambda: self.create_reference_flows(cbco, basecase, timesteps))
 
-        frm_fav = self.grid.lines.capacity[fbmc_data.cb].values*self.options["fbmc"]["frm"]
-        nex = basecase.net_position().loc[timesteps, :]
-
-        self.logger.info("Calculating zonal ptdf using %s gsk strategy.", gsk_strategy)
+        zonal_ptdf_key = ("zonal_ptdf", reference_flow_key, gsk_strategy)
         if gsk_strategy == "dynamic":
-            zonal_fbmc_ptdf = {timestep: np.dot(nodal_fbmc_ptdf, self.create_dynamic_gsk(basecase, timestep)) for timestep in timesteps}
-            f_da = np.vstack([np.dot(zonal_fbmc_ptdf[timestep], nex.loc[timestep, :]) for timestep in timesteps]).T
-        else:
-            zonal_fbmc_ptdf_tmp = np.dot(nodal_fbmc_ptdf, self.create_gsk(gsk_strategy))
-            zonal_fbmc_ptdf = {timestep: zonal_fbmc_ptdf_tmp for timestep in timesteps}
-            f_da = np.dot(zonal_fbmc_ptdf_tmp, nex.values.T)
+            zonal_ptdf_key += self.basecase_key(basecase, timesteps, ["G"])
+        zonal_cbco_ptdf, f_da = self._memoize_stage(
+            zonal_ptdf_key, lambda: self.create_zonal_cbco_ptdf(cbco, basecase, timesteps, gsk_strategy, nex))
         
+        # RAM adjustment is not cached, it only depends on the previous stages and the FRM/minRAM options.
+        frm_fav = self.grid.lines.capacity[fbmc_data.cb].values*self.options["fbmc"]["frm"]
         f_ref_nonmarket = f_ref_base_case - f_da
         ram = (self.grid.lines.capacity[fbmc_data.cb].values - frm_fav - f_ref_nonmarket.T).T
         minram = (self.grid.lines.capacity[fbmc_data.cb] * self.options["fbmc"]["minram"]).values.reshape(len(f_ref_base_case), 1)
         self.logger.info("Applying minRAM of %d%% on %d CBCOs", self.options["fbmc"]["minram"]*100, (ram < minram).any(axis=1).sum())
-        for j in range(0, ram.shape[0]):
-            ram[j, ram[j, :] < minram[j]] = minram[j]
-
-        domain_data = {}
-        for t, timestep in enumerate(timesteps):
-            fb_parameters = fbmc_data.copy()
-            fb_parameters[list(self.data.zones.index)] = zonal_fbmc_ptdf[timestep]
-            fb_parameters["ram"] = ram[:, t]
-            fb_parameters["timestep"] = timestep
-            fb_parameters["gsk_strategy"] = gsk_strategy
-            fb_parameters = fb_parameters[["cb", "co", "ram", "timestep", "gsk_strategy"] + list(list(self.data.zones.index))]
-            domain_data[timestep] = fb_parameters
-
-        fb_parameters =  pd.concat([domain_data[timestep] for timestep in timesteps], ignore_index=True)
+        ram = np.maximum(ram, minram)
+
+        fb_parameters = FBParameters(fbmc_data.cb.values, fbmc_data.co.values, self.data.zones.index, 
+                                     timesteps, zonal_cbco_ptdf, ram, gsk_strategy)
         
         if self.options["fbmc"]["enforce_ntc_domain"]:
             fb_parameters = self.enforce_ntc_domain(fb_parameters)
@@ -362,23 +678,23 @@ class FBMCModule():
                 cbco_index = list(precalc_cbco.constraints.values)
             else:
                 cbco_index = self.grid_model.clarkson_algorithm(args={"fbmc_domain": True}, 
-                                                            Ab_info=fb_parameters)   
-            fb_parameters = fb_parameters.loc[cbco_index, :]
+                                                                Ab_info=fb_parameters.to_frame(index="position"))   
+            fb_parameters.keep(cbco_index)
             
-        fb_parameters.set_index(fb_parameters.cb + "_" + fb_parameters.co, inplace=True)
         return fb_parameters
 
-    def enforce_ntc_domain(self, fb_parameters):
-        """Remove enforce domain to include NTC values"""
+    def ntc_domain_vertices(self):
+        """Return the vertices of the NTC domain within the flow based region.
 
+        Returns
+        -------
+        points : np.ndarray or None
+            Zone x Vertices array of net positions, None if the NTCs are not in the data 
+            or the NTC domain has too many vertices.
+        """
         if self.data.ntc.empty:
             self.logger.error("NTCs not in data.")
-            return fb_parameters
-
-
-        self.logger.info("Enforcing FB-parameters to include NTC domain.")
-        A = fb_parameters.loc[:, self.data.zones.index].values
-        b = fb_parameters.loc[:, "ram"].values.reshape(len(A), 1)
+            return None
 
         fb_region = self.options["fbmc"]["flowbased_region"]
         zones = list(self.data.zones.index)
@@ -392,7 +708,7 @@ class FBMCModule():
         self.logger.info("Including %s vertices of the NTC domains", vertices_ntc_domain)
         if vertices_ntc_domain > 1e7:
             self.logger.error("Too many dimension to consider (combination(ntc, FB Region).")
-            return fb_parameters
+            return None
 
         points = []
         for exchange in itertools.combinations(ntc.loc[condition_fb_region.values].index, len(fb_region)):
@@ -401,9 +717,45 @@ class FBMCModule():
                 tmp[zones.index(f)] += ntc.loc[(f,t), "ntc"]
                 tmp[zones.index(t)] -= ntc.loc[(f,t), "ntc"]
             points.append(tmp)
-        
-        condition = []
-        for p in points:
-            condition.append(np.dot(A, p).reshape(len(A), 1) <= b)
+        return np.hstack(points) if points else np.zeros((len(zones), 0))
 
-        return fb_parameters.loc[np.hstack(condition).all(axis=1), :]
+    def enforce_ntc_domain(self, fb_parameters):
+        """Remove enforce domain to include NTC values.
+
+        Parameters
+        ----------
+        fb_parameters : :class:`~pomato.fbmc.FBParameters` or pandas.DataFrame
+            FB parameters, for the container the CBCOs that exclude the NTC domain are masked.
+        """
+        points = self.ntc_domain_vertices()
+        if points is None:
+            return fb_parameters
+
+        self.logger.info("Enforcing FB-parameters to include NTC domain.")
+        if isinstance(fb_parameters, FBParameters):
+            if fb_parameters.dynamic:
+                for t in range(len(fb_parameters.timesteps)):
+                    flows = np.dot(fb_parameters.ptdf[:, t, :], points)
+                    fb_parameters.mask[:, t] &= (flows <= fb_parameters.ram[:, [t]]).all(axis=1)
+            else:
+                flows = np.dot(fb_parameters.ptdf, points)
+                for t in range(len(fb_parameters.timesteps)):
+                    fb_parameters.mask[:, t] &= (flows <= fb_parameters.ram[:, [t]]).all(axis=1)
+            return fb_parameters
+
+        A = fb_parameters.loc[:, self.data.zones.index].values
+        b = fb_parameters.loc[:, "ram"].values.reshape(len(A), 1)
+        return fb_parameters.loc[(np.dot(A, points) <= b).all(axis=1), :]
+
+
+def _cbco_ptdf_chunk(args):
+    """Multiply the CBCO ptdf in shared memory with a chunk of timesteps."""
+    name, shape, dtype, chunk = args
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        ptdf = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        result = np.tensordot(ptdf, chunk, axes=1)
+        del ptdf
+    finally:
+        memory.close()
+    return result
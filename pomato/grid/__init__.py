@@ -75,4 +75,5 @@ Flow through Low-Impact and Redundancy Screening <https://arxiv.org/abs/1910.090
 """
 
 from pomato.grid.grid_topology import GridTopology
-from pomato.grid.grid_model import GridModel
\ No newline at end of file
+from pomato.grid.grid_model import GridModel
+from pomato.grid.redundancy_removal import RedundancyRemoval
\ No newline at end of file
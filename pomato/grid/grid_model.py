@@ -1,14 +1,19 @@
 
 import logging
 import datetime as dt
+import hashlib
 import itertools
+import json
+import os
 import numpy as np
 import pandas as pd
 import types
+from collections import OrderedDict
 from pathlib import Path
 
 import pomato
 import pomato.tools as tools
+from pomato.grid.redundancy_removal import RedundancyRemoval
 
 class GridModel():
     """GridRepresentation of POMATO, represents the network in the market model.
@@ -59,7 +64,12 @@ class GridModel():
     julia_instance : :class:`~pomato.tools.JuliaDaemon`
         Julia process that is initialized when used the first time and then kept to be able to
         easily re-run the redundancy algorithm without restarting a julia process.
+    grid_parameters : collections.OrderedDict
+        Nodal and SCOPF grid parameters, identified by :meth:`~grid_parameters_key`, such 
+        that repeated calls and identical market and redispatch grids are only calculated 
+        once. The last *grid_parameters_cache_size* results are kept.
     """
+    grid_parameters_cache_size = 4
 
     def __init__(self, wdir, grid, data, option):
         # Import Logger
@@ -70,6 +80,7 @@ class GridModel():
         self.wdir = wdir
         self.package_dir = Path(pomato.__path__[0])
         self.julia_dir = wdir.joinpath("data_temp/julia_files")
+        self.cache_dir = wdir.joinpath("data_temp/redundancy_removal_cache")
 
         # Core attributes
         self.grid = grid
@@ -85,6 +96,7 @@ class GridModel():
                 ntc=pd.DataFrame()
             )
         self.julia_instance = None
+        self.grid_parameters = OrderedDict()
     
     def _start_julia_daemon(self):
         self.julia_instance = tools.JuliaDaemon(
@@ -113,7 +125,7 @@ class GridModel():
 
         Parameters
         ----------
-        flowbased_parameters : optional, pandas.DataFrame
+        flowbased_parameters : optional, pandas.DataFrame or :class:`~pomato.fbmc.FBParameters`
             Flowbased parameters, derived using :class:`~pomato.fbmc.FBMCModule`
 
         """
@@ -124,7 +136,7 @@ class GridModel():
         self.grid_representation.lines = self.grid.lines.copy()
         self.grid_representation.lines.loc[:, "capacity"] *= self.options["grid"]["long_term_rating_factor"]
 
-        if isinstance(flowbased_parameters, pd.DataFrame):
+        if isinstance(flowbased_parameters, (pd.DataFrame, pomato.fbmc.FBParameters)):
             self.process_flowbased_grid_representation(flowbased_parameters)
         elif self.options["type"] == "ntc":
             self.process_ntc()
@@ -158,7 +170,7 @@ class GridModel():
 
         Parameters
         ----------
-        flowbased_parameters : pandas.DataFrame
+        flowbased_parameters : pandas.DataFrame or :class:`~pomato.fbmc.FBParameters`
             Flowbased parameters, derived using :class:`~pomato.fbmc.FBMCModule`
 
         """
@@ -168,6 +180,57 @@ class GridModel():
         self.grid_representation.contingency_groups = self.grid.contingency_groups
         self.process_ntc()
 
+    def grid_parameters_key(self, representation):
+        """Return a key that identifies the grid parameters of a representation.
+
+        The key consists of the topology hash, the line capacities and the grid options 
+        relevant for the representation. If the redundancy removal includes bounds on the 
+        nodal injections, these are part of the key as well, as is the content of the 
+        precalculated CBCO file for the SCOPF representation. 
+
+        Parameters
+        ----------
+        representation : str
+            Either *nodal* or *scopf*.
+
+        Returns
+        -------
+        key : tuple
+            Hashable key of the grid parameters.
+        """
+        grid_option = self.options["grid"]
+        options = ["redundancy_removal_option", "long_term_rating_factor", "precision", "prescreen"]
+        if representation == "scopf":
+            options += ["redundancy_removal_engine", "precalc_filename", "sensitivity", "n_2_sensitivity", 
+                        "short_term_rating_factor", "preprocess"]
+        key = [representation, self.grid.topology_hash, 
+               pd.util.hash_pandas_object(self.grid.lines.capacity).sum(), self.options["solver"]["name"]]
+        key += [(option, str(grid_option[option])) for option in options]
+        if representation == "scopf" and grid_option["precalc_filename"]:
+            filename = self.julia_dir.joinpath(f"cbco_data/{grid_option['precalc_filename']}.csv")
+            if filename.is_file():
+                key.append(hashlib.sha256(filename.read_bytes()).hexdigest())
+        if grid_option["redundancy_removal_option"] in ["conditional_redundancy_removal", 
+                                                         "nodal_redundancy_removal"]:
+            key.append(hashlib.sha256(self.create_nodal_injection_limits().tobytes()).hexdigest())
+        return tuple(key)
+
+    def _memoize_grid_parameters(self, representation, create_parameters):
+        """Return a copy of the memoized grid parameters or create them with create_parameters.
+
+        Copies are returned, such that callers can modify the grid parameters without changing 
+        the memoized ones. Only the last *grid_parameters_cache_size* results are kept.
+        """
+        key = self.grid_parameters_key(representation)
+        if key not in self.grid_parameters:
+            self.grid_parameters[key] = create_parameters()
+            while len(self.grid_parameters) > self.grid_parameters_cache_size:
+                self.grid_parameters.popitem(last=False)
+        else:
+            self.logger.info("Using previously created %s grid parameters.", representation)
+            self.grid_parameters.move_to_end(key)
+        return self.grid_parameters[key].copy()
+
     def create_nodal_grid_parameters(self):
         """Process grid information for nodal N-0 representation.
 
@@ -175,8 +238,13 @@ class GridModel():
 
         There is the option to try to reduce this ptdf, however the number of
         redundant constraints is expected to be very low.
+
+        The result is memoized, see :meth:`~grid_parameters_key`.
         """
-            
+        return self._memoize_grid_parameters("nodal", self._create_nodal_grid_parameters)
+
+    def _create_nodal_grid_parameters(self):
+        """Create the nodal N-0 grid parameters, see :meth:`~create_nodal_grid_parameters`."""
         grid_option = self.options["grid"]
         nodal_network = pd.DataFrame(columns=self.grid.nodes.index, data=self.grid.ptdf)
         nodal_network["ram"] = self.grid.lines.capacity.values*self.options["grid"]["long_term_rating_factor"]
@@ -227,7 +295,16 @@ class GridModel():
         and "save" saving the relevant files for the RedundancyRemoval
         algorithm so that it can be run separately from the python POMATO.
 
+        The result is memoized, see :meth:`~grid_parameters_key`, such that e.g. a SCOPF redispatch 
+        grid is not recalculated after the SCOPF market grid. With the option *save*, the 
+        files are always written.
         """
+        if self.options["grid"]["redundancy_removal_option"] == "save":
+            return self._create_scopf_grid_parameters()
+        return self._memoize_grid_parameters("scopf", self._create_scopf_grid_parameters)
+
+    def _create_scopf_grid_parameters(self):
+        """Create the SCOPF grid parameters, see :meth:`~create_scopf_grid_parameters`."""
         A, b, cbco_info = self.create_cnec_data(self.options["grid"]["sensitivity"],
                                                 self.options["grid"]["preprocess"])
 
@@ -238,9 +315,9 @@ class GridModel():
                 precalc_cbco = pd.read_csv(self.julia_dir.joinpath(f"cbco_data/{filename}.csv"),
                                            delimiter=',')
                 if len(precalc_cbco.columns) > 1:
-                    condition = cbco_info[["cb", "co"]].apply(tuple, axis=1) \
-                                    .isin(precalc_cbco[["cb", "co"]].apply(tuple, axis=1))
-                    cbco_index = list(cbco_info.reset_index().index[condition])
+                    condition = pd.MultiIndex.from_frame(cbco_info[["cb", "co"]].astype(str)) \
+                                    .isin(pd.MultiIndex.from_frame(precalc_cbco[["cb", "co"]].astype(str)))
+                    cbco_index = list(np.flatnonzero(condition))
                     self.logger.info("Number of CBCOs from pre-calc: %s", str(len(cbco_index)))
                 else:
                     cbco_index = list(precalc_cbco.constraints.values)
@@ -275,9 +352,10 @@ class GridModel():
     def create_cnec_data(self, sensitivity=5e-2, preprocess=False, gsk=None):
         """Create all relevant N-1 PTDFs in the form of Ax<b (PTDF x < ram).
 
-        This uses the method :meth:`~pomato.grid.create_filtered_n_1_ptdf` to
+        This uses the method :meth:`~pomato.grid.GridTopology.iter_filtered_n_1_ptdf` to
         generate a filtered ptdf matrix, including outages with a higher impact
-        of the argument *sensitivity*.
+        of the argument *sensitivity*. The ptdf is processed in chunks, such that 
+        only the (preprocessed, zonal) result is held in memory.
 
         Parameters
         ----------
@@ -304,44 +382,97 @@ class GridModel():
             row corresponds to.
 
         """
-        n_1_ptdf = self.grid.create_filtered_n_1_ptdf(
-            sensitivity=sensitivity, 
-            short_term_rating_factor=self.options["grid"]["short_term_rating_factor"],
-            long_term_rating_factor=self.options["grid"]["long_term_rating_factor"],
-            )
-        # Processing: Rounding, remove duplicates and 0...0 rows
         if preprocess:
             self.logger.info("Preprocessing Ab...")
-            _, idx = np.unique(n_1_ptdf[list(self.grid.nodes.index) + ["ram"]].round(decimals=6).values,
-                               axis=0, return_index=True)
+        A, b, info = [], [], []
+        seen_rows = np.array([], dtype=np.uint64)
+        for cb, co, ram, ptdf in self.iter_cnec_chunks(sensitivity):
+            # Processing: Rounding, remove duplicates and 0...0 rows
+            if preprocess:
+                # Adding zero normalizes -0.0, rows are compared by their hash.
+                rows = np.hstack([ptdf, ram[:, np.newaxis]]).round(decimals=6) + 0.0
+                row_hash = pd.util.hash_pandas_object(pd.DataFrame(rows), index=False).values
+                _, idx = np.unique(row_hash, return_index=True)
+                idx = np.sort(idx[~np.isin(row_hash[idx], seen_rows)])
+                seen_rows = np.union1d(seen_rows, row_hash[idx])
+                cb, co, ram, ptdf = cb[idx], co[idx], ram[idx], ptdf[idx]
+            if isinstance(gsk, np.ndarray):  # replace nodal ptdf by zonal ptdf
+                ptdf = np.dot(ptdf, gsk).astype(self.grid.precision, copy=False)
+            A.append(ptdf)
+            b.append(ram)
+            info.append(np.vstack(self.grid.cbco_labels(cb, co)).T)
+
+        A, b, info = np.vstack(A), np.hstack(b), np.vstack(info)
+        columns = self.data.zones.index if isinstance(gsk, np.ndarray) else self.grid.nodes.index
+        n_1_ptdf = pd.DataFrame(index=np.arange(len(b)), columns=["cb", "co", "ram"])
+        n_1_ptdf["cb"], n_1_ptdf["co"] = info[:, 0], info[:, 1]
+        n_1_ptdf["ram"] = b
+        n_1_ptdf = pd.concat([n_1_ptdf, pd.DataFrame(A, columns=columns)], axis=1)
+        return A, b, n_1_ptdf
 
-            n_1_ptdf = n_1_ptdf.loc[np.sort(idx), :]
+    def iter_cnec_chunks(self, sensitivity=5e-2):
+        """Yield the N-0 and filtered N-1 ptdf in chunks, with the rating factors of the grid options.
 
-        A = n_1_ptdf.loc[:, self.grid.nodes.index].values
-        b = n_1_ptdf["ram"].values
-        
-        if isinstance(gsk, np.ndarray):  # replace nodal ptdf by zonal ptdf
-            A = np.dot(A, gsk)
-            n_1_ptdf = pd.concat((n_1_ptdf.loc[:, ["cb", "co", "ram"]],
-                              pd.DataFrame(columns=self.data.zones.index,
-                                           data=A)), axis=1)
-        return A, b, n_1_ptdf
+        See :meth:`~pomato.grid.GridTopology.iter_filtered_n_1_ptdf`. If the grid option 
+        *n_2_sensitivity* is set, the chunks of the critical outage pairs obtained by 
+        :meth:`~pomato.grid.GridTopology.iter_n_2_ptdf` follow, with a two column *co*.
+        """
+        yield from self.grid.iter_filtered_n_1_ptdf(
+            sensitivity=sensitivity, 
+            short_term_rating_factor=self.options["grid"]["short_term_rating_factor"],
+            long_term_rating_factor=self.options["grid"]["long_term_rating_factor"])
+        if self.options["grid"]["n_2_sensitivity"] is not None:
+            yield from self.grid.iter_n_2_ptdf(
+                sensitivity=self.options["grid"]["n_2_sensitivity"],
+                short_term_rating_factor=self.options["grid"]["short_term_rating_factor"])
 
-    def write_cbco_info(self, folder, suffix, **kwargs):
+    def write_cbco_info(self, folder, suffix, chunks=None, exchange_format=None, **kwargs):
         """Write cbco information to disk to run the redundancy removal algorithm.
 
+        The data is written as text, i.e. *csv*, or in the binary *npy* exchange format, 
+        depending on the grid option *exchange_format*. The binary format stores arrays as 
+        .npy and DataFrames as Arrow IPC (feather) files, which are listed with dtype and shape 
+        in the manifest file *manifest_{suffix}.json*.
+
         Parameters
         ----------
         folder : pathlib.Path
             Save file to the specified folder.
         suffix : str
             A suffix for each file, to make it recognizable.
+        chunks : iterable, optional
+            Chunks of (cb, co, ram, ptdf), e.g. from :meth:`~iter_cnec_chunks`, that are
+            written as A, b and Ab_info one after the other.
+        exchange_format : str, optional
+            Overwrites the grid option *exchange_format*.
         """
+        exchange_format = exchange_format or self.options["grid"]["exchange_format"]
+        if exchange_format not in ["csv", "npy"]:
+            raise AttributeError(f"No valid exchange_format {exchange_format}.")
+        if exchange_format == "npy":
+            self._write_cbco_info_npy(folder, suffix, chunks, **kwargs)
+            return 
+
         self.logger.info("Saving A, b...")
         
         for data in [d for d in ["x_bounds", "I"] if d not in kwargs]:
             kwargs[data] = np.array([])
 
+        if chunks is not None:
+            self.logger.info("Saving A, b chunks to disk...")
+            with open(folder.joinpath(f"A_{suffix}.csv"), "w") as file_a, \
+                 open(folder.joinpath(f"b_{suffix}.csv"), "w") as file_b:
+                header, start = True, 0
+                for cb, co, ram, ptdf in chunks:
+                    np.savetxt(file_a, ptdf, delimiter=",")
+                    np.savetxt(file_b, ram, delimiter=",")
+                    info = pd.DataFrame(index=np.arange(start, start + len(cb)))
+                    info["cb"], info["co"] = self.grid.cbco_labels(cb, co)
+                    info["ram"] = ram
+                    info.to_csv(str(folder.joinpath("Ab_info.csv")), index_label='index', 
+                                mode="w" if header else "a", header=header)
+                    header, start = False, start + len(cb)
+
         for data in kwargs:
             self.logger.info("Saving %s to disk...", data)
             if isinstance(kwargs[data], np.ndarray):
@@ -353,6 +484,64 @@ class GridModel():
 
         self.logger.info("Saved everything to folder: \n %s", str(folder))
 
+    def _write_cbco_info_npy(self, folder, suffix, chunks=None, **kwargs):
+        """Write cbco information in the binary exchange format, see :meth:`~write_cbco_info`."""
+        self.logger.info("Saving A, b in binary format...")
+        manifest = {"format": "npy", "suffix": suffix, "order": "C", "files": {}}
+        for data in [d for d in ["x_bounds", "I"] if d not in kwargs]:
+            kwargs[data] = np.array([])
+
+        if chunks is not None:
+            self.logger.info("Saving A, b chunks to disk...")
+            with tools.NpyWriter(folder.joinpath(f"A_{suffix}.npy")) as file_a, \
+                 tools.NpyWriter(folder.joinpath(f"b_{suffix}.npy")) as file_b, \
+                 tools.ArrowWriter(folder.joinpath("Ab_info.feather")) as file_info:
+                start = 0
+                for cb, co, ram, ptdf in chunks:
+                    file_a.write(ptdf)
+                    file_b.write(ram)
+                    info = pd.DataFrame({"index": np.arange(start, start + len(cb))})
+                    info["cb"], info["co"] = self.grid.cbco_labels(cb, co)
+                    info["ram"] = ram
+                    file_info.write(info)
+                    start += len(cb)
+            for data, file in [("A", file_a), ("b", file_b)]:
+                manifest["files"][data] = {"file": file.path.name, "dtype": file.dtype.str, 
+                                           "shape": list(file.shape)}
+            manifest["files"]["Ab_info"] = {"file": "Ab_info.feather", "format": "arrow"}
+
+        for data in kwargs:
+            self.logger.info("Saving %s to disk...", data)
+            if isinstance(kwargs[data], np.ndarray):
+                array = np.ascontiguousarray(kwargs[data])
+                np.save(folder.joinpath(f"{data}_{suffix}.npy"), array)
+                manifest["files"][data] = {"file": f"{data}_{suffix}.npy", "dtype": array.dtype.str, 
+                                           "shape": list(array.shape)}
+            elif isinstance(kwargs[data], pd.DataFrame):
+                kwargs[data].reset_index().rename(columns={kwargs[data].index.name or "index": "index"}) \
+                    .to_feather(folder.joinpath(f"{data}.feather"))
+                manifest["files"][data] = {"file": f"{data}.feather", "format": "arrow"}
+
+        with open(folder.joinpath(f"manifest_{suffix}.json"), "w") as file:
+            json.dump(manifest, file, indent=2)
+        self.logger.info("Saved everything to folder: \n %s", str(folder))
+
+    def read_cbco_result(self, folder):
+        """Read the essential indices written by the redundancy removal algorithm.
+
+        The newest cbco file in *folder* is read, either binary (.npy) or text (.csv). 
+
+        Returns
+        -------
+        cbco : list
+            List of the essential indices.
+        """
+        file = tools.newest_file_folder(folder, keyword="cbco")
+        self.logger.info("cbco list save for later use to data_output: \n%s", file.name)
+        if file.suffix == ".npy":
+            return np.load(file).reshape(-1).tolist()
+        return list(pd.read_csv(file, delimiter=',').constraints.values)
+
     def create_nodal_injection_limits(self):
         """Create nodal injection limits.
 
@@ -365,7 +554,8 @@ class GridModel():
         depending on the (arbitrary) definition of the incidence matrix,
         only the max(positive bound, abs(negative bound)) is considered.
 
-        TODO Rewrite without for n in nodes loop (takes 7s for the ieee network and 8760t)
+        The bounds are obtained for all nodes at once, by summing capacities with 
+        np.bincount and taking demand/net export extrema with a groupby over the nodes.
 
         Returns
         -------
@@ -374,46 +564,41 @@ class GridModel():
 
         """
         infeasibility_upperbound = self.options["infeasibility"]["electricity"]["bound"]
-        nodal_injection_limits = []
-        demand_el = self.data.demand_el.copy()
-        net_export = self.data.net_export[self.data.net_export.net_export > 0].copy()
-
-        for node in self.data.nodes.index:
-            plant_types = self.options["plant_types"]
-
-            condition_plant_node = self.data.plants.node == node
-
-            condition_storage = condition_plant_node & \
-                                (self.data.plants.plant_type.isin(plant_types["es"]))
-            condition_el_heat = condition_plant_node & \
-                                (self.data.plants.plant_type.isin(plant_types["ph"]))
-
-            max_dc_inj = self.data.dclines.capacity[(self.data.dclines.node_i == node) |
-                                                   (self.data.dclines.node_j == node)].sum()
-            
-            condition_nex = net_export.node == node
-            nex_max = max(0, net_export.loc[condition_nex, "net_export"].max())
-            nex_min = -min(0, net_export.loc[condition_nex, "net_export"].min())
-            
-            condition_demand = demand_el.node == node
-            upper = max(self.data.plants.g_max[condition_plant_node].sum()
-                        - demand_el.loc[condition_demand, "demand_el"].min()
-                        + nex_max
-                        + max_dc_inj
-                        + infeasibility_upperbound
-                        , 0)
-
-            lower = max(demand_el.loc[condition_demand, "demand_el"].max()
-                        + self.data.plants.g_max[condition_storage].sum()
-                        + self.data.plants.g_max[condition_el_heat].sum()
-                        + nex_min
-                        + max_dc_inj
-                        + infeasibility_upperbound, 0)
-
-            nodal_injection_limits.append(max(upper, lower))
-
-        nodal_injection_limits = np.array(nodal_injection_limits).reshape(len(nodal_injection_limits), 1)
-        return nodal_injection_limits
+        plant_types = self.options["plant_types"]
+        nodes = self.data.nodes.index
+        plants, dclines = self.data.plants, self.data.dclines
+
+        def node_sum(node, values):
+            codes = pd.Categorical(np.asarray(node).astype(str), categories=nodes.astype(str)).codes
+            return np.bincount(codes[codes >= 0], weights=np.asarray(values, dtype=float)[codes >= 0], 
+                               minlength=len(nodes))
+
+        def node_extrema(data, column):
+            grouped = data[column].astype(float).groupby(np.asarray(data.node).astype(str)).agg(["min", "max"])
+            return grouped.reindex(nodes.astype(str)).values.T
+
+        g_max = node_sum(plants.node, plants.g_max)
+        g_max_storage = node_sum(plants.node, plants.g_max.where(plants.plant_type.isin(plant_types["es"]), 0))
+        g_max_el_heat = node_sum(plants.node, plants.g_max.where(plants.plant_type.isin(plant_types["ph"]), 0))
+        # DC lines are counted once at each connected node.
+        same_node = np.asarray(dclines.node_i).astype(str) == np.asarray(dclines.node_j).astype(str)
+        max_dc_inj = (node_sum(dclines.node_i, dclines.capacity) 
+                      + node_sum(dclines.node_j, np.where(same_node, 0, dclines.capacity)))
+
+        demand_min, demand_max = node_extrema(self.data.demand_el, "demand_el")
+        net_export = self.data.net_export[self.data.net_export.net_export > 0]
+        net_export_min, net_export_max = node_extrema(net_export, "net_export")
+        # Nodes without net export have no bound, comparisons with nan are False.
+        with np.errstate(invalid="ignore"):
+            nex_max = np.where(net_export_max > 0, net_export_max, 0)
+            nex_min = -np.where(net_export_min < 0, net_export_min, 0)
+
+            upper = g_max - demand_min + nex_max + max_dc_inj + infeasibility_upperbound
+            upper = np.where(upper < 0, 0, upper)
+            lower = demand_max + g_max_storage + g_max_el_heat + nex_min + max_dc_inj + infeasibility_upperbound
+            lower = np.where(lower < 0, 0, lower)
+            nodal_injection_limits = np.where(lower > upper, lower, upper)
+        return nodal_injection_limits.reshape(len(nodes), 1)
 
     def clarkson_algorithm(self, args={"file_suffix": "py"}, **kwargs):
         """Run the redundancy removal algorithm.
@@ -423,13 +608,254 @@ class GridModel():
         algorithm. After (successful) completion the resulting file with the
         non-redundant cbco indices is read and returned.
 
+        If the grid option *redundancy_removal_engine* is *python*, the algorithm is 
+        run in-process with :class:`~pomato.grid.redundancy_removal.RedundancyRemoval`
+        instead, see :meth:`~python_clarkson_algorithm`.
+
+        With the grid option *prescreen*, constraints that are redundant by 
+        :meth:`~prescreen_constraints` are removed beforehand, such that the algorithm 
+        only runs on the remaining constraints.
+
+        With the grid option *cache_redundancy_removal*, the essential set is stored in 
+        ``data_temp/redundancy_removal_cache``, identified by :meth:`~redundancy_removal_hash`, 
+        and returned from there when the same constraints are reduced again.
+        If only b has changed and the grid option *warm_start* is set, the cached essential 
+        set of the previous b is verified by :meth:`~warm_start_clarkson_algorithm`.
+
         Returns
         -------
         cbco : list
             List of the essential indices, i.e. the indices of the non-redundant
             cbco's.
         """
+        if self.options["grid"]["cache_redundancy_removal"]:
+            cache_file = self.cache_dir.joinpath(f"{self.redundancy_removal_hash(args, **kwargs)}.json")
+            if cache_file.is_file():
+                self.logger.info("Using essential cbco's from cache %s", cache_file.stem)
+                with open(cache_file, "r") as file:
+                    return json.load(file)["cbco"]
+            seed_file = self.cache_dir.joinpath(
+                f"seed_{self.redundancy_removal_hash(args, include_b=False, **kwargs)}.json")
+            if self.options["grid"]["warm_start"] and seed_file.is_file():
+                self.logger.info("Warm start from essential cbco's in cache %s", seed_file.stem)
+                if self.options["grid"]["redundancy_removal_engine"] != "python":
+                    self.logger.info("Warm start runs the python redundancy removal instead of the %s engine.", 
+                                     self.options["grid"]["redundancy_removal_engine"])
+                with open(seed_file, "r") as file:
+                    cbco = self.warm_start_clarkson_algorithm(json.load(file)["cbco"], args, **kwargs)
+            else:
+                cbco = self._clarkson_algorithm(args, **kwargs)
+            if cbco is not None:
+                self._cache_cbco(cache_file, cbco)
+                self._cache_cbco(seed_file, cbco)
+            return cbco
+        return self._clarkson_algorithm(args, **kwargs)
+
+    def warm_start_clarkson_algorithm(self, seed, args={"file_suffix": "py"}, **kwargs):
+        """Run the redundancy removal algorithm starting from a previous essential set.
+
+        When only b changes, e.g. by changing the rating factors or the FRM, the essential 
+        set of the previous b is a good starting point. The (prescreened) constraints are 
+        reduced in-process by :class:`~pomato.grid.redundancy_removal.RedundancyRemoval`, 
+        independent of the *redundancy_removal_engine* option, with the *seed* as initial essential set, so that only the LPs to confirm the remaining 
+        constraints as redundant are solved and constraints that became binding are added. 
 
+        Parameters
+        ----------
+        seed : list
+            Essential indices of a previous run on the same A (and x_bounds) or the same FB 
+            parameters index, as returned by :meth:`~clarkson_algorithm`.
+
+        Returns
+        -------
+        cbco : list
+            List of the essential indices, i.e. the indices of the non-redundant
+            cbco's.
+        """
+        t_start = dt.datetime.now()
+        workers = os.cpu_count()
+        if args.get("fbmc_domain", False):
+            fb_parameters = kwargs["Ab_info"]
+            if self.options["grid"]["prescreen"]:
+                fb_parameters = fb_parameters.iloc[self.prescreen_constraints(
+                    fb_parameters.loc[:, self.data.zones.index].values, fb_parameters.ram.values, 
+                    groups=fb_parameters.timestep.values)]
+            cbco = []
+            for timestep, domain in fb_parameters.groupby("timestep", sort=False):
+                essential = RedundancyRemoval(domain.loc[:, self.data.zones.index].values, 
+                                              domain.ram.values).run(
+                                                  workers, seed=np.flatnonzero(domain.index.isin(seed)))
+                cbco.extend(domain.index[essential])
+        else:
+            A, b, x_bounds = kwargs["A"], kwargs["b"], kwargs.get("x_bounds")
+            if self.options["grid"]["prescreen"]:
+                candidates = self.prescreen_constraints(A, b, x_bounds)
+            else:
+                candidates = np.arange(len(b))
+            essential = RedundancyRemoval(A[candidates], b[candidates], x_bounds).run(
+                workers, seed=np.flatnonzero(np.isin(candidates, seed)))
+            cbco = list(candidates[essential])
+        self.logger.info("Total Time: %s", str((dt.datetime.now()-t_start).total_seconds()) + " sec")
+        return cbco
+
+    def _clarkson_algorithm(self, args, **kwargs):
+        """Prescreen and run the redundancy removal algorithm with the chosen engine."""
+        if self.options["grid"]["redundancy_removal_engine"] == "python":
+            run_algorithm = self.python_clarkson_algorithm
+        else:
+            run_algorithm = self.julia_clarkson_algorithm
+
+        if not self.options["grid"]["prescreen"]:
+            return run_algorithm(args, **kwargs)
+
+        if args.get("fbmc_domain", False):
+            # The result are index labels of Ab_info, which are kept by slicing.
+            fb_parameters = kwargs["Ab_info"]
+            candidates = self.prescreen_constraints(fb_parameters.loc[:, self.data.zones.index].values,
+                                                    fb_parameters.ram.values, 
+                                                    groups=fb_parameters.timestep.values)
+            return run_algorithm(args, **{**kwargs, "Ab_info": fb_parameters.iloc[candidates]})
+        
+        candidates = self.prescreen_constraints(kwargs["A"], kwargs["b"], kwargs.get("x_bounds"))
+        cbco = run_algorithm(args, **{**kwargs, "A": kwargs["A"][candidates], "b": kwargs["b"][candidates]})
+        if cbco is None:
+            return None
+        return list(candidates[np.asarray(cbco, dtype=int)])
+
+    def redundancy_removal_hash(self, args, include_b=True, **kwargs):
+        """Return a hash of the redundancy removal problem.
+
+        The hash covers the constraints, i.e. *A*, *b* and *x_bounds* or the zonal ptdf, ram, 
+        timestep and index of *Ab_info* for the fbmc domain, as well as the options that 
+        determine the essential set: redundancy removal option, engine, prescreening and solver. 
+        Without *include_b*, b (ram) is omitted, which identifies the problems that can be warm 
+        started from each other's essential set. 
+
+        Returns
+        -------
+        hash : str
+            Hex digest of the redundancy removal problem.
+        """
+        options = [self.options["grid"][option] for option in 
+                   ["redundancy_removal_option", "redundancy_removal_engine", "prescreen"]]
+        hash_object = hashlib.sha256(json.dumps([options, self.options["solver"]["name"], 
+                                                 bool(args.get("fbmc_domain", False))]).encode())
+        if args.get("fbmc_domain", False):
+            fb_parameters = kwargs["Ab_info"]
+            columns = list(self.data.zones.index) + (["ram", "timestep"] if include_b else ["timestep"])
+            hash_object.update(pd.util.hash_pandas_object(fb_parameters[columns], index=True).values.tobytes())
+        else:
+            constraints = [kwargs["A"], kwargs["b"] if include_b else None, kwargs.get("x_bounds")]
+            for data in constraints:
+                data = np.ascontiguousarray(data if data is not None else [], dtype=float)
+                hash_object.update(str(data.shape).encode())
+                hash_object.update(data.tobytes())
+        return hash_object.hexdigest()
+
+    def _cache_cbco(self, cache_file, cbco):
+        """Save the essential set to the redundancy removal cache."""
+        tmp_file = cache_file.with_name(f"{cache_file.stem}_{os.getpid()}_tmp.json")
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "w") as file:
+                json.dump({"cbco": np.asarray(cbco).tolist()}, file)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            self.logger.debug("Could not save essential cbco's to cache.")
+            tmp_file.unlink(missing_ok=True)
+
+    def prescreen_constraints(self, A, b, x_bounds=None, groups=None, tolerance=1e-6):
+        """Identify redundant constraints of Ax <= b without solving LPs.
+
+        The following vectorized tests are applied:
+
+            - *zero*: Rows of A that are zero with a non-negative b can never bind. 
+            - *bounds*: With the nodal injection limits x_bounds and balanced injections, i.e.
+              :math:`|x| \\leq x_{bounds}, \\sum x = 0`, the maximum of :math:`a x` is 
+              :math:`\\min_c \\sum |a_i - c| x_{bounds, i}`, attained at the x_bounds weighted 
+              median of a. If this maximum does not exceed b, the constraint can never bind. 
+            - *dominance*: Of rows that are positive multiples of each other, only the one with 
+              the smallest normalized b, i.e. :math:`b / \\| a \\|`, can bind. 
+
+        The number of constraints removed by each test is logged. 
+
+        Parameters
+        ----------
+        A : np.ndarray
+            Constraint matrix.
+        b : np.ndarray
+            Right hand side.
+        x_bounds : np.ndarray, optional
+            Absolute bound on each variable, e.g. from :meth:`~create_nodal_injection_limits`. 
+            The *bounds* test is only applied with bounds.
+        groups : np.ndarray, optional
+            Independent groups of constraints, e.g. timesteps of a FB domain, rows are only 
+            compared within the same group.
+        tolerance : float, optional
+            Rows are compared after rounding the normalized rows to this tolerance. 
+
+        Returns
+        -------
+        candidates : np.ndarray
+            Sorted positions of the constraints that could not be shown to be redundant.
+        """
+        A = np.asarray(A)
+        b = np.asarray(b, dtype=float).reshape(-1)
+        redundant = {}
+        norm = np.linalg.norm(A, axis=1)
+        zero = norm <= tolerance
+        redundant["zero"] = zero & (b >= 0)
+
+        redundant["bounds"] = np.zeros(len(b), dtype=bool)
+        if x_bounds is not None and np.size(x_bounds) > 0:
+            x_bounds = np.asarray(x_bounds, dtype=float).reshape(-1)
+            chunk_size = max(1, int(1e7 / max(1, A.shape[1])))
+            for start in range(0, len(b), chunk_size):
+                rows = slice(start, start + chunk_size)
+                order = np.argsort(A[rows], axis=1)
+                sorted_a = np.take_along_axis(A[rows], order, axis=1)
+                weights = np.cumsum(x_bounds[order], axis=1)
+                median = np.argmax(weights >= weights[:, -1:]/2, axis=1)
+                center = sorted_a[np.arange(len(sorted_a)), median]
+                maximum = np.abs(A[rows] - center[:, np.newaxis]) @ x_bounds
+                redundant["bounds"][rows] = maximum <= b[rows]
+        redundant["bounds"] &= ~redundant["zero"]
+
+        candidates = np.flatnonzero(~redundant["zero"] & ~redundant["bounds"])
+        scale = np.where(zero, 1, norm)[candidates]
+        rows = np.round(A[candidates] / scale[:, np.newaxis] / tolerance) + 0.0
+        keys = pd.util.hash_pandas_object(pd.DataFrame(rows), index=False).values
+        if groups is not None:
+            group_codes = pd.factorize(np.asarray(groups))[0][candidates]
+        else:
+            group_codes = np.zeros(len(candidates), dtype=int)
+        # Sort by group, row and normalized b, the first of each (group, row) binds first.
+        order = np.lexsort((candidates, b[candidates] / scale, keys, group_codes))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (keys[order][1:] != keys[order][:-1]) | (group_codes[order][1:] != group_codes[order][:-1])
+        redundant["dominance"] = np.zeros(len(b), dtype=bool)
+        redundant["dominance"][candidates[order[~first]]] = True
+
+        for test, rows in redundant.items():
+            self.logger.info("Prescreening removed %d of %d constraints by the %s test.", 
+                             rows.sum(), len(b), test)
+        candidates = np.sort(candidates[order[first]])
+        self.logger.info("Prescreening keeps %d constraints.", len(candidates))
+        return candidates
+
+    def julia_clarkson_algorithm(self, args={"file_suffix": "py"}, **kwargs):
+        """Run the redundancy removal algorithm with the Julia package RedundancyRemoval.
+
+        Takes the same arguments as :meth:`~clarkson_algorithm`, which are written to disk 
+        and processed by the julia daemon. The daemon file carries the grid option 
+        *exchange_format*, see :meth:`~write_cbco_info`.
+
+        Returns
+        -------
+        cbco : list
+            List of the essential indices, i.e. the indices of the non-redundant
+            cbco's.
+        """
         self.write_cbco_info(self.julia_dir.joinpath("cbco_data"), "py", **kwargs)
 
         if not self.julia_instance:
@@ -443,20 +869,47 @@ class GridModel():
 
         t_start = dt.datetime.now()
         self.logger.info("Start-Time: %s", t_start.strftime("%H:%M:%S"))
-        self.julia_instance.run(args=args)
+        self.julia_instance.run(args={**args, "exchange_format": self.options["grid"]["exchange_format"]})
         t_end = dt.datetime.now()
         self.logger.info("End-Time: %s", t_end.strftime("%H:%M:%S"))
         self.logger.info("Total Time: %s", str((t_end-t_start).total_seconds()) + " sec")
 
         if self.julia_instance.solved:
-            file = tools.newest_file_folder(self.julia_dir.joinpath("cbco_data"), keyword="cbco")
-            self.logger.info("cbco list save for later use to data_output: \n%s", file.stem + ".csv")
-            cbco = list(pd.read_csv(file, delimiter=',').constraints.values)
+            cbco = self.read_cbco_result(self.julia_dir.joinpath("cbco_data"))
         else:
             self.logger.critical("Error in Julia code")
             cbco = None
         return cbco
 
+    def python_clarkson_algorithm(self, args={"file_suffix": "py"}, **kwargs):
+        """Run the redundancy removal algorithm in-process.
+
+        Takes the same arguments as :meth:`~clarkson_algorithm`: *A*, *b* and optionally
+        *x_bounds* or, with the argument *fbmc_domain*, the FB parameters *Ab_info*. In the 
+        latter case, the essential set is obtained for each timestep of the zonal ptdf and 
+        the index of *Ab_info* is returned.
+
+        Returns
+        -------
+        cbco : list
+            List of the essential indices, i.e. the indices of the non-redundant
+            cbco's.
+        """
+        t_start = dt.datetime.now()
+        workers = os.cpu_count()
+        if args.get("fbmc_domain", False):
+            fb_parameters = kwargs["Ab_info"]
+            cbco = []
+            for timestep, domain in fb_parameters.groupby("timestep", sort=False):
+                self.logger.info("Running redundancy removal for timestep %s", timestep)
+                essential = RedundancyRemoval(domain.loc[:, self.data.zones.index].values, 
+                                              domain.ram.values).run(workers)
+                cbco.extend(domain.index[essential])
+        else:
+            cbco = RedundancyRemoval(kwargs["A"], kwargs["b"], kwargs.get("x_bounds")).run(workers)
+        self.logger.info("Total Time: %s", str((dt.datetime.now()-t_start).total_seconds()) + " sec")
+        return cbco
+
     def return_cbco(self, cbco_info, cbco_index):
         """Return only the cbco's of the info attribute DataFrame.
 
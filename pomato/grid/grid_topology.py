@@ -1,10 +1,24 @@
 """Grid Model of POMATO"""
+import hashlib
+import json
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import os
+import shutil
+import threading
 import traceback
+import types
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 import scipy
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
+
+import pomato.tools as tools
 
 class GridTopology():
     """GridTopology of POMATO
@@ -41,18 +55,22 @@ class GridTopology():
         - check if slacks are set.
         - calculate ptdf (and psdf) matrix.
         - check if topology contains radial lines/nodes, remove from contingency.
-        - calculate lodf matrix.
+
+    The psdf and lodf matrices are calculated when first accessed. Methods that only require 
+    some rows use :meth:`~lodf_rows` and :meth:`~psdf_rows`, which calculate blocks of rows 
+    and keep the recently used blocks within the *memory_budget*.
 
 
     Parameters
     ----------
-    nodes : DataFrame
-        Nodes data, initialized as attribute of GridTopology.
-    lines : DataFrame
-        Lines data, initialized as attribute of GridTopology.
+    options : dict, optional
+        The options from POMATO main module. Defaults to :meth:`~pomato.tools.default_options`.
 
     Attributes
     ----------
+    options : dict
+        The options from POMATO main module, the grid options (e.g. *sparse*) are read from 
+        *options["grid"]*.
     nodes : DataFrame
         Nodes table, which .
     lines : DataFrame
@@ -60,41 +78,209 @@ class GridTopology():
     ptdf : np.ndarray
         ptdf (power transfer distribution factor) matrix :math:`(L \\times N)`.
     psdf : np.ndarray
-        psdf (phase shifting distribution factor) matrix :math:`(L \\times L)`.
+        psdf (phase shifting distribution factor) matrix :math:`(L \\times L)`, calculated 
+        when first accessed.
     lodf : np.ndarray
-        N-1 lodf (load outage distribution factor) matrix :math:`(L \\times L)`.
+        N-1 lodf (load outage distribution factor) matrix :math:`(L \\times L)`, calculated 
+        when first accessed.
+    memory_budget : float
+        Memory budget in MB for intermediate arrays and cached row blocks, i.e. the 
+        *memory_budget* grid option.
+    precision : np.dtype
+        Floating point type of the ptdf, psdf, lodf and N-1 ptdf, i.e. the *precision* grid 
+        option. The factorization and solves are always done in double precision.
     contingency_groups : dict
         Dictionary that indicates which group of lines is outate, when a line is considered a 
         contingency.
+    topology_hash : str
+        Hash of the nodes and lines data the parameters are calculated from, see 
+        :meth:`~create_topology_hash`.
+    susceptance_factorization : types.SimpleNamespace
+        Sparse LU factorization of the slack-reduced node susceptance matrix, together with the
+        non-slack node positions and the reduced line susceptance matrix. Obtained once in 
+        :meth:`~factorize_node_susceptance` and reused for all ptdf rows/columns.
+    components : np.ndarray
+        Connected component (island) label of each node, see :meth:`~create_network_components`.
+    outaged_lines : dict
+        Positions of lines taken out of service with :meth:`~outage_lines`, with their angle 
+        sensitivities and contingency flag prior to the outage.
+    suspended_contingencies : set
+        Positions of contingencies that disconnect the network due to topology edits.
+    topology_edits : list
+        Journal of topology edits, that can be undone with :meth:`~rollback`.
     """
     numpy_settings = np.seterr(divide="raise")
-    def __init__(self):
+    _cache_version = 1
+    def __init__(self, options=None):
         self.logger = logging.getLogger('log.pomato.grid.GridTopology')
+        self.options = options if options else tools.default_options()
         self.nodes = None
         self.lines = None
         self.incidence_matrix = None
         self.ptdf = None
+        self._row_cache = OrderedDict()
+        self._row_cache_lock = threading.Lock()
+        self._parameter_version = 0
+        self._cache_folder = None
         self.psdf = None
         self.multiple_slack = False
         self.lodf = None
         self.contingency_groups = None
+        self.susceptance_factorization = None
+        self.topology_hash = None
+        self.components = None
+        self._lodf_impact_index = None
+        self.outaged_lines = {}
+        self.suspended_contingencies = set()
+        self.topology_edits = []
+
+    def calculate_parameters(self, nodes, lines, cache_dir=None):
+        """Calculate the grid parameters from nodes and lines data.
+
+        If a *cache_dir* is supplied (and the grid option *cache_parameters* is set), the 
+        parameters are stored in a sub-folder named by the topology hash 
+        (see :meth:`~create_topology_hash`) and loaded from there, if available, instead of 
+        being recalculated.
 
-    def calculate_parameters(self, nodes, lines):        
-        self.logger.info("Calculating grid parameters!")
+        Parameters
+        ----------
+        nodes : DataFrame
+            Nodes data, initialized as attribute of GridTopology.
+        lines : DataFrame
+            Lines data, initialized as attribute of GridTopology.
+        cache_dir : pathlib.Path, optional
+            Folder containing the cached grid parameters.
+        """
         self.nodes = nodes
         self.lines = lines
+        self.outaged_lines, self.suspended_contingencies, self.topology_edits = {}, set(), []
+        self.topology_hash = self.create_topology_hash()
+        cache_folder = None
+        if cache_dir and self.options["grid"]["cache_parameters"]:
+            cache_folder = Path(cache_dir).joinpath(self.topology_hash)
+            if cache_folder.joinpath("parameters.json").is_file():
+                try:
+                    self.load_parameters(cache_folder)
+                    return
+                except (OSError, ValueError, KeyError):
+                    self.logger.warning("Could not load cached grid parameters, recalculating.")
+
+        self.logger.info("Calculating grid parameters!")
+        self.susceptance_factorization = None
+        self._cache_folder = None
         self.check_slack()
-        self.logger.info("Calculating PTDF and PSDF matrices!")
+        self.logger.info("Calculating PTDF matrix!")
         self.incidence_matrix = self.create_incidence_matrix()
         self.ptdf = self.create_ptdf_matrix()
-        self.psdf = self.create_psdf_matrix()
+        # PSDF and LODF are calculated when accessed.
+        self.psdf = None
         self.multiple_slack = False
         self.check_grid_topology()
-        self.logger.info("Calculating LODF matrix!")
-        self.lodf = self.create_n_1_lodf_matrix()
+        self.lodf = None
         self.logger.info("Calculating contingency groups!")
         self.contingency_groups = self.create_contingency_groups()
         self.logger.info("Grid parameters Calculated!")
+        if cache_folder:
+            self.save_parameters(cache_folder)
+            self._cache_folder = cache_folder
+
+    def create_topology_hash(self):
+        """Return a hash of the nodes and lines data relevant for the grid parameters.
+
+        The hash covers the node index and slack as well as line index, node_i, node_j, 
+        x_pu and contingency and the precision of the parameters. Identical topologies yield 
+        identical hashes across runs.
+
+        Returns
+        -------
+        topology_hash : str
+            Hex digest of the relevant nodes/lines columns.
+        """
+        hash_object = hashlib.sha256(f"{self._cache_version}{self.precision}".encode())
+        for data, columns in [(self.nodes, ["slack"]),
+                              (self.lines, ["node_i", "node_j", "x_pu", "contingency"])]:
+            hash_object.update(
+                pd.util.hash_pandas_object(data[columns].astype(str), index=True).values.tobytes())
+        return hash_object.hexdigest()
+
+    def save_parameters(self, folder):
+        """Save grid parameters to folder.
+
+        The matrices are stored as .npy files, that can be memory-mapped when loaded with 
+        :meth:`~load_parameters`. The folder is written under a temporary name and renamed 
+        when complete, so that parallel processes do not read incomplete data. The psdf and 
+        lodf are only saved if calculated, otherwise they are added to the folder when they 
+        are calculated (see :meth:`~_cache_matrix`).
+
+        Parameters
+        ----------
+        folder : pathlib.Path
+            Folder the parameters are saved to.
+        """
+        if folder.is_dir():
+            return
+        tmp_folder = folder.with_name(f"{folder.name}_{os.getpid()}_tmp")
+        try:
+            tmp_folder.mkdir(parents=True, exist_ok=True)
+            for matrix in ["ptdf", "_psdf", "_lodf"]:
+                if getattr(self, matrix) is not None:
+                    np.save(tmp_folder.joinpath(f"{matrix.strip('_')}.npy"), getattr(self, matrix))
+            with open(tmp_folder.joinpath("parameters.json"), "w") as file:
+                json.dump({"slack": self.nodes.slack.values.astype(bool).tolist(),
+                           "contingency": self.lines.contingency.values.astype(bool).tolist(),
+                           "multiple_slack": self.multiple_slack,
+                           "contingency_groups": self.contingency_groups}, file)
+            tmp_folder.rename(folder)
+            self.logger.info("Saved grid parameters to cache %s", folder.name)
+        except OSError:
+            # Another process has saved the same parameters in the meantime.
+            self.logger.debug("Could not save grid parameters to cache.")
+        finally:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+
+    def _cache_matrix(self, matrix):
+        """Add a matrix that has been calculated after the parameters were saved to the cache."""
+        if self._cache_folder is None or self._cache_folder.joinpath(f"{matrix}.npy").is_file():
+            return
+        tmp_file = self._cache_folder.joinpath(f"{matrix}_{os.getpid()}_tmp.npy")
+        try:
+            np.save(tmp_file, getattr(self, f"_{matrix}"))
+            os.replace(tmp_file, self._cache_folder.joinpath(f"{matrix}.npy"))
+        except OSError:
+            self.logger.debug("Could not save %s to cache.", matrix)
+            tmp_file.unlink(missing_ok=True)
+
+    def load_parameters(self, folder):
+        """Load grid parameters from folder.
+
+        The matrices are memory-mapped copy-on-write, i.e. they are not read into memory 
+        until accessed and changes are not written back to disk. The psdf and lodf are 
+        calculated when accessed, if they are not part of the cache.
+
+        Parameters
+        ----------
+        folder : pathlib.Path
+            Folder containing the grid parameters saved with :meth:`~save_parameters`.
+        """
+        self.logger.info("Loading grid parameters from cache %s", folder.name)
+        with open(folder.joinpath("parameters.json"), "r") as file:
+            parameters = json.load(file)
+        self.nodes.loc[:, "slack"] = parameters["slack"]
+        self.lines.loc[:, "contingency"] = parameters["contingency"]
+        matrices = {matrix: np.load(folder.joinpath(f"{matrix}.npy"), mmap_mode="c")
+                    if folder.joinpath(f"{matrix}.npy").is_file() else None
+                    for matrix in ["ptdf", "psdf", "lodf"]}
+        if matrices["ptdf"] is None:
+            raise OSError("PTDF matrix missing in cache.")
+        self.susceptance_factorization = None
+        self.incidence_matrix = self.create_incidence_matrix()
+        self.components = self.create_network_components()[1]
+        self.ptdf, self.psdf, self.lodf = matrices["ptdf"], matrices["psdf"], matrices["lodf"]
+        self._cache_folder = folder
+        self.multiple_slack = parameters["multiple_slack"]
+        self.contingency_groups = parameters["contingency_groups"]
+        self.add_number_of_systems()
+        self.logger.info("Grid parameters loaded!")
 
     def check_slack(self):
         """Check slack configuration from input data.
@@ -103,8 +289,8 @@ class GridTopology():
         For Each component it is checked if a slack is defined, and if not the first node
         will be set as a slack. Therefore, each subnetwork will be balanced.
         """
-        A = self.create_incidence_matrix()
-        network_components = scipy.sparse.csgraph.connected_components(np.dot(A.T, A))
+        network_components = self.create_network_components()
+        self.components = network_components[1]
         self.logger.info("The network consists of %d components. Setting slack for each.",
                          network_components[0])
         for i in range(0, network_components[0]):
@@ -114,6 +300,19 @@ class GridTopology():
                 self.nodes.loc[self.nodes.index[np.argmax(condition_subnetwork)], "slack"] = True
         self.multiple_slack = bool(len(self.nodes.index[self.nodes.slack]) > 1)
 
+    def create_network_components(self):
+        """Return the connected components of the network.
+
+        Returns
+        -------
+        number_of_components : int
+            Number of connected components.
+        labels : np.ndarray
+            Component label of each node.
+        """
+        A = self.create_incidence_matrix(sparse=True)
+        return scipy.sparse.csgraph.connected_components(A.T @ A, directed=False)
+
     def check_grid_topology(self):
         """Check grid topology for radial nodes and lines.
 
@@ -127,49 +326,104 @@ class GridTopology():
         lodf matrix calculation.
         """
         self.logger.info("Checking GridTopology...")
+        node_i, node_j = self.line_node_positions()
+        radial_nodes = self.node_degrees(node_i, node_j) < 2
+        radial_lines = self.radial_ptdf_rows(np.arange(len(self.lines)))
+        contingency = self.lines.contingency.values.astype(bool)
 
-        radial_nodes = []
-        for node in self.nodes.index:
-            if len(self.lines[(self.lines.node_i == node) | (self.lines.node_j == node)]) < 2:
-                radial_nodes.append(node)
-
-        radial_lines = []
-        for idx, line in enumerate(self.lines.index):
-            tmp = np.abs(self.ptdf[idx, :])
-            tmp = np.around(tmp, decimals=3)
-            if 1 in tmp:
-                radial_lines.append(line)
-
-        condition = (self.lines.node_i.isin(radial_nodes)) | \
-                    (self.lines.node_j.isin(radial_nodes)) & self.lines.contingency
-
-        if not self.lines[condition].empty:
+        condition = radial_nodes[node_i] | (radial_nodes[node_j] & contingency)
+        if condition.any():
             self.lines.loc[condition, "contingency"] = False
-            self.logger.info("Radial nodes: Contingency of %d lines is set to false", 
-                             len(self.lines.index[condition]))
+            self.logger.info("Radial nodes: Contingency of %d lines is set to false", np.sum(condition))
 
-        condition = self.lines.index.isin(radial_lines) & self.lines.contingency
-        if not self.lines.contingency[condition].empty:
+        condition = radial_lines & self.lines.contingency.values.astype(bool)
+        if condition.any():
             self.lines.loc[condition, "contingency"] = False
-            self.logger.info("Radial lines: Contingency of %d lines is set to false", 
-                             len(self.lines.index[condition]))
+            self.logger.info("Radial lines: Contingency of %d lines is set to false", np.sum(condition))
 
         self.logger.info("Total number of lines and contingencies: %d, %d", 
                          len(self.lines.index), len(self.lines[self.lines.contingency]))
 
+    def node_degrees(self, node_i=None, node_j=None):
+        """Return the number of lines connected to each node.
+
+        Parameters
+        ----------
+        node_i, node_j : np.ndarray, optional
+            Node positions of each line, see :meth:`~line_node_positions`.
+
+        Returns
+        -------
+        degree : np.ndarray
+            Number of lines connected to each node, lines that connect a node with
+            itself are counted once.
+        """
+        if node_i is None or node_j is None:
+            node_i, node_j = self.line_node_positions()
+        return (np.bincount(node_i, minlength=len(self.nodes))
+                + np.bincount(node_j[node_j != node_i], minlength=len(self.nodes)))
+
+    def radial_ptdf_rows(self, lines, rows=None):
+        """Return if the (summed) ptdf rows of lines carry the full injection of a node.
+
+        A line is radial if its ptdf row contains a (rounded) absolute value of one, i.e. all 
+        injections of a node flow over the line. The test is evaluated in blocks of lines 
+        to limit the intermediate arrays.
+
+        Parameters
+        ----------
+        lines : np.ndarray
+            Line positions, two dimensional arrays are tested for the sum of the rounded 
+            absolute ptdf rows along the second dimension.
+        rows : int, optional
+            Number of lines tested at once, derived from the *memory_budget* grid option.
+
+        Returns
+        -------
+        radial : np.ndarray
+            Boolean array with the length of *lines*.
+        """
+        lines = np.asarray(lines, dtype=int)
+        if lines.ndim == 1:
+            lines = lines[:, np.newaxis]
+        if not rows:
+            rows = int(max(1, self.memory_budget*1e6 
+                           / (8*max(1, len(self.nodes)*lines.shape[1]))))
+        radial = np.zeros(len(lines), dtype=bool)
+        for start in range(0, len(lines), rows):
+            block = lines[start:start + rows]
+            ptdf = np.around(np.abs(self.ptdf[block[:, 0], :]), decimals=3)
+            for k in range(1, block.shape[1]):
+                ptdf += np.around(np.abs(self.ptdf[block[:, k], :]), decimals=3)
+            radial[start:start + rows] = (ptdf == 1).any(axis=1)
+        return radial
+
+    def parallel_circuits(self):
+        """Group lines that connect the same pair of nodes (node_i, node_j).
+
+        Returns
+        -------
+        group : np.ndarray
+            Group number of each line.
+        systems : np.ndarray
+            Number of lines in the group of each line.
+        no : np.ndarray
+            Running number of each line within its group, in order of the lines.
+        """
+        node_i, node_j = self.line_node_positions()
+        pair = node_i.astype(np.int64)*len(self.nodes) + node_j
+        _, group, counts = np.unique(pair, return_inverse=True, return_counts=True)
+        group = group.reshape(-1)
+        order = np.argsort(group, kind="stable")
+        no = np.empty(len(self.lines), dtype=int)
+        no[order] = np.arange(len(self.lines)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return group, counts[group], no
+
     def add_number_of_systems(self):
         """Add number of systems to lines dataframe, i.e. how many systems a line is part of."""
-
-        tmp = self.lines[["node_i", "node_j"]].copy()
-        tmp.loc[:, "systems"] = 1
-        tmp = tmp.groupby(["node_i", "node_j"], observed=True).sum()
-        tmp = tmp.reset_index()
-        self.lines.loc[:, "systems"] = 1
-        self.lines.loc[:, "no"] = 1
-        for node_i, node_j, systems in zip(tmp.node_i, tmp.node_j, tmp.systems):
-            condition = (self.lines.node_i == node_i)&(self.lines.node_j == node_j)
-            self.lines.loc[condition, "systems"] = systems
-            self.lines.loc[condition, "no"] = np.array([nr for nr in range(0, systems)])
+        _, systems, no = self.parallel_circuits()
+        self.lines.loc[:, "systems"] = systems
+        self.lines.loc[:, "no"] = no
 
     def create_contingency_groups(self, option="double_lines"):
         """Create contingency groups i.e. contingencies that occur together.
@@ -188,22 +442,19 @@ class GridTopology():
         if isinstance(option, (int, float)):
             contingency_groups = {line : [line] for line in self.lines.index}
             for idx, line in enumerate(self.lines.index):
-                contingency_groups[line].extend(list(self.lines.index[np.abs(self.lodf[idx, :]) > option]))
+                contingency_groups[line].extend(list(self.lines.index[np.abs(self.lodf_rows([idx])[0]) > option]))
                 contingency_groups[line] = list(set(contingency_groups[line]))    
 
         if option == "double_lines": # double lines
             if "systems" not in self.lines.columns:
                 self.add_number_of_systems()
-            condition_double_lines = (self.lines.systems == 2)
-            node_pairs = self.lines.loc[condition_double_lines, ["node_i", "node_j"]].apply(tuple, axis=1)
-            for node_pair in node_pairs.unique():
-                condition = (node_pairs == node_pair).values
-                double_line = list(self.lines.loc[condition_double_lines][condition].index)
-                double_line_idx = [self.lines.index.get_loc(line) for line in double_line]
-                # However if the double line is radial, do not consider a combined outage
-                if not any(np.sum(np.around(np.abs(self.ptdf[double_line_idx, :]), decimals=3), axis=0) == 1):
-                    for line in double_line:
-                        contingency_groups[line] = double_line
+            group, _, _ = self.parallel_circuits()
+            double_lines = np.flatnonzero(self.lines.systems.values == 2)
+            double_lines = double_lines[np.argsort(group[double_lines], kind="stable")].reshape(-1, 2)
+            # However if the double line is radial, do not consider a combined outage
+            double_lines = double_lines[~self.radial_ptdf_rows(double_lines)]
+            for line_a, line_b in self.lines.index.values[double_lines]:
+                contingency_groups[line_a] = contingency_groups[line_b] = [line_a, line_b]
 
         return contingency_groups
 
@@ -213,63 +464,177 @@ class GridTopology():
         In other words, if there are multiple disconnected networks, this
         returns the informations which node is balanced through which slack.
 
+        The slack zones are the connected components of the network, see 
+        :meth:`~create_network_components`.
+
         Returns
         -------
             slack_zones : dict(slack, list(node.index))
                 Dictionary containing slack as keys and list of the nodes
                 indices that are balanced though the slack.
         """
-        # Creates Slack zones, given that the given slacks are well suited
-        # Meaning one slack per zone, all zones have a slack.
-        # Method: slack -> find Line -> look at ptdf
-        # all non-zero elements are in slack zone.
-        slacks = self.nodes.index[self.nodes.slack]
+        # Nodes are balanced by the slack(s) of their connected component.
+        if self.components is None:
+            self.components = self.create_network_components()[1]
         slack_zones = {}
-        for slack in slacks:
-            condition = (self.lines.node_i == slack) | (self.lines.node_j == slack)
-            if self.lines.index[condition].empty:
-                slack_zones[slack] = [slack]
-            else:
-                slack_line = self.lines.index[condition][0]
-                line_index = self.lines.index.get_loc(slack_line)
-                pos = self.ptdf[line_index, :] != 0
-                tmp = list(self.nodes.index[pos])
-                tmp.append(slack)
-                slack_zones[slack] = tmp
+        for slack in self.nodes.index[self.nodes.slack]:
+            component = self.components[self.nodes.index.get_loc(slack)]
+            slack_zones[slack] = list(self.nodes.index[self.components == component])
 
         return slack_zones
 
-    def create_incidence_matrix(self):
+    @property
+    def sparse(self):
+        """Bool indicator if the network matrices are represented as scipy.sparse matrices."""
+        return bool(self.options["grid"]["sparse"])
+
+    def line_node_positions(self):
+        """Return the integer positions of *node_i* and *node_j* of each line in the nodes index.
+
+        Returns
+        -------
+        node_i, node_j : np.ndarray
+            Positions of the from/to nodes of each line.
+        """
+        node_i = self.nodes.index.get_indexer(self.lines.node_i)
+        node_j = self.nodes.index.get_indexer(self.lines.node_j)
+        if (node_i < 0).any() or (node_j < 0).any():
+            raise KeyError("Lines are connected to nodes which are not part of the nodes data.")
+        return node_i, node_j
+
+    def create_incidence_matrix(self, sparse=None):
         """Create incidence matrix from *lines* and *nodes* attributes.
 
+        The matrix is constructed vectorized from the integer positions of *node_i*/*node_j* in
+        the nodes index.
+
+        Parameters
+        ----------
+        sparse : bool, optional
+            Return the incidence matrix as scipy.sparse.csr_matrix. Defaults to the *sparse*
+            grid option.
+
         Returns
         -------
-        incidence : np.ndarray
+        incidence : np.ndarray, scipy.sparse.csr_matrix
             Incidence matrix.
         """
-        incidence = np.zeros((len(self.lines), len(self.nodes)))
-        for i, elem in enumerate(self.lines.index):
-            incidence[i, self.nodes.index.get_loc(self.lines.node_i[elem])] = 1
-            incidence[i, self.nodes.index.get_loc(self.lines.node_j[elem])] = -1
+        if sparse is None:
+            sparse = self.sparse
+        node_i, node_j = self.line_node_positions()
+        rows = np.arange(len(self.lines))
+        if sparse:
+            incidence = scipy.sparse.csr_matrix(
+                (np.hstack([np.ones(len(rows)), -np.ones(len(rows))]),
+                 (np.hstack([rows, rows]), np.hstack([node_i, node_j]))),
+                shape=(len(self.lines), len(self.nodes)))
+        else:
+            incidence = np.zeros((len(self.lines), len(self.nodes)))
+            incidence[rows, node_i] = 1
+            incidence[rows, node_j] = -1
         return incidence
 
     def create_susceptance_matrices(self):
         """Create Line (Bl) and Node (Bn) susceptance matrix.
 
+        Depending on the type of the *incidence_matrix* attribute, both matrices are
+        returned as np.ndarray or scipy.sparse.csr_matrix.
+
         Returns
         -------
-        line_susceptance : np.ndarray
+        line_susceptance : np.ndarray, scipy.sparse.csr_matrix
             Line susceptance matrix.
-        node_susceptance : np.ndarray
+        node_susceptance : np.ndarray, scipy.sparse.csr_matrix
             Node susceptance matrix.
         """
-        susceptance_vector = 1/self.lines.x_pu
+        susceptance_vector = self.susceptance_vector()
         incidence = self.incidence_matrix
-        susceptance_diag = np.diag(susceptance_vector)
-        line_susceptance = np.dot(susceptance_diag, incidence)
-        node_susceptance = np.dot(np.dot(incidence.transpose(1, 0), susceptance_diag), incidence)
+        if scipy.sparse.issparse(incidence):
+            susceptance_diag = scipy.sparse.diags(susceptance_vector)
+            line_susceptance = (susceptance_diag @ incidence).tocsr()
+            node_susceptance = (incidence.T @ line_susceptance).tocsr()
+        else:
+            line_susceptance = incidence * susceptance_vector[:, np.newaxis]
+            node_susceptance = np.dot(incidence.T, line_susceptance)
         return line_susceptance, node_susceptance
 
+    def factorize_node_susceptance(self):
+        """Factorize the slack-reduced node susceptance matrix.
+
+        The node susceptance matrix without the slack rows/columns is factorized once with a 
+        sparse LU decomposition. The factorization is used to solve for rows or columns of the 
+        ptdf matrix, instead of explicitly inverting the matrix.
+
+        Returns
+        -------
+        factorization : types.SimpleNamespace
+            Containing the factorization (*lu*), the non-slack node positions (*nodes_wo_slack*) 
+            and the slack-reduced line susceptance matrix (*line_susceptance*).
+        """
+        slack_idx = np.flatnonzero(self.nodes.slack.values.astype(bool))
+        list_wo_slack = np.setdiff1d(np.arange(len(self.nodes.index)), slack_idx)
+        line_susceptance, node_susceptance = self.create_susceptance_matrices()
+        line_susceptance = scipy.sparse.csr_matrix(line_susceptance)[:, list_wo_slack]
+        node_susceptance = scipy.sparse.csc_matrix(node_susceptance)
+        node_susceptance_wo_slack = node_susceptance[list_wo_slack, :][:, list_wo_slack].tocsc()
+        return types.SimpleNamespace(lu=scipy.sparse.linalg.splu(node_susceptance_wo_slack),
+                                     nodes_wo_slack=list_wo_slack,
+                                     line_susceptance=line_susceptance)
+
+    def _factorization(self):
+        if self.susceptance_factorization is None:
+            self.susceptance_factorization = self.factorize_node_susceptance()
+        return self.susceptance_factorization
+
+    def create_ptdf_rows(self, lines):
+        """Create the ptdf rows for a subset of lines.
+
+        Solves Bn * ptdf[lines].T = Bl[lines].T with the factorized node susceptance matrix, 
+        as Bn is symmetric.
+
+        Parameters
+        ----------
+        lines : list(int), np.ndarray
+            Line positions.
+
+        Returns
+        -------
+        ptdf : np.ndarray
+            ptdf rows :math:`(len(lines) \\times N)`.
+        """
+        factorization = self._factorization()
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        rhs = factorization.line_susceptance[lines, :].T.toarray()
+        ptdf = np.zeros((len(lines), len(self.nodes)), dtype=self.precision)
+        if len(lines) > 0:
+            ptdf[:, factorization.nodes_wo_slack] = factorization.lu.solve(rhs).T
+        return ptdf
+
+    def create_ptdf_columns(self, nodes):
+        """Create the ptdf columns for a subset of nodes.
+
+        Solves Bn * X = I[:, nodes] with the factorized node susceptance matrix and returns 
+        Bl * X. Columns of slack nodes are zero.
+
+        Parameters
+        ----------
+        nodes : list(int), np.ndarray
+            Node positions.
+
+        Returns
+        -------
+        ptdf : np.ndarray
+            ptdf columns :math:`(L \\times len(nodes))`.
+        """
+        factorization = self._factorization()
+        nodes = np.asarray(nodes, dtype=int).reshape(-1)
+        position = np.full(len(self.nodes), -1)
+        position[factorization.nodes_wo_slack] = np.arange(len(factorization.nodes_wo_slack))
+        rhs = np.zeros((len(factorization.nodes_wo_slack), len(nodes)))
+        valid = position[nodes] >= 0
+        rhs[position[nodes[valid]], np.flatnonzero(valid)] = 1
+        return np.asarray(factorization.line_susceptance @ factorization.lu.solve(rhs)).astype(self.precision)
+
     def create_ptdf_matrix(self):
         """Create ptdf matrix.
 
@@ -278,23 +643,35 @@ class GridTopology():
         network.
 
         The ptdf matrix is calculated based on the topology and line parameters
-        (i.e. line susceptance).
+        (i.e. line susceptance). The slack-reduced node susceptance matrix is not 
+        inverted, instead it is factorized once (see :meth:`~factorize_node_susceptance`)
+        and the ptdf is obtained by solving for all lines.
+
+        If the network consists of multiple connected components (islands), the ptdf is 
+        block-diagonal. Each block is obtained from the factorization of the island's node 
+        susceptance matrix, which are calculated in parallel.
         """
-        # Find slack
-        slack = list(self.nodes.index[self.nodes.slack])
-        slack_idx = [self.nodes.index.get_loc(s) for s in slack]
-        line_susceptance, node_susceptance = self.create_susceptance_matrices()
+        if self.components is None or len(np.unique(self.components)) < 2:
+            return self.create_ptdf_rows(np.arange(len(self.lines)))
 
-        # Create List without the slack and invert it
-        list_wo_slack = [x for x in range(0, len(self.nodes.index)) if x not in slack_idx]
+        node_i, _ = self.line_node_positions()
+        line_components = self.components[node_i]
+        slack = self.nodes.slack.values.astype(bool)
+        line_susceptance, node_susceptance = self.create_susceptance_matrices()
+        line_susceptance = scipy.sparse.csr_matrix(line_susceptance)
+        node_susceptance = scipy.sparse.csr_matrix(node_susceptance)
+        ptdf = np.zeros((len(self.lines), len(self.nodes)), dtype=self.precision)
+
+        def island_ptdf(component):
+            nodes = np.flatnonzero((self.components == component) & ~slack)
+            lines = np.flatnonzero(line_components == component)
+            if len(nodes) == 0 or len(lines) == 0:
+                return
+            lu = scipy.sparse.linalg.splu(node_susceptance[nodes, :][:, nodes].tocsc())
+            ptdf[np.ix_(lines, nodes)] = lu.solve(line_susceptance[lines, :][:, nodes].T.toarray()).T
 
-        node_susceptance_wo_slack = node_susceptance[np.ix_(list_wo_slack, list_wo_slack)]
-        inv = np.linalg.inv(node_susceptance_wo_slack)
-        # sort slack back in to get nxn
-        node_susceptance_inv = np.zeros((len(self.nodes), len(self.nodes)))
-        node_susceptance_inv[np.ix_(list_wo_slack, list_wo_slack)] = inv
-        # calculate ptdf
-        ptdf = np.dot(line_susceptance, node_susceptance_inv)
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(island_ptdf, np.unique(line_components)))
         return ptdf
 
     def create_psdf_matrix(self):
@@ -305,29 +682,556 @@ class GridTopology():
 
         """
         line_susceptance, _ = self.create_susceptance_matrices()
-        psdf = np.diag(1/self.lines.x_pu) - np.dot(self.ptdf, line_susceptance.T)
+        # ptdf * Bl.T = (Bl * ptdf.T).T, which also works for sparse Bl.
+        psdf = -np.asarray(line_susceptance @ self.ptdf.T).T.astype(self.precision)
+        psdf[np.diag_indices_from(psdf)] += self.susceptance_vector().astype(self.precision)
+        return psdf
+
+    def create_psdf_rows(self, lines):
+        """Create the psdf rows for a subset of lines.
+
+        Parameters
+        ----------
+        lines : list(int), np.ndarray
+            Line positions.
+
+        Returns
+        -------
+        psdf : np.ndarray
+            psdf rows :math:`(len(lines) \\times L)`.
+        """
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        line_susceptance, _ = self.create_susceptance_matrices()
+        psdf = -np.asarray(line_susceptance @ self.ptdf[lines, :].T).T.astype(self.precision)
+        psdf[np.arange(len(lines)), lines] += self.susceptance_vector()[lines].astype(self.precision)
+        return psdf
+
+    def create_psdf_columns(self, lines):
+        """Create the psdf columns for a subset of lines.
+
+        Parameters
+        ----------
+        lines : list(int), np.ndarray
+            Line positions.
+
+        Returns
+        -------
+        psdf : np.ndarray
+            psdf columns :math:`(L \\times len(lines))`.
+        """
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        line_susceptance, _ = self.create_susceptance_matrices()
+        psdf = -np.asarray(line_susceptance[lines, :] @ self.ptdf.T).T.astype(self.precision)
+        psdf[lines, np.arange(len(lines))] += self.susceptance_vector()[lines].astype(self.precision)
         return psdf
 
+    @property
+    def psdf(self):
+        """psdf matrix, calculated with :meth:`~create_psdf_matrix` when first accessed."""
+        if self._psdf is None and self.ptdf is not None:
+            self.logger.info("Calculating PSDF matrix!")
+            self._warn_memory_budget("PSDF")
+            self._psdf = self.create_psdf_matrix()
+            self._cache_matrix("psdf")
+        return self._psdf
+
+    @psdf.setter
+    def psdf(self, psdf):
+        self._psdf = psdf
+        self._clear_row_cache()
+
+    @property
+    def lodf(self):
+        """N-1 lodf matrix, calculated with :meth:`~create_n_1_lodf_matrix` when first accessed."""
+        if self._lodf is None and self.ptdf is not None:
+            self.logger.info("Calculating LODF matrix!")
+            self._warn_memory_budget("LODF")
+            self._lodf = self.create_n_1_lodf_matrix()
+            self._cache_matrix("lodf")
+        return self._lodf
+
+    @lodf.setter
+    def lodf(self, lodf):
+        self._lodf = lodf
+        self._clear_row_cache()
+
+    @property
+    def memory_budget(self):
+        """Memory budget in MB, the *memory_budget* grid option."""
+        return self.options["grid"]["memory_budget"]
+
+    @memory_budget.setter
+    def memory_budget(self, memory_budget):
+        self.options["grid"]["memory_budget"] = memory_budget
+        self._clear_row_cache()
+
+    @property
+    def precision(self):
+        """Floating point type of the grid parameters, the *precision* grid option."""
+        return np.dtype(self.options["grid"]["precision"])
+
+    def _isclose_zero(self, values):
+        """Return values that are zero within the accuracy of the precision."""
+        return np.isclose(values, 0, atol=max(1e-8, 100*np.finfo(self.precision).eps))
+
+    def _warn_memory_budget(self, matrix):
+        size = len(self.lines)**2*self.precision.itemsize/1e6
+        if size > self.memory_budget:
+            self.logger.warning("The %s matrix (%d MB) exceeds the memory budget of %d MB.",
+                                matrix, size, self.memory_budget)
+
+    def _clear_row_cache(self):
+        """Clear the cached row blocks, required when the ptdf changes."""
+        with self._row_cache_lock:
+            self._row_cache.clear()
+            self._parameter_version += 1
+
+    def _row_block_size(self):
+        """Number of rows per cached block, such that at least eight blocks fit into the memory budget."""
+        return int(max(1, min(len(self.lines), 
+                              self.memory_budget*1e6 / (8*self.precision.itemsize*max(1, len(self.lines))))))
+
+    def _evict_row_cache(self, keep=0):
+        """Evict least recently used blocks beyond the memory budget, which includes the lodf impact index.
+
+        The caller has to hold the row cache lock.
+        """
+        budget = self.memory_budget*1e6
+        if self._lodf_impact_index is not None:
+            budget -= self._lodf_impact_index.nbytes
+        while (sum(value.nbytes for value in self._row_cache.values()) > budget
+               and len(self._row_cache) > keep):
+            self._row_cache.popitem(last=False)
+
+    def _matrix_rows(self, matrix, lines, cache):
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        full_matrix = getattr(self, f"_{matrix}")
+        if full_matrix is not None:
+            return np.asarray(full_matrix[lines])
+        create_rows = getattr(self, f"create_{matrix}_rows")
+        if not cache:
+            return create_rows(lines)
+
+        block_size = self._row_block_size()
+        blocks = lines // block_size
+        rows = np.empty((len(lines), len(self.lines)), dtype=self.precision)
+        for block in np.unique(blocks):
+            key = (matrix, block)
+            with self._row_cache_lock:
+                data = self._row_cache.get(key)
+                if data is not None:
+                    self._row_cache.move_to_end(key)
+                version = self._parameter_version
+            if data is None:
+                data = create_rows(np.arange(block*block_size, min(len(self.lines), (block + 1)*block_size)))
+                with self._row_cache_lock:
+                    if version == self._parameter_version:
+                        self._row_cache[key] = data
+                        self._evict_row_cache(keep=1)
+            condition = blocks == block
+            rows[condition] = data[lines[condition] - block*block_size]
+        return rows
+
+    def psdf_rows(self, lines, cache=True):
+        """Return psdf rows, without calculating the full psdf matrix.
+
+        If the psdf matrix has been calculated, the rows are taken from it. Otherwise the 
+        blocks of rows containing *lines* are calculated with :meth:`~create_psdf_rows` and 
+        kept in a least recently used cache within the *memory_budget*.
+
+        Parameters
+        ----------
+        lines : list(int), np.ndarray
+            Line positions.
+        cache : bool, optional
+            Use the cache of row blocks, otherwise only the rows are calculated. 
+
+        Returns
+        -------
+        psdf : np.ndarray
+            psdf rows :math:`(len(lines) \\times L)`.
+        """
+        return self._matrix_rows("psdf", lines, cache)
+
+    def lodf_rows(self, lines, cache=True):
+        """Return N-1 lodf rows, without calculating the full lodf matrix.
+
+        See :meth:`~psdf_rows` and :meth:`~create_lodf_rows`.
+
+        Parameters
+        ----------
+        lines : list(int), np.ndarray
+            Line positions.
+        cache : bool, optional
+            Use the cache of row blocks, otherwise only the rows are calculated. 
+
+        Returns
+        -------
+        lodf : np.ndarray
+            lodf rows :math:`(len(lines) \\times L)`.
+        """
+        return self._matrix_rows("lodf", lines, cache)
+
+    def _lodf_denominators(self):
+        """Return :math:`1 - PTDF_o A_o^T` and whether each line is a valid outage."""
+        node_i, node_j = self.line_node_positions()
+        all_lines = np.arange(len(self.lines))
+        denominator = 1 - (self.ptdf[all_lines, node_i] - self.ptdf[all_lines, node_j])
+        valid = self.lines.contingency.values.astype(bool) & ~self._isclose_zero(denominator)
+        return denominator, valid
+
+    def create_lodf_rows(self, lines):
+        """Create the N-1 lodf rows for a subset of lines.
+
+        The rows equal the rows of :meth:`~create_n_1_lodf_matrix`, without 
+        calculating the full matrix.
+
+        Parameters
+        ----------
+        lines : list(int), np.ndarray
+            Line positions.
+
+        Returns
+        -------
+        lodf : np.ndarray
+            lodf rows :math:`(len(lines) \\times L)`.
+        """
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        node_i, node_j = self.line_node_positions()
+        denominator, valid = self._lodf_denominators()
+        outages = np.flatnonzero(valid)
+        lodf = np.zeros((len(lines), len(self.lines)), dtype=self.precision)
+        ptdf = self.ptdf[lines, :]
+        lodf[:, outages] = (ptdf[:, node_i[outages]] - ptdf[:, node_j[outages]]) / denominator[outages]
+        diagonal = valid[lines]
+        lodf[np.flatnonzero(diagonal), lines[diagonal]] = -1
+        return lodf
+
+    def lodf_elements(self, lines, outages):
+        """Return the N-1 lodf elements of line/outage pairs, without calculating the full lodf matrix.
+
+        Parameters
+        ----------
+        lines, outages : list(int), np.ndarray
+            Line and outage positions of each element.
+
+        Returns
+        -------
+        lodf : np.ndarray
+            :math:`LODF_{lines, outages}`.
+        """
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        outages = np.asarray(outages, dtype=int).reshape(-1)
+        if self._lodf is not None:
+            return np.asarray(self._lodf[lines, outages])
+        node_i, node_j = self.line_node_positions()
+        denominator, valid = self._lodf_denominators()
+        lodf = np.zeros(len(lines), dtype=self.precision)
+        condition = valid[outages]
+        lodf[condition] = ((self.ptdf[lines[condition], node_i[outages[condition]]] 
+                            - self.ptdf[lines[condition], node_j[outages[condition]]]) 
+                           / denominator[outages[condition]])
+        lodf[condition & (lines == outages)] = -1
+        return lodf
+
+    def susceptance_vector(self):
+        """Return the susceptance of each line, which is zero for lines that are out of service."""
+        susceptance = (1/self.lines.x_pu).values.astype(float)
+        if self.outaged_lines:
+            susceptance[list(self.outaged_lines)] = 0
+        return susceptance
+
+    def _line_positions(self, lines):
+        """Return integer positions of lines given by index or position."""
+        return np.array([line if isinstance(line, (int, np.integer)) else self.lines.index.get_loc(line)
+                         for line in lines], dtype=int)
+
+    def _column_blocks(self, number_of_columns):
+        """Yield column slices, such that a LxB float64 array stays within the memory budget."""
+        block_size = int(max(1, self.memory_budget*1e6 / (8*max(1, len(self.lines)))))
+        for start in range(0, number_of_columns, block_size):
+            yield slice(start, min(number_of_columns, start + block_size))
+
+    def _angle_sensitivities(self, lines):
+        """Return the angle difference sensitivities (ptdf/b) for lines, including outaged lines."""
+        susceptance = self.susceptance_vector()
+        angles = np.empty((len(lines), len(self.nodes)))
+        for k, line in enumerate(lines):
+            if line in self.outaged_lines:
+                angles[k, :] = self.outaged_lines[line]["angles"]
+            else:
+                angles[k, :] = self.ptdf[line, :] / susceptance[line]
+        return angles
+
+    def _update_parameters(self, update_u, update_c, lines, ptdf_rows, contingency,
+                           suspended_contingencies):
+        """Apply the low rank update PTDF - U*C to ptdf, psdf and lodf in place.
+
+        The rows *lines* of the ptdf are replaced by *ptdf_rows*, as their susceptance might 
+        have changed. The susceptance of all lines is expected to be already updated. With 
+        :math:`PA = PTDF A^T`, the update implies :math:`PA' = PA - U G` with :math:`G = C A^T`, 
+        which allows to update the psdf and the lodf column-wise without recalculation.
+
+        Parameters
+        ----------
+        update_u : np.ndarray
+            Update factor :math:`(L \\times k)`.
+        update_c : np.ndarray
+            Update factor :math:`(k \\times N)`.
+        lines : np.ndarray
+            Positions of the lines whose susceptance changed.
+        ptdf_rows : np.ndarray
+            New ptdf rows of *lines*.
+        contingency : np.ndarray
+            Contingency flag of each line after the update.
+        suspended_contingencies : set
+            Contingencies that were suspended, as their outage disconnected the network.
+        """
+        node_i, node_j = self.line_node_positions()
+        all_lines = np.arange(len(self.lines))
+        susceptance = self.susceptance_vector()
+        denominator_old = 1 - (self.ptdf[all_lines, node_i] - self.ptdf[all_lines, node_j])
+        old_valid = self.lines.contingency.values.astype(bool) & ~self._isclose_zero(denominator_old)
+
+        # PTDF in row blocks to limit the size of the intermediate array.
+        row_blocks = int(max(1, self.memory_budget*1e6 / (8*max(1, len(self.nodes)))))
+        for start in range(0, len(self.lines), row_blocks):
+            rows = slice(start, start + row_blocks)
+            self.ptdf[rows, :] -= update_u[rows, :] @ update_c
+        self.ptdf[lines, :] = ptdf_rows
+
+        # Contingencies whose outage disconnects the network are suspended until they 
+        # are connected by a later edit.
+        denominator_new = 1 - (self.ptdf[all_lines, node_i] - self.ptdf[all_lines, node_j])
+        contingency = contingency.copy()
+        contingency[list(suspended_contingencies)] = True
+        disconnecting = contingency & self._isclose_zero(denominator_new)
+        if disconnecting.any():
+            self.logger.info("Contingency of %d lines is set to false, as their outage disconnects the network.",
+                             np.sum(disconnecting))
+        contingency = contingency & ~disconnecting
+        self.suspended_contingencies = set(np.flatnonzero(disconnecting).tolist())
+        self.lines.loc[:, "contingency"] = contingency
+
+        update_g = update_c[:, node_i] - update_c[:, node_j]
+        ptdf_lines_a = self.ptdf[lines][:, node_i] - self.ptdf[lines][:, node_j]
+        ptdf_a_lines = self.ptdf[:, node_i[lines]] - self.ptdf[:, node_j[lines]]
+        identity_lines = (all_lines[:, np.newaxis] == lines).astype(float)
+
+        # Row blocks are recalculated from the updated ptdf, psdf and lodf only need to be 
+        # updated if they have been calculated.
+        self._clear_row_cache()
+
+        # PSDF = (I - PA) diag(b)
+        if self._psdf is not None:
+            for columns in self._column_blocks(len(self.lines)):
+                self._psdf[:, columns] += (update_u @ update_g[:, columns]) * susceptance[columns]
+            self._psdf[lines, :] = (identity_lines.T - ptdf_lines_a) * susceptance
+            self._psdf[:, lines] = (identity_lines - ptdf_a_lines) * susceptance[lines]
+
+        if self._lodf is None:
+            return
+        # LODF[:, o] = PA[:, o] / (1 - PA[o, o])
+        update_columns = np.flatnonzero(old_valid & contingency)
+        for block in self._column_blocks(len(update_columns)):
+            columns = update_columns[block]
+            self._lodf[:, columns] = (self._lodf[:, columns] * denominator_old[columns]
+                                      - update_u @ update_g[:, columns]) / denominator_new[columns]
+        new_columns = np.flatnonzero(~old_valid & contingency)
+        if len(new_columns) > 0:
+            self._lodf[:, new_columns] = ((self.ptdf[:, node_i[new_columns]] - self.ptdf[:, node_j[new_columns]])
+                                          / denominator_new[new_columns])
+        self._lodf[:, ~contingency] = 0
+        self._lodf[np.ix_(lines, np.flatnonzero(contingency))] = \
+            ptdf_lines_a[:, contingency] / denominator_new[contingency]
+        self._lodf[np.flatnonzero(contingency), np.flatnonzero(contingency)] = -1
+
+    def _change_susceptance(self, lines, description, outage=None, reactance=None):
+        """Change the susceptance of lines and update the grid parameters.
+
+        The change of the susceptance :math:`\\Delta b` of lines E is a rank-k modification of 
+        the node susceptance matrix. With the angle sensitivities :math:`D_E = A_E B_n^{-1}`, 
+        Sherman-Morrison-Woodbury yields :math:`PTDF' = PTDF - PTDF A_E^T K^{-1} D_E` with 
+        :math:`K = diag(1/\\Delta b) + D_E A_E^T`.
+
+        Parameters
+        ----------
+        lines : np.ndarray
+            Positions of the lines.
+        description : str
+            Description of the edit, used to update the topology hash.
+        outage : bool, optional
+            Take lines out of service (True) or return them to service (False).
+        reactance : np.ndarray, optional
+            New reactance (x_pu) of the lines.
+        """
+        node_i, node_j = self.line_node_positions()
+        journal = {"lines": lines, "ptdf_rows": self.ptdf[lines, :].copy(),
+                   "x_pu": self.lines.x_pu.values[lines].copy(),
+                   "outaged_lines": {line: dict(entry) for line, entry in self.outaged_lines.items()},
+                   "contingency": self.lines.contingency.values.astype(bool).copy(),
+                   "suspended_contingencies": set(self.suspended_contingencies),
+                   "topology_hash": self.topology_hash}
+
+        susceptance_old = self.susceptance_vector()[lines]
+        angles = self._angle_sensitivities(lines)
+        x_pu = self.lines.x_pu.values.copy()
+        if reactance is not None:
+            x_pu[lines] = reactance
+        if outage is None:
+            outaged = np.array([line in self.outaged_lines for line in lines])
+            susceptance_new = np.where(outaged, 0, 1/x_pu[lines])
+        else:
+            susceptance_new = np.zeros(len(lines)) if outage else 1/x_pu[lines]
+
+        delta = susceptance_new - susceptance_old
+        angles_a = angles[:, node_i[lines]] - angles[:, node_j[lines]]
+        kernel = np.eye(len(lines)) + delta[:, np.newaxis] * angles_a
+        if self._isclose_zero(np.linalg.det(kernel)):
+            raise ValueError("The topology edit disconnects the network.")
+        update_c = np.linalg.solve(kernel, delta[:, np.newaxis] * angles)
+        update_u = self.ptdf[:, node_i[lines]] - self.ptdf[:, node_j[lines]]
+        angles_new = angles - angles_a @ update_c
+
+        for entry in self.outaged_lines.values():
+            entry["angles"] = entry["angles"] - (entry["angles"][node_i[lines]]
+                                                 - entry["angles"][node_j[lines]]) @ update_c
+        contingency = journal["contingency"].copy()
+        if outage:
+            for k, line in enumerate(lines):
+                self.outaged_lines[line] = {"angles": angles_new[k],
+                                            "contingency": contingency[line] or line in self.suspended_contingencies}
+                self.suspended_contingencies.discard(line)
+            contingency[lines] = False
+        elif outage is not None:
+            for line in lines:
+                contingency[line] = self.outaged_lines.pop(line)["contingency"]
+        self.lines.loc[:, "x_pu"] = x_pu
+
+        journal.update({"update_u": update_u, "update_c": update_c})
+        self._update_parameters(update_u, update_c, lines, susceptance_new[:, np.newaxis] * angles_new,
+                                contingency, self.suspended_contingencies)
+        self._record_edit(journal, description)
+
+    def _record_edit(self, journal, description):
+        self.topology_edits.append(journal)
+        self.susceptance_factorization = None
+        self._cache_folder = None
+        self.topology_hash = hashlib.sha256(
+            (self.topology_hash + description).encode()).hexdigest()
+
+    def outage_lines(self, lines):
+        """Take lines out of service.
+
+        The ptdf, psdf and lodf are updated in place by a low rank update, see 
+        :meth:`~_change_susceptance`. Outaged lines have zero flow and are no contingency. 
+
+        Parameters
+        ----------
+        lines : list(int), list(string)
+            Lines that are taken out of service.
+
+        Raises
+        ------
+        ValueError
+            Lines are already out of service or the outage disconnects the network.
+        """
+        lines = self._line_positions(lines)
+        if any(line in self.outaged_lines for line in lines):
+            raise ValueError("Lines are already out of service.")
+        self._change_susceptance(lines, f"outage {self.lines.index[lines].tolist()}", outage=True)
+
+    def restore_lines(self, lines):
+        """Return lines into service, that were taken out of service with :meth:`~outage_lines`.
+
+        Parameters
+        ----------
+        lines : list(int), list(string)
+            Lines that are returned into service.
+
+        Raises
+        ------
+        ValueError
+            Lines are not out of service.
+        """
+        lines = self._line_positions(lines)
+        if not all(line in self.outaged_lines for line in lines):
+            raise ValueError("Lines are not out of service.")
+        self._change_susceptance(lines, f"restore {self.lines.index[lines].tolist()}", outage=False)
+
+    def change_reactance(self, reactance):
+        """Change the reactance (x_pu) of lines.
+
+        Parameters
+        ----------
+        reactance : dict
+            dict with line as key, new reactance x_pu as value.
+        """
+        lines = self._line_positions(list(reactance))
+        values = np.array(list(reactance.values()), dtype=float)
+        self._change_susceptance(lines, f"reactance {dict(zip(self.lines.index[lines], values))}",
+                                 reactance=values)
+
     def shift_phase_on_line(self, phase_shift):
         """Shifts the phase on line l by angle a (in rad).
 
-        Recalculates the ptdf matrix. This is a static representation of a
-        phase shift rather than a dynamic (and useful one).
+        Updates the ptdf matrix. This is a static representation of a
+        phase shift rather than a dynamic (and useful one). The change of the ptdf 
+        :math:`PSDF_S diag(shift) PTDF_S` is of low rank, therefore psdf and lodf 
+        are updated in place.
 
         Parameters
         ----------
         phase_shift : dict
             dict with line as key, phase shift [rad] as value.
         """
-        shift = np.zeros(len(self.lines))
-        for line in phase_shift:
-            shift[self.lines.index.get_loc(line)] = phase_shift[line]
-        # recalculate ptdf and lodf
-        shift_matrix = np.multiply(self.psdf, shift)
-        self.ptdf += np.dot(shift_matrix, self.ptdf)
-        self.lodf = self.create_n_1_lodf_matrix()
+        lines = self._line_positions(list(phase_shift))
+        shift = np.array(list(phase_shift.values()), dtype=float)
+        node_i, node_j = self.line_node_positions()
+        journal = {"lines": np.array([], dtype=int), "ptdf_rows": np.empty((0, len(self.nodes))),
+                   "x_pu": np.array([]),
+                   "outaged_lines": {line: dict(entry) for line, entry in self.outaged_lines.items()},
+                   "contingency": self.lines.contingency.values.astype(bool).copy(),
+                   "suspended_contingencies": set(self.suspended_contingencies),
+                   "topology_hash": self.topology_hash}
+        if self._psdf is not None:
+            update_u = -self._psdf[:, lines] * shift
+        else:
+            update_u = -self.create_psdf_columns(lines) * shift
+        update_c = self.ptdf[lines, :].copy()
+        angle_shift = self.susceptance_vector()[lines] * shift
+        for entry in self.outaged_lines.values():
+            entry["angles"] = entry["angles"] + ((entry["angles"][node_i[lines]] - entry["angles"][node_j[lines]])
+                                                 * angle_shift) @ update_c
+
+        journal.update({"update_u": update_u, "update_c": update_c})
+        self._update_parameters(update_u, update_c, journal["lines"], journal["ptdf_rows"],
+                                journal["contingency"], self.suspended_contingencies)
+        self._record_edit(journal, f"phase shift {dict(zip(self.lines.index[lines], shift))}")
+
+    def rollback(self, steps=1):
+        """Undo the last topology edits.
 
-    def create_n_1_lodf_matrix(self):
+        Edits are :meth:`~outage_lines`, :meth:`~restore_lines`, :meth:`~change_reactance`
+        and :meth:`~shift_phase_on_line`. Each edit is reverted by applying its stored low 
+        rank update in reverse, without recalculating the grid parameters.
+
+        Parameters
+        ----------
+        steps : int, optional
+            Number of edits to undo, defaults to 1.
+        """
+        for _ in range(min(steps, len(self.topology_edits))):
+            journal = self.topology_edits.pop()
+            lines = journal["lines"]
+            self.lines.loc[self.lines.index[lines], "x_pu"] = journal["x_pu"]
+            self.outaged_lines = journal["outaged_lines"]
+            self._update_parameters(journal["update_u"], -journal["update_c"], lines, journal["ptdf_rows"],
+                                    journal["contingency"], journal["suspended_contingencies"])
+            self.topology_hash = journal["topology_hash"]
+            self.susceptance_factorization = None
+
+    def create_n_1_lodf_matrix(self, memory_budget=None, out=None):
         """Create N-1 LODF matrix.
 
         The lodf matrix represents a line to line sensitivity in the case of
@@ -339,18 +1243,72 @@ class GridTopology():
         This LODF matrix therefore represents the N-1 case, as only one outage 
         is considered per case. Multiple contingencies have to be explicitly calculated 
         with the more general :meth:`~create_lodf` method.
-        """
-        # lodf = np.hstack([self.create_lodf([line for line in range(0, len(self.lines))], 
-        #                                    [outage]) for outage in range(0, len(self.lines))])   
-        # return lodf
-        
-        lines = [line for line in range(0, len(self.lines))]
-        lodf = np.empty((len(self.lines), len(self.lines)))
-        def f(i):
-            lodf[:, i] = self.create_lodf(lines, [i]).reshape(1, len(lines))
-        with ThreadPoolExecutor() as executor:
-            executor.map(f, range(len(lines)))
 
+        For single outages the lodf has the closed form 
+        :math:`LODF[:, o] = PTDF A_o^T / (1 - PTDF_o A_o^T)`, where :math:`PTDF A^T` 
+        is the difference of the ptdf columns of the from and to nodes of each line. 
+        Columns of lines that are no contingency remain zero and the diagonal of 
+        contingencies is -1. The matrix is computed in column blocks, such that the 
+        intermediate arrays stay within the *memory_budget*. As outages only affect lines 
+        of the same connected component, the islands are calculated separately in parallel.
+
+        Parameters
+        ----------
+        memory_budget : float, optional
+            Memory budget in MB for intermediate arrays, defaults to the *memory_budget* 
+            grid option. If the full LxL matrix fits, it is computed in a single block.
+        out : np.ndarray, optional
+            LxL array (e.g. a np.memmap) the lodf is written into.
+
+        Returns
+        -------
+        lodf : np.ndarray
+            N-1 lodf matrix :math:`(L \\times L)`.
+        """
+        if not memory_budget:
+            memory_budget = self.memory_budget
+        number_of_lines = len(self.lines)
+        node_i, node_j = self.line_node_positions()
+        contingency = self.lines.contingency.values.astype(bool)
+        lodf = out if out is not None else np.empty((number_of_lines, number_of_lines), dtype=self.precision)
+        lodf[:, :] = 0
+        if self.components is None:
+            line_components = np.zeros(number_of_lines, dtype=int)
+        else:
+            line_components = self.components[node_i]
+
+        def island_lodf(component):
+            # Outages only affect lines of the same island.
+            lines = np.flatnonzero(line_components == component)
+            # Two LxB float64 arrays are used per block of B outages.
+            block_size = int(max(1, min(len(lines), memory_budget*1e6 / (2*8*len(lines)))))
+            if block_size < len(lines):
+                self.logger.info("Calculating LODF in blocks of %d outages.", block_size)
+            for start in range(0, len(lines), block_size):
+                block = np.arange(start, min(len(lines), start + block_size))
+                block = block[contingency[lines[block]]]
+                if len(block) == 0:
+                    continue
+                outages = lines[block]
+                ptdf_outages = (self.ptdf[np.ix_(lines, node_i[outages])] 
+                                - self.ptdf[np.ix_(lines, node_j[outages])])
+                denominator = 1 - ptdf_outages[block, np.arange(len(block))]
+                disconnecting = self._isclose_zero(denominator)
+                if disconnecting.any():
+                    # Outages that disconnect the network are invalid contingencies and remain zero.
+                    self.logger.warning("Outage of lines %s disconnects the network, check slacks and radial lines/nodes.",
+                                        ", ".join(self.lines.index[outages[disconnecting]]))
+                    outages, ptdf_outages = outages[~disconnecting], ptdf_outages[:, ~disconnecting]
+                    denominator = denominator[~disconnecting]
+                lodf[np.ix_(lines, outages)] = ptdf_outages / denominator
+                lodf[outages, outages] = -1
+
+        components = np.unique(line_components)
+        if len(components) == 1:
+            island_lodf(components[0])
+        else:
+            with ThreadPoolExecutor() as executor:
+                list(executor.map(island_lodf, components))
         return lodf
 
     def create_lodf(self, lines, outages):
@@ -410,9 +1368,12 @@ class GridTopology():
             valid_lines = [line not in outages for line in lines]
             lines = [line for line in lines if not line in outages]
         
-            lodf[valid_lines, :] = np.dot(ptdf[lines, :] @ A[outages, :].reshape(len(outages), N).T,
-                                            np.linalg.inv(np.eye(len(outages)) - (ptdf[outages, :] 
-                                                        @ A[outages,:].reshape(len(outages), N).T)))
+            # ptdf * A_o.T = (A_o * ptdf.T).T, which also works for a sparse incidence matrix.
+            A_outages = A[outages, :]
+            ptdf_lines_outages = np.asarray(A_outages @ ptdf[lines, :].T).T
+            ptdf_outages_outages = np.asarray(A_outages @ ptdf[outages, :].T).T
+            lodf[valid_lines, :] = np.dot(ptdf_lines_outages,
+                                          np.linalg.inv(np.eye(len(outages)) - ptdf_outages_outages))
         return lodf
 
 
@@ -445,16 +1406,124 @@ class GridTopology():
             list of outages that have a significant (sensitivity) impact
             on line in case of the worst outage.
         """
-        if not isinstance(line, int):
+        if not isinstance(line, (int, np.integer)):
             line = self.lines.index.get_loc(line)
 
-        condition = abs(np.multiply(self.lodf[line], self.lines.capacity.values)) >= \
-            sensitivity*self.lines.capacity[line]
-
+        _, outages = self.lodf_filter_pairs(sensitivity, [line])
         if as_index:
-            return [self.lines.index.get_loc(line) for line in self.lines.index[condition]]
+            return outages.tolist()
         else:
-            return self.lines.index[condition]
+            return self.lines.index[outages]
+
+    def lodf_impact_index(self):
+        """Return the outages of each line, sorted by their worst case impact.
+
+        The worst case impact of outage o on line l is :math:`|LODF_{l,o} \\cdot cap_o|`, i.e.
+        the additional flow on l when o is fully loaded. For each line the outages with non-zero
+        impact are sorted in descending order and stored in CSR-style arrays. The outages that
+        impact a line with more than a sensitivity (relative to the line capacity) are then a
+        prefix of the sorted outages, see :meth:`~lodf_filter` and :meth:`~lodf_filter_pairs`.
+
+        To keep the index small, outages are stored as int32 and impacts as float32, rounded up,
+        such that the float32 impact is an upper bound of the exact impact. The index counts 
+        against the *memory_budget*, i.e. reduces the memory available for cached lodf/psdf rows. 
+
+        The index is created once and recreated when the lodf, the topology or the line 
+        capacities change.
+
+        Returns
+        -------
+        index : types.SimpleNamespace
+            With *offsets* :math:`(L+1)`, *outages* and *impacts*, where the outages of line l 
+            are outages[offsets[l]:offsets[l+1]].
+        """
+        capacity = self.lines.capacity.values.astype(float)
+        index = self._lodf_impact_index
+        if (index is not None and index.version == self._parameter_version 
+                and index.topology_hash == self.topology_hash and np.array_equal(index.capacity, capacity)):
+            return index
+
+        number_of_lines = len(self.lines)
+        offsets = np.zeros(number_of_lines + 1, dtype=np.int64)
+        outages, impacts = [], []
+        rows = int(max(1, self.memory_budget*1e6 / (3*8*max(1, number_of_lines))))
+        for start in range(0, number_of_lines, rows):
+            impact = np.abs(np.multiply(self.lodf_rows(np.arange(start, min(number_of_lines, start + rows)), 
+                                                       cache=False), capacity))
+            order = np.argsort(-impact, axis=1, kind="stable")
+            impact = np.take_along_axis(impact, order, axis=1)
+            nonzero = impact > 0
+            offsets[start + 1:start + 1 + len(impact)] = np.sum(nonzero, axis=1)
+            impact = impact[nonzero]
+            impact_32 = impact.astype(np.float32)
+            # Round up, such that the stored impact is an upper bound.
+            rounded_down = impact_32 < impact
+            impact_32[rounded_down] = np.nextafter(impact_32[rounded_down], np.float32(np.inf))
+            outages.append(order[nonzero].astype(np.int32))
+            impacts.append(impact_32)
+        self._lodf_impact_index = types.SimpleNamespace(
+            offsets=np.cumsum(offsets), outages=np.concatenate(outages), impacts=np.concatenate(impacts),
+            capacity=capacity, version=self._parameter_version, topology_hash=self.topology_hash)
+        index = self._lodf_impact_index
+        index.nbytes = index.offsets.nbytes + index.outages.nbytes + index.impacts.nbytes
+        if index.nbytes > self.memory_budget*1e6:
+            self.logger.warning("The LODF impact index (%d MB) exceeds the memory budget of %d MB.",
+                                index.nbytes/1e6, self.memory_budget)
+        with self._row_cache_lock:
+            self._evict_row_cache()
+        return index
+
+    def lodf_filter_pairs(self, sensitivity=5e-2, lines=None):
+        """Return all line/outage pairs, where the outage impacts the line more than the sensitivity.
+
+        This is the vectorized equivalent of :meth:`~lodf_filter` for multiple lines, based on 
+        :meth:`~lodf_impact_index`. The impacts of all lines are compared with the thresholds 
+        in one pass, only the pairs where the float32 impact does not decide the comparison 
+        are checked with the exact lodf. 
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold.
+        lines : list(int), optional
+            Line positions, defaults to all lines.
+
+        Returns
+        -------
+        lines, outages : np.ndarray
+            Line and outage positions of each pair, sorted by line (in the order of argument
+            *lines*) and outage.
+        """
+        index = self.lodf_impact_index()
+        if lines is None:
+            lines = np.arange(len(self.lines))
+        lines = np.asarray(lines, dtype=int).reshape(-1)
+        threshold = sensitivity*index.capacity[lines]
+        # Outages without impact also satisfy the condition for a threshold of zero.
+        prefix = np.flatnonzero(threshold > 0)
+        all_outages = np.flatnonzero(~(threshold > 0))
+
+        # Gather the segments of the index for all lines, segment is the position in lines.
+        starts, lengths = index.offsets[lines[prefix]], np.diff(index.offsets)[lines[prefix]]
+        segment = np.repeat(prefix, lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - starts, lengths)
+        impacts = index.impacts[positions]
+        segment_threshold = threshold[segment]
+
+        # Impacts are upper bounds, the next smaller float32 is a lower bound of the exact impact.
+        candidates = impacts >= segment_threshold
+        undecided = np.flatnonzero(candidates & (np.nextafter(impacts, np.float32(0)) < segment_threshold))
+        if len(undecided) > 0:
+            undecided_lines, inverse = np.unique(lines[segment[undecided]], return_inverse=True)
+            outages = index.outages[positions[undecided]]
+            exact = np.abs(np.multiply(self.lodf_rows(undecided_lines)[inverse, outages], index.capacity[outages]))
+            candidates[undecided] = exact >= segment_threshold[undecided]
+
+        segment = np.hstack([segment[candidates], np.repeat(all_outages, len(self.lines))])
+        outages = np.hstack([index.outages[positions[candidates]].astype(int), 
+                             np.tile(np.arange(len(self.lines)), len(all_outages))])
+        order = np.lexsort((outages, segment))
+        return lines[segment[order]], outages[order]
 
     def create_n_1_ptdf_outage(self, outages):
         """Create N-1 ptdf for all lines under a specific outages.
@@ -513,6 +1582,172 @@ class GridTopology():
         n_1_ptdf_cbco = self.ptdf[lines, :] + np.dot(self.create_lodf(lines, outages), self.ptdf[outages, :])
         return n_1_ptdf_cbco
 
+    def create_n_1_ptdf_batch(self, cb, co, ptdf=None):
+        """Create N-1 ptdf rows for pairs of lines (cb) and outages (co).
+
+        For outages that are not part of a contingency group, the rows are obtained in a single 
+        gather-and-FMA pass from the N-1 lodf matrix: :math:`PTDF_{cb} + LODF_{cb,co} PTDF_{co}`. 
+        Only outages of contingency groups with multiple lines are calculated with 
+        :meth:`~create_lodf`, once per group.
+
+        Parameters
+        ----------
+        cb : list(int), np.ndarray
+            Line positions.
+        co : list(int), np.ndarray
+            Outage positions, same length as *cb*.
+        ptdf : np.ndarray, optional
+            Matrix with a row per line, e.g. a zonal ptdf, defaults to the nodal ptdf.
+
+        Returns
+        -------
+        n_1_ptdf : np.ndarray
+            N-1 ptdf with one row per cb/co pair.
+        """
+        ptdf = self.ptdf if ptdf is None else ptdf
+        cb = np.asarray(cb, dtype=int).reshape(-1)
+        co = np.asarray(co, dtype=int).reshape(-1)
+        group_positions = {line: self.lines.index.get_indexer(group)
+                           for line, group in self.contingency_groups.items() if len(group) > 1}
+        multi_line = np.array([outage in group_positions for outage in self.lines.index[co]], dtype=bool)
+
+        n_1_ptdf = np.empty((len(cb), ptdf.shape[1]), dtype=self.precision)
+        single = np.flatnonzero(~multi_line)
+        rows = int(max(1, self.memory_budget*1e6 / (2*self.precision.itemsize*max(1, ptdf.shape[1]))))
+        for start in range(0, len(single), rows):
+            pairs = single[start:start + rows]
+            n_1_ptdf[pairs] = (ptdf[cb[pairs]] 
+                               + self.lodf_elements(cb[pairs], co[pairs])[:, np.newaxis] * ptdf[co[pairs]])
+
+        multi_line = np.flatnonzero(multi_line)
+        multi_line = multi_line[np.argsort(co[multi_line], kind="stable")]
+        outages, counts = np.unique(co[multi_line], return_counts=True)
+        for outage, pairs in zip(outages, np.split(multi_line, np.cumsum(counts)[:-1])):
+            group = group_positions[self.lines.index[outage]]
+            lodf = self.create_lodf(cb[pairs].tolist(), group.tolist())
+            n_1_ptdf[pairs] = ptdf[cb[pairs]] + np.dot(lodf, ptdf[group])
+        return n_1_ptdf
+
+    def filtered_n_1_cbco(self, sensitivity=5e-2, lines=None):
+        """Return the line/outage positions of the N-0 and filtered N-1 ptdf.
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold from which outages are
+            considered critical, see :meth:`~lodf_filter`.
+        lines : list(int), optional
+            Line positions. Defaults to all lines for the N-0 and all contingencies 
+            for the N-1 ptdf.
+
+        Returns
+        -------
+        cb, co : np.ndarray
+            Line and outage positions of each row, the outage is -1 for the basecase.
+        """
+        if lines is None:
+            base_lines = np.arange(len(self.lines))
+            cb, co = self.lodf_filter_pairs(sensitivity, np.flatnonzero(self.lines.contingency.values))
+        else:
+            base_lines = np.asarray(lines, dtype=int).reshape(-1)
+            cb, co = self.lodf_filter_pairs(sensitivity, base_lines)
+        return np.hstack([base_lines, cb]), np.hstack([np.full(len(base_lines), -1), co])
+
+    def cbco_labels(self, cb, co):
+        """Return the line labels of cb/co positions, where negative outages are *basecase*.
+        
+        Outage pairs, i.e. a two column *co*, are labeled as *a+b*.
+        """
+        co = np.asarray(co)
+        if co.ndim == 2:
+            labels = self.lines.index.values.astype(str)
+            return (self.lines.index.values[cb], 
+                    np.char.add(np.char.add(labels[co[:, 0]], "+"), labels[co[:, 1]]).astype(object))
+        basecase = co < 0
+        return (self.lines.index.values[cb],
+                np.where(basecase, "basecase", self.lines.index.values[np.where(basecase, 0, co)]))
+
+    def iter_filtered_n_1_ptdf(self, sensitivity=5e-2, short_term_rating_factor=1, long_term_rating_factor=1,
+                               lines=None, ptdf=None, memory_budget=None):
+        """Yield the N-0 and filtered N-1 ptdf in chunks.
+
+        The rows are the same as in :meth:`~create_filtered_n_1_ptdf`, but they are calculated 
+        and yielded in chunks that fit into the memory budget. Therefore the full N-1 ptdf is 
+        never held in memory, which allows low sensitivities on large grids.
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold from which outages are
+            considered critical, see :meth:`~lodf_filter`.
+        short_term_rating_factor, long_term_rating_factor : float, optional
+            Factors on the line capacity for the N-1 and N-0 ram.
+        lines : list(int), optional
+            Line positions, see :meth:`~filtered_n_1_cbco`.
+        ptdf : np.ndarray, optional
+            Matrix with a row per line, e.g. a zonal ptdf, defaults to the nodal ptdf.
+        memory_budget : float, optional
+            Size of each chunk in MB, defaults to the *memory_budget* grid option.
+
+        Yields
+        ------
+        cb, co : np.ndarray
+            Line and outage positions of each row, the outage is -1 for the basecase.
+        ram : np.ndarray
+            Line capacity times the short/long term rating factor.
+        ptdf : np.ndarray
+            N-0/N-1 ptdf of the chunk.
+        """
+        if not memory_budget:
+            memory_budget = self.memory_budget
+        ptdf = self.ptdf if ptdf is None else ptdf
+        cb, co = self.filtered_n_1_cbco(sensitivity, lines)
+        capacity = self.lines.capacity.values
+        rows = int(max(1, memory_budget*1e6 / (self.precision.itemsize*max(1, ptdf.shape[1]))))
+        self.logger.info("Calculating %d rows of the N-1 ptdf in %d chunks.", len(cb), -(-len(cb)//rows))
+        for start in range(0, len(cb), rows):
+            cb_chunk, co_chunk = cb[start:start + rows], co[start:start + rows]
+            basecase = co_chunk < 0
+            chunk = np.empty((len(cb_chunk), ptdf.shape[1]), dtype=self.precision)
+            chunk[basecase] = ptdf[cb_chunk[basecase]]
+            chunk[~basecase] = self.create_n_1_ptdf_batch(cb_chunk[~basecase], co_chunk[~basecase], ptdf)
+            ram = capacity[cb_chunk] * np.where(basecase, long_term_rating_factor, short_term_rating_factor)
+            yield cb_chunk, co_chunk, ram, chunk
+
+    def create_filtered_n_1_ptdf_block(self, sensitivity=5e-2):
+        """Create the N-0 and filtered N-1 ptdf as a numpy block with integer cb/co positions.
+
+        The N-0 ptdf (co = -1) is followed by all line/outage pairs obtained by 
+        :meth:`~lodf_filter_pairs` for contingencies, calculated with 
+        :meth:`~create_n_1_ptdf_batch`.
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold from which outages are
+            considered critical.
+
+        Returns
+        -------
+        cb, co : np.ndarray
+            Line and outage positions of each row, the outage is -1 for the basecase.
+        ptdf : np.ndarray
+            The N-0 and N-1 ptdf, one row per cb/co.
+        """
+        cb, co = self.filtered_n_1_cbco(sensitivity)
+        # Estimate size of array = nr_elements * bytes per element / 1e6 MB
+        estimate_size = len(cb)*len(self.nodes.index)*self.precision.itemsize/1e6
+        self.logger.info(f"Estimated size in RAM for A is: {estimate_size} MB")
+        if estimate_size > self.memory_budget:
+            self.logger.warning("Estimated size of the N-1 ptdf exceeds the memory budget of %d MB, "
+                                "consider using iter_filtered_n_1_ptdf.", self.memory_budget)
+        ptdf = np.empty((len(cb), len(self.nodes)), dtype=self.precision)
+        start = 0
+        for _, _, _, chunk in self.iter_filtered_n_1_ptdf(sensitivity):
+            ptdf[start:start + len(chunk)] = chunk
+            start += len(chunk)
+        return cb, co, ptdf
+
     def create_filtered_n_1_ptdf(self, sensitivity=5e-2, short_term_rating_factor=1, long_term_rating_factor=1):
         """Create a N-1 ptdf/info containing all lines under outages with significant impact.
 
@@ -521,7 +1756,8 @@ class GridTopology():
         the ptdf that considers outages with significant impact based on
         the method :meth:`~lodf_filter`.
         The methods returns a DataFrame with the resulting ptdf matrix including
-        information which lines/outages make up each row.
+        information which lines/outages make up each row. For large grids and low 
+        sensitivities use :meth:`~iter_filtered_n_1_ptdf`, which yields the same rows in chunks.
 
         This methodology is extremely helpful for contingency analysis where
         the resulting ptdf matrix, and therefore the resulting optimization
@@ -549,36 +1785,233 @@ class GridTopology():
             equal to the line capacity (but does not have to).
         """
         try:
-            # line outage combination for given sensitivity. 
-            cbco = [(line, outage) for line in self.lines.index[self.lines.contingency] 
-                        for outage in self.lodf_filter(line, sensitivity) ]
-            # Estimate size of array = nr_elements * bits per element (float64) / (8 * 1e6) MB
-            # Break if matrix is too large (this can easily happen for small sensitivity thresholds)
-            estimate_size = len(cbco)*len(self.nodes.index)*64/(8*1e6)
-            self.logger.info(f"Estimated size in RAM for A is: {estimate_size} MB")
-            if estimate_size > 3000:
-                raise ArithmeticError("Estimated Size of A too large!")
-            
-            # The N-1 PTDf is calculated for all lines per outage, therefore resort cbco list 
-            # such that lines are grouped per outage. 
-            cbco_df = pd.DataFrame(columns=["lines", "outages"], data=cbco)
-            cbco_by_outages = [(list(cbco_df.lines[cbco_df.outages == out]), out) for out in cbco_df.outages.unique()]
-            ptdf = np.concatenate([self.create_n_1_ptdf_cbco(lines, outage) for lines, outage in cbco_by_outages])
-            # This results in a new ordering of the N-1 PTDF, which is indexed and resorted to the
-            # original order of the cbco list. 
-            new_index = [(cb, elm[1]) for elm in cbco_by_outages for cb in elm[0]]   
-            data = pd.DataFrame(index=new_index, data=ptdf, columns=self.nodes.index)
-            data = data.loc[cbco].reset_index(drop=True)
-            data[["cb", "co"]] = cbco
-            data["ram"] = self.lines.capacity[data.cb].values * short_term_rating_factor
-
-            # Add N-0 PTDF at the beginning of the return dataframe
-            base_data = pd.DataFrame(columns=self.nodes.index, data=self.ptdf )
-            base_data["cb"] = self.lines.index
-            base_data["co"] = "basecase"
-            base_data["ram"] = self.lines.capacity.values.reshape(len(self.lines.index), 1) * long_term_rating_factor
-            data = pd.concat([base_data, data]).reset_index(drop=True)
-            data = data[["cb", "co", "ram"] + list(list(self.nodes.index))]
+            cb, co, ptdf = self.create_filtered_n_1_ptdf_block(sensitivity)
+            basecase = co < 0
+            data = pd.DataFrame(index=np.arange(len(cb)), columns=["cb", "co", "ram"])
+            data["cb"], data["co"] = self.cbco_labels(cb, co)
+            data["ram"] = self.lines.capacity.values[cb] * np.where(basecase, long_term_rating_factor, 
+                                                                     short_term_rating_factor)
+            data = pd.concat([data, pd.DataFrame(ptdf, columns=self.nodes.index)], axis=1)
             return data
         except:
             self.logger.exception('error:create_n_1_ptdf')
+
+    def screen_n_2_contingencies(self, sensitivity=5e-2, lines=None):
+        """Return the line/outage-pair combinations with significant impact of both outages.
+
+        For the simultaneous outage of lines a and b the post-contingency ptdf of line l is
+        :math:`PTDF_l + c_a PTDF_a + c_b PTDF_b`, where the coefficients follow from the 
+        N-1 lodf matrix:
+
+        .. math:: c_a = (LODF_{l,a} + LODF_{l,b} LODF_{b,a}) / (1 - LODF_{a,b} LODF_{b,a})
+
+        and :math:`c_b` accordingly. Analogous to :meth:`~lodf_filter`, a combination is 
+        considered critical if both outages impact the line with more than the sensitivity
+        in the worst case, i.e. :math:`|c_a| cap_a \\geq sensitivity \\cdot cap_l` and 
+        :math:`|c_b| cap_b \\geq sensitivity \\cdot cap_l`. 
+        
+        Evaluating all :math:`L \\times C^2` combinations is prohibitive for large grids, 
+        therefore the combinations are screened in two stages:
+
+            - With :math:`\\kappa_{ab} = 1/|1 - LODF_{a,b} LODF_{b,a}|` and the transfer ratio
+              :math:`T_{ab} = |LODF_{a,b}| cap_b / cap_a`, both impacts are bounded by
+              :math:`|LODF_{l,a}| cap_a \\cdot f_a` for the outage a with the larger N-1 impact,
+              where :math:`f_a = \\max_b \\kappa_{ab} (1 + \\min(T_{ab}, T_{ba}))`. Only 
+              line/outage pairs (l, a) that pass this bound are candidates. 
+            - For each candidate the coefficients are evaluated exactly for all second 
+              outages b, in parallel batches that fit into the *memory_budget*. 
+
+        Pairs of lines in the same contingency group are already part of the N-1 
+        contingencies and pairs that disconnect the network are omitted.
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold from which outage pairs are
+            considered critical.
+        lines : list(int), optional
+            Line positions, defaults to all lines.
+
+        Returns
+        -------
+        cb : np.ndarray
+            Line positions.
+        co : np.ndarray
+            Positions of the outage pairs :math:`(n \\times 2)`, sorted by position.
+        coefficients : np.ndarray
+            The coefficients :math:`c_a, c_b` of each outage pair :math:`(n \\times 2)`.
+        """
+        number_of_lines = len(self.lines)
+        lines = np.arange(number_of_lines) if lines is None else np.asarray(lines, dtype=int).reshape(-1)
+        capacity = self.lines.capacity.values.astype(float)
+        threshold = sensitivity*capacity
+        # Valid outages are contingencies that do not disconnect the network (lodf diagonal of -1).
+        outages = np.flatnonzero(self._lodf_denominators()[1])
+        number_of_outages = len(outages)
+        if number_of_outages < 2 or len(lines) == 0:
+            return np.array([], dtype=int), np.empty((0, 2), dtype=int), np.empty((0, 2))
+
+        group = np.arange(number_of_lines)
+        for line, lines_in_group in self.contingency_groups.items():
+            group[self.lines.index.get_loc(line)] = self.lines.index.get_indexer(lines_in_group).min()
+        group = group[outages]
+
+        lodf_outages = self.lodf_rows(outages, cache=False)[:, outages]
+        denominator = 1 - lodf_outages*lodf_outages.T
+        valid = (~self._isclose_zero(denominator)) & (group[:, np.newaxis] != group[np.newaxis, :])
+        inverse_denominator = np.zeros_like(denominator)
+        np.divide(1, denominator, out=inverse_denominator, where=valid)
+
+        outage_capacity = capacity[outages]
+        transfer = np.zeros_like(denominator)
+        np.divide(np.abs(lodf_outages)*outage_capacity, outage_capacity[:, np.newaxis], 
+                  out=transfer, where=(outage_capacity[:, np.newaxis] > 0))
+        factor = np.max(np.abs(inverse_denominator)*(1 + np.minimum(transfer, transfer.T)), axis=1)
+
+        # Stage 1: candidate line/outage pairs from the bound on the N-1 impact.
+        candidate_lines, candidate_outages = [], []
+        rows = int(max(1, self.memory_budget*1e6 / (2*8*number_of_outages)))
+        for start in range(0, len(lines), rows):
+            block = lines[start:start + rows]
+            bound = np.abs(self.lodf_rows(block, cache=False)[:, outages])*(outage_capacity*factor)
+            candidate = (bound >= threshold[block, np.newaxis]) & (outages != block[:, np.newaxis]) & (factor > 0)
+            line_index, outage_index = np.nonzero(candidate)
+            candidate_lines.append(block[line_index])
+            candidate_outages.append(outage_index)
+        candidate_lines, candidate_outages = np.hstack(candidate_lines), np.hstack(candidate_outages)
+        self.logger.info("Screening N-2 contingencies: %d candidate line/outage pairs.", len(candidate_lines))
+
+        # Stage 2: exact coefficients for all second outages of each candidate.
+        def evaluate(batch):
+            line, first = candidate_lines[batch], candidate_outages[batch]
+            lodf_lines = self.lodf_rows(line, cache=False)[:, outages]
+            lodf_first = lodf_lines[np.arange(len(batch)), first][:, np.newaxis]
+            coefficient_first = (lodf_first + lodf_lines*lodf_outages[:, first].T)*inverse_denominator[first]
+            coefficient_second = (lodf_lines + lodf_first*lodf_outages[first])*inverse_denominator[first]
+            critical = (valid[first] & (outages != line[:, np.newaxis]) 
+                        & (np.abs(coefficient_first)*outage_capacity[first, np.newaxis] >= threshold[line, np.newaxis])
+                        & (np.abs(coefficient_second)*outage_capacity >= threshold[line, np.newaxis]))
+            index, second = np.nonzero(critical)
+            return (line[index], first[index], second, 
+                    coefficient_first[index, second], coefficient_second[index, second])
+
+        rows = int(max(1, self.memory_budget*1e6 / (6*8*number_of_outages)))
+        batches = [np.arange(start, min(len(candidate_lines), start + rows))
+                   for start in range(0, len(candidate_lines), rows)]
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(evaluate, batches))
+        if len(results) == 0:
+            return np.array([], dtype=int), np.empty((0, 2), dtype=int), np.empty((0, 2))
+        cb, first, second, coefficient_first, coefficient_second = [np.hstack(r) for r in zip(*results)]
+
+        # Order each outage pair by position, pairs found from both outages are dropped once.
+        swap = first > second
+        first, second = np.where(swap, second, first), np.where(swap, first, second)
+        coefficients = np.vstack([np.where(swap, coefficient_second, coefficient_first), 
+                                  np.where(swap, coefficient_first, coefficient_second)]).T
+        key = (cb.astype(np.int64)*number_of_outages + first)*number_of_outages + second
+        _, unique = np.unique(key, return_index=True)
+        co = np.vstack([outages[first[unique]], outages[second[unique]]]).T
+        self.logger.info("Screening N-2 contingencies: %d critical line/outage-pair combinations.", len(unique))
+        return cb[unique], co, coefficients[unique]
+
+    def create_n_2_ptdf_batch(self, cb, co, coefficients, ptdf=None):
+        """Create N-2 ptdf rows for lines (cb) and outage pairs (co).
+
+        Parameters
+        ----------
+        cb : np.ndarray
+            Line positions.
+        co : np.ndarray
+            Positions of the outage pairs :math:`(n \\times 2)`.
+        coefficients : np.ndarray
+            Coefficients of the outage pairs, see :meth:`~screen_n_2_contingencies`.
+        ptdf : np.ndarray, optional
+            Matrix with a row per line, e.g. a zonal ptdf, defaults to the nodal ptdf.
+
+        Returns
+        -------
+        n_2_ptdf : np.ndarray
+            N-2 ptdf with one row per cb/co pair.
+        """
+        ptdf = self.ptdf if ptdf is None else ptdf
+        coefficients = coefficients.astype(self.precision)
+        return (ptdf[cb] + coefficients[:, [0]]*ptdf[co[:, 0]] 
+                + coefficients[:, [1]]*ptdf[co[:, 1]]).astype(self.precision, copy=False)
+
+    def iter_n_2_ptdf(self, sensitivity=5e-2, short_term_rating_factor=1, lines=None, ptdf=None, 
+                      memory_budget=None):
+        """Yield the N-2 ptdf of the critical combinations in chunks.
+
+        The combinations are obtained from :meth:`~screen_n_2_contingencies`, the chunks have
+        the same form as in :meth:`~iter_filtered_n_1_ptdf`, with the outage pairs as two 
+        column array *co*. 
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold from which outage pairs are
+            considered critical.
+        short_term_rating_factor : float, optional
+            Factor on the line capacity for the ram.
+        lines : list(int), optional
+            Line positions, defaults to all lines.
+        ptdf : np.ndarray, optional
+            Matrix with a row per line, e.g. a zonal ptdf, defaults to the nodal ptdf.
+        memory_budget : float, optional
+            Size of each chunk in MB, defaults to the *memory_budget* grid option.
+
+        Yields
+        ------
+        cb, co : np.ndarray
+            Line and outage pair positions of each row.
+        ram : np.ndarray
+            Line capacity times the short term rating factor.
+        ptdf : np.ndarray
+            N-2 ptdf of the chunk.
+        """
+        if not memory_budget:
+            memory_budget = self.memory_budget
+        ptdf = self.ptdf if ptdf is None else ptdf
+        cb, co, coefficients = self.screen_n_2_contingencies(sensitivity, lines)
+        capacity = self.lines.capacity.values
+        rows = int(max(1, memory_budget*1e6 / (self.precision.itemsize*max(1, ptdf.shape[1]))))
+        for start in range(0, len(cb), rows):
+            chunk = slice(start, start + rows)
+            yield (cb[chunk], co[chunk], capacity[cb[chunk]]*short_term_rating_factor, 
+                   self.create_n_2_ptdf_batch(cb[chunk], co[chunk], coefficients[chunk], ptdf))
+
+    def create_n_2_ptdf(self, sensitivity=5e-2, short_term_rating_factor=1):
+        """Create the N-2 ptdf/info of all lines under outage pairs with significant impact.
+
+        The returned DataFrame has the same form as the one of :meth:`~create_filtered_n_1_ptdf`,
+        where the outage pair is indicated as *a+b* in the column co. The combinations are 
+        obtained from :meth:`~screen_n_2_contingencies`.
+
+        Parameters
+        ----------
+        sensitivity : float, optional
+            The sensitivity defines the threshold from which outage pairs are
+            considered critical.
+        short_term_rating_factor : float, optional
+            Factor on the line capacity for the ram.
+
+        Returns
+        -------
+        ptdf : DataFrame
+            Returns DataFrame, each row represents a line (cb) under an outage pair (co) 
+            with ptdf for each node and the available capacity (ram).
+        """
+        cb, co, ram, ptdf = [], [], [], []
+        for cb_chunk, co_chunk, ram_chunk, ptdf_chunk in self.iter_n_2_ptdf(sensitivity, short_term_rating_factor):
+            cb.append(cb_chunk)
+            co.append(co_chunk)
+            ram.append(ram_chunk)
+            ptdf.append(ptdf_chunk)
+        if len(cb) == 0:
+            return pd.DataFrame(columns=["cb", "co", "ram"] + list(self.nodes.index))
+        data = pd.DataFrame(index=np.arange(sum(len(c) for c in cb)), columns=["cb", "co", "ram"])
+        data["cb"], data["co"] = self.cbco_labels(np.hstack(cb), np.vstack(co))
+        data["ram"] = np.hstack(ram)
+        data = pd.concat([data, pd.DataFrame(np.vstack(ptdf), columns=self.nodes.index)], axis=1)
+        return data
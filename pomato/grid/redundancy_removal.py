@@ -0,0 +1,172 @@
+"""Redundancy Removal of POMATO
+
+Python implementation of the redundancy removal algorithm, as alternative to the Julia package
+RedundancyRemoval that is run through :class:`~pomato.tools.JuliaDaemon`.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.optimize
+
+
+class RedundancyRemoval():
+    """Clarkson's redundancy removal algorithm for a system of linear inequalities Ax <= b.
+
+    A constraint is essential, i.e. non-redundant, if removing it changes the feasible region.
+    Clarkson's algorithm finds the essential set by iterating over all constraints and
+    solving a small LP for each, that only contains the essential constraints found so far:
+
+        - maximize :math:`a_i x` s.t. :math:`A_I x \\leq b_I, a_i x \\leq b_i + 1`, where I is
+          the essential set.
+        - If the optimum violates :math:`a_i x \\leq b_i`, a ray from an interior point to the
+          optimum is shot. The first constraint hit by the ray is essential and added to I.
+          Otherwise constraint i is redundant.
+
+    The injections x are balanced, i.e. :math:`\\sum x = 0`, and optionally bounded by
+    *x_bounds*, i.e. :math:`|x| \\leq x_{bounds}`. The LPs are solved with HiGHS through
+    scipy.optimize.linprog.
+
+    With a *seed*, e.g. the essential set of the same constraints with different b, Clarkson's
+    algorithm starts with the seed as essential set, such that only the remaining constraints 
+    are checked, adding any that have become binding. Seed constraints that are redundant 
+    under the new b are removed by a final run on the (small) resulting set. 
+
+    To run in parallel, the constraints are split into batches and the essential set of each
+    batch is found in a separate process. As a constraint that is essential for the full
+    system is also essential within each subset, the union of the batch results contains
+    all essential constraints and the algorithm is run again on the union. See
+    `Fast Security-Constrained Optimal Power Flow through Low-Impact and Redundancy Screening
+    <https://arxiv.org/abs/1910.09034>`_ for more information.
+
+    Parameters
+    ----------
+    A : np.ndarray
+        Constraint matrix :math:`(m \\times n)`.
+    b : np.ndarray
+        Right hand side :math:`(m)`.
+    x_bounds : np.ndarray, optional
+        Absolute bound on each variable :math:`(n)`, unbounded if empty.
+    tolerance : float, optional
+        Tolerance to decide whether a constraint is violated.
+    """
+    def __init__(self, A, b, x_bounds=None, tolerance=1e-6):
+        self.logger = logging.getLogger('log.pomato.grid.RedundancyRemoval')
+        self.A = np.asarray(A, dtype=float)
+        self.b = np.asarray(b, dtype=float).reshape(-1)
+        if x_bounds is None or np.size(x_bounds) == 0:
+            self.x_bounds = None
+        else:
+            self.x_bounds = np.asarray(x_bounds, dtype=float).reshape(-1)
+        self.tolerance = tolerance
+
+    def run(self, workers=None, batch_size=500, seed=None):
+        """Return the essential set of constraints.
+
+        Parameters
+        ----------
+        workers : int, optional
+            Number of processes used for the batches. Runs sequentially if None or 1.
+        batch_size : int, optional
+            Number of constraints per batch.
+        seed : array_like, optional
+            Positions of constraints to start with as essential set, e.g. a previous result.
+
+        Returns
+        -------
+        essential : list
+            Sorted positions of the essential constraints.
+        """
+        candidates = np.arange(len(self.b))
+        seed = np.unique(np.asarray(seed if seed is not None else [], dtype=int))
+        if len(seed) > 0:
+            self.logger.info("Warm start with %d of %d constraints.", len(seed), len(self.b))
+        batches = [candidates]
+        if workers and workers > 1 and len(candidates) > batch_size:
+            batches = [candidates[start:start + batch_size] for start in range(0, len(candidates), batch_size)]
+        # Each batch includes the seed, which is at the start of the batch.
+        batches = [np.hstack([seed, np.setdiff1d(batch, seed)]) for batch in batches]
+        if len(batches) > 1:
+            self.logger.info("Running redundancy removal on %d constraints in %d batches.",
+                             len(candidates), len(batches))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(_essential_set,
+                                       [(self.A[batch], self.b[batch], self.x_bounds, self.tolerance, len(seed))
+                                        for batch in batches])
+                candidates = np.unique(np.hstack([batch[result] for batch, result in zip(batches, results)]))
+            self.logger.info("Batches reduced constraints to %d.", len(candidates))
+        elif len(seed) > 0:
+            batch = batches[0]
+            candidates = np.sort(batch[_essential_set((self.A[batch], self.b[batch], self.x_bounds, 
+                                                       self.tolerance, len(seed)))])
+            self.logger.info("Warm start added %d constraints to the seed.", len(np.setdiff1d(candidates, seed)))
+
+        essential = _essential_set((self.A[candidates], self.b[candidates], self.x_bounds, self.tolerance))
+        self.logger.info("Redundancy removal found %d essential constraints.", len(essential))
+        return np.sort(candidates[essential]).tolist()
+
+
+def _interior_point(A, b, x_bounds):
+    """Return the zero vector or, if it is not strictly feasible, the Chebyshev center."""
+    if (b > 0).all():
+        return np.zeros(A.shape[1])
+    norm = np.linalg.norm(A, axis=1)
+    A_ub = np.hstack([A, norm[:, np.newaxis]])
+    if x_bounds is None:
+        bounds = [(None, None)]*A.shape[1] + [(0, None)]
+    else:
+        bounds = list(zip(-x_bounds, x_bounds)) + [(0, None)]
+    A_eq = np.hstack([np.ones((1, A.shape[1])), np.zeros((1, 1))])
+    objective = np.zeros(A.shape[1] + 1)
+    objective[-1] = -1
+    result = scipy.optimize.linprog(objective, A_ub=A_ub, b_ub=b, A_eq=A_eq, b_eq=[0],
+                                    bounds=bounds, method="highs", options={"presolve": False})
+    if result.status != 0 or result.x[-1] <= 0:
+        raise ValueError("The constraints have no interior point.")
+    return result.x[:-1]
+
+
+def _essential_set(args):
+    """Clarkson's algorithm for the constraints A, b, returns positions of the essential set.
+
+    The first *number_of_seeds* constraints are taken as initial essential set, if supplied.
+    """
+    A, b, x_bounds, tolerance = args[:4]
+    number_of_seeds = args[4] if len(args) > 4 else 0
+    number_of_constraints, number_of_variables = A.shape
+    if number_of_constraints == 0:
+        return np.array([], dtype=int)
+    if x_bounds is None:
+        bounds = (None, None)
+    else:
+        bounds = np.vstack([-x_bounds, x_bounds]).T
+    A_eq, b_eq = np.ones((1, number_of_variables)), [0]
+    interior = _interior_point(A, b, x_bounds)
+    slack = b - A @ interior
+
+    essential = list(range(number_of_seeds))
+    is_essential = np.zeros(number_of_constraints, dtype=bool)
+    is_essential[:number_of_seeds] = True
+    for i in range(number_of_constraints):
+        while not is_essential[i]:
+            rows = essential + [i]
+            b_ub = b[rows].copy()
+            b_ub[-1] += 1
+            result = scipy.optimize.linprog(-A[i], A_ub=A[rows], b_ub=b_ub, A_eq=A_eq, b_eq=b_eq,
+                                            bounds=bounds, method="highs", options={"presolve": False})
+            if result.status != 0:
+                # Constraints that cannot be decided are kept.
+                j = i
+            elif A[i] @ result.x <= b[i] + tolerance:
+                break
+            else:
+                # Ray shooting from the interior point towards the optimum, the first
+                # constraint hit is essential.
+                direction = A @ (result.x - interior)
+                step = np.full(number_of_constraints, np.inf)
+                hit = (direction > tolerance) & ~is_essential
+                step[hit] = slack[hit] / direction[hit]
+                j = int(np.argmin(step)) if hit.any() else i
+            essential.append(j)
+            is_essential[j] = True
+    return np.array(essential, dtype=int)
@@ -234,7 +234,7 @@ class POMATO():
         else: 
             self.initialize_options(options_file)
         self.data = DataManagement(self.options, self.wdir)
-        self.grid = GridTopology()       
+        self.grid = GridTopology(self.options)
         self.grid_model = GridModel(self.wdir, self.grid, self.data, self.options)
         self.grid_representation = self.grid_model.grid_representation
         self.market_model = MarketModel(self.wdir, self.options, self.data, self.grid_representation)
@@ -283,7 +283,8 @@ class POMATO():
 
     def init_grid_model(self):
         """Initialize the grid model from the data management object"""
-        self.grid.calculate_parameters(self.data.nodes, self.data.lines)
+        self.grid.calculate_parameters(self.data.nodes, self.data.lines,
+                                       cache_dir=self.wdir.joinpath("data_temp/grid_cache"))
 
     def update_market_model_data(self, folder=None):
         """Update data within an instance of the market model.
@@ -373,7 +374,17 @@ class POMATO():
 
         Additionally, this method create the appropriate grid representation. 
         """
-        flowbased_parameters = self.fbmc.create_flowbased_parameters(basecase, **kwargs)
+        return self.create_fb_parameters(basecase, **kwargs).to_frame()
+
+    def create_fb_parameters(self, basecase, **kwargs):
+        """Create flow based parameters as :class:`~pomato.fbmc.FBParameters`.
+
+        Same as :meth:`~create_flowbased_parameters`, but returns the compact container of the 
+        FB parameters, see :meth:`~pomato.fbmc.FBMCModule.create_fb_parameters`. The container 
+        is used as grid representation, which avoids the DataFrame with a row per CBCO and 
+        timestep. 
+        """
+        flowbased_parameters = self.fbmc.create_fb_parameters(basecase, **kwargs)
         self.create_grid_representation(flowbased_parameters=flowbased_parameters)
         return flowbased_parameters
 
@@ -384,7 +395,7 @@ class POMATO():
         
         Parameters
         ----------
-        flowbased_parameters : optional, pandas.DataFrame
+        flowbased_parameters : optional, pandas.DataFrame or :class:`~pomato.fbmc.FBParameters`
             Flowbased parameters, derived using :class:`~pomato.fbmc.FBMCModule`
         """
         self.grid_model.create_grid_representation(**kwargs)
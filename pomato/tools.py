@@ -17,6 +17,7 @@ from functools import reduce
 from pathlib import Path
 
 import logaugment
+import numpy as np
 import pandas as pd
 import progress
 from progress.spinner import Spinner
@@ -148,6 +149,7 @@ class JuliaDaemon():
                 "file_suffix": "py",
                 "redispatch": False,
                 "fbmc_domain": False,
+                "exchange_format": "csv",
                 "chance_constrained": False,
                 "multi_threaded": True,
                 "data_dir": "/data/",
@@ -239,6 +241,80 @@ class JuliaDaemon():
         self.halt_while_processing()
         self.solved = True
 
+class NpyWriter():
+    """Write a 2D array to a .npy file in chunks of rows.
+
+    The header is reserved when the file is opened and completed with the final shape 
+    when the file is closed, such that the array does not have to be held in memory. 
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the .npy file.
+    """
+    _header_length = 128
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.dtype = None
+        self.shape = (0, )
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "wb")
+        self._file.write(b"\x00"*self._header_length)
+        return self
+
+    def write(self, chunk):
+        """Append the rows of chunk to the file."""
+        chunk = np.asarray(chunk)
+        if self.dtype is None:
+            self.dtype = chunk.dtype.newbyteorder("<")
+            self.shape = (0, ) + chunk.shape[1:]
+        if chunk.shape[1:] != self.shape[1:]:
+            raise ValueError(f"Chunk shape {chunk.shape} does not match array shape {self.shape}.")
+        self._file.write(np.ascontiguousarray(chunk, dtype=self.dtype).tobytes())
+        self.shape = (self.shape[0] + chunk.shape[0], ) + self.shape[1:]
+
+    def __exit__(self, *args):
+        if self.dtype is None:
+            self.dtype = np.dtype("<f8")
+        header = str({"descr": self.dtype.str, "fortran_order": False, "shape": self.shape})
+        # Magic string, version 1.0 and header length precede the header, which ends on a newline.
+        preamble = b"\x93NUMPY\x01\x00"
+        header_length = self._header_length - len(preamble) - 2
+        header = header.ljust(header_length - 1).encode("latin1") + b"\n"
+        self._file.seek(0)
+        self._file.write(preamble + header_length.to_bytes(2, "little") + header)
+        self._file.close()
+
+class ArrowWriter():
+    """Write DataFrames with identical columns to one Arrow IPC (feather) file in chunks.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the .feather file.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def write(self, df):
+        """Append the rows of df to the file."""
+        import pyarrow
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pyarrow.ipc.new_file(str(self.path), table.schema)
+        self._writer.write_table(table)
+
+    def __exit__(self, *args):
+        if self._writer is not None:
+            self._writer.close()
+
 def newest_file_folder(folder, keyword="", number_of_elm=1):
     """Return newest (n) folders/files from a folder.
 
@@ -293,6 +369,7 @@ def create_folder_structure(base_path, logger=None):
         "data_output": {},
         "data_temp": {
             "results_cache": {},
+            "grid_cache": {},
             "julia_files": {
                     "data": {},
                     "results": {},
@@ -402,12 +479,22 @@ def default_options():
         },
         "grid": {
             "redundancy_removal_option": "full",
+            "redundancy_removal_engine": "julia",
             "precalc_filename": "",
             "include_contingencies_redispatch": False,
             "sensitivity": 5e-2,
+            "n_2_sensitivity": None,
             "short_term_rating_factor": 1,
             "long_term_rating_factor": 1,
             "preprocess": True,
+            "prescreen": True,
+            "cache_redundancy_removal": True,
+            "warm_start": False,
+            "exchange_format": "csv",
+            "sparse": False,
+            "memory_budget": 2000,
+            "precision": "float64",
+            "cache_parameters": True,
         },
         "fbmc": {
             "gsk": "gmax",
@@ -420,6 +507,8 @@ def default_options():
             "reduce": False,         
             "enforce_ntc_domain": False,  
             "precalc_filename": None, 
+            "workers": 1,
+            "chunk_size": 168,
         },
         "solver": {
             "name": "Clp", 
@@ -165,7 +165,7 @@ class FBDomainPlots():
         POMATO working directory.  
     data : :class:`~pomato.data.DataManagement`
         Instance of POMATO data management. 
-    flowbased_parameters : pd.DataFrame 
+    flowbased_parameters : pd.DataFrame or :class:`~pomato.fbmc.FBParameters`
         FB parameters, as derived from :class:`~pomato.fbmc.FBMCModule`.
     """  
     def __init__(self, data, flowbased_parameters):
@@ -174,6 +174,8 @@ class FBDomainPlots():
         self.logger.info("Initializing FBDomainPlots....")
         self.data = data
         self.fbmc_plots = [] # keep plots 
+        if isinstance(flowbased_parameters, pomato.fbmc.FBParameters):
+            flowbased_parameters = flowbased_parameters.to_frame()
         self.flowbased_parameters = flowbased_parameters
 
     def set_xy_limits_forall_plots(self):
@@ -4,7 +4,9 @@ import random
 import shutil
 import sys
 import tempfile
+import types
 import unittest
+from unittest import mock
 from pathlib import Path
 
 import numpy as np
@@ -55,3 +57,215 @@ class TestFBMCModule(unittest.TestCase):
         #                   fbmc_gridrep_G.loc[:, mato.data.zones.index].values, 
         #                   fbmc_gridrep_Gmax.loc[:, mato.data.zones.index].values)
 
+
+    def test_zonal_cbco_ptdf(self):
+        mato = pomato.POMATO(wdir=self.wdir, options_file="profiles/nrel118.json",
+                             logging_level=logging.ERROR, file_logger=False)
+        mato.load_data('data_input/nrel_118_original.zip')
+        critical_branches = mato.fbmc.return_critical_branches(0.05)
+        cbco, fbmc_data = mato.fbmc.create_fbmc_cbco(critical_branches, 0.05)
+        nodal_fbmc_ptdf, nodal_fbmc_data = mato.fbmc.create_base_fbmc_parameters(critical_branches, 0.05)
+        pd.testing.assert_frame_equal(fbmc_data, nodal_fbmc_data)
+
+        # Rows are the (negative) contingency ptdf of each cbco.
+        for row in random.sample(range(len(fbmc_data)), 25):
+            cb, co = fbmc_data.loc[row, ["cb", "co"]]
+            if co == "basecase":
+                ptdf = mato.grid.ptdf[mato.grid.lines.index.get_loc(cb)]
+            else:
+                ptdf = mato.grid.create_n_1_ptdf_cbco(cb, co).reshape(-1)
+            np.testing.assert_allclose(np.abs(nodal_fbmc_ptdf[row]), np.abs(ptdf), atol=1e-10)
+        self.assertEqual(len(fbmc_data), 2*len(cbco.cb))
+        np.testing.assert_array_equal(np.bincount(cbco.rows), 2)
+        
+        # Zonal ptdf and flows can be obtained without the nodal cbco ptdf. 
+        gsk = mato.fbmc.create_gsk("gmax")
+        np.testing.assert_allclose(mato.fbmc.create_cbco_ptdf(cbco, np.dot(mato.grid.ptdf, gsk)), 
+                                   np.dot(nodal_fbmc_ptdf, gsk), atol=1e-10)
+        injection = np.random.default_rng(0).uniform(-1, 1, (len(mato.grid.nodes), 3))
+        np.testing.assert_allclose(mato.fbmc.create_cbco_ptdf(cbco, np.dot(mato.grid.ptdf, injection)), 
+                                   np.dot(nodal_fbmc_ptdf, injection), atol=1e-10)
+        mato.logger.handlers[0].close()
+
+    def test_dynamic_gsk(self):
+        mato = pomato.POMATO(wdir=self.wdir, options_file="profiles/nrel118.json",
+                             logging_level=logging.ERROR, file_logger=False)
+        mato.load_data('data_input/nrel_118_original.zip')
+        mato.data.process_results(self.wdir.joinpath("opf_market"), mato.grid)
+        basecase = mato.data.results["opf_market"]
+        timesteps = basecase.model_horizon[:4]
+        # No generation in the first zone in the first timestep, only G is used for the GSK.
+        zone = mato.data.zones.index[0]
+        nodes_in_zone = mato.grid.nodes.index[mato.grid.nodes.zone == zone]
+        plants_in_zone = mato.data.plants.index[mato.data.plants.node.isin(nodes_in_zone)]
+        generation = basecase.G.copy()
+        generation.loc[(generation.t == timesteps[0]) & generation.p.isin(plants_in_zone), "G"] = 0
+        basecase = types.SimpleNamespace(G=generation)
+
+        try:
+            gsk_stack = mato.fbmc.create_dynamic_gsk_stack(basecase, timesteps)
+            self.assertEqual(gsk_stack.shape, (len(timesteps), len(mato.grid.nodes), len(mato.data.zones)))
+            plant_types = mato.data.options["plant_types"]
+            conventional = mato.data.plants.index[~mato.data.plants.plant_type.isin(plant_types["ts"] + plant_types["es"])]
+            for t, timestep in enumerate(timesteps):
+                gen = basecase.G[(basecase.G.t == timestep) & basecase.G.p.isin(conventional)]
+                gen = gen.assign(n=mato.data.plants.loc[gen.p, "node"].values).groupby("n").G.sum()
+                for z, zone in enumerate(mato.data.zones.index):
+                    nodes_in_zone = mato.grid.nodes.index[mato.grid.nodes.zone == zone]
+                    expected = gen.reindex(nodes_in_zone).fillna(0)
+                    if expected.sum() > 0:
+                        expected /= expected.sum()
+                    else:
+                        expected[:] = 1/len(nodes_in_zone)
+                    np.testing.assert_allclose(gsk_stack[t, mato.grid.nodes.index.isin(nodes_in_zone), z], 
+                                               expected.values)
+                    self.assertEqual(gsk_stack[t, ~mato.grid.nodes.index.isin(nodes_in_zone), z].sum(), 0)
+                np.testing.assert_allclose(mato.fbmc.create_dynamic_gsk(basecase, timestep), gsk_stack[t])
+            self.assertTrue(np.all(gsk_stack[0, mato.grid.nodes.zone == mato.data.zones.index[0], 0] > 0))
+
+            zonal_ptdf = mato.fbmc.create_dynamic_zonal_ptdf(basecase, timesteps)
+            np.testing.assert_allclose(zonal_ptdf, np.tensordot(mato.grid.ptdf, gsk_stack, axes=([1], [1])), 
+                                       atol=1e-12)
+        finally:
+            mato.logger.handlers[0].close()
+
+    def test_fb_parameters(self):
+        mato = pomato.POMATO(wdir=self.wdir, options_file="profiles/nrel118.json",
+                             logging_level=logging.ERROR, file_logger=False)
+        mato.load_data('data_input/nrel_118_original.zip')
+        mato.data.process_results(self.wdir.joinpath("opf_market"), mato.grid)
+        basecase = mato.data.results["opf_market"]
+        timesteps = basecase.model_horizon[:3]
+        mato.options["fbmc"]["minram"] = 0.1
+        mato.options["fbmc"]["gsk"] = "gmax"
+        try:
+            fb_parameters = mato.fbmc.create_fb_parameters(basecase, timesteps)
+            self.assertIsInstance(fb_parameters, pomato.fbmc.FBParameters)
+            # Static GSK, zonal ptdf is stored once.
+            self.assertFalse(fb_parameters.dynamic)
+            self.assertEqual(fb_parameters.ptdf.shape, (len(fb_parameters.cb), len(mato.data.zones)))
+            self.assertEqual(fb_parameters.ram.shape, (len(fb_parameters.cb), len(timesteps)))
+            
+            frame = fb_parameters.to_frame()
+            pd.testing.assert_frame_equal(frame, mato.fbmc.create_flowbased_parameters(basecase, timesteps))
+            self.assertEqual(list(frame.columns), fb_parameters.columns + list(mato.data.zones.index))
+            self.assertEqual(len(frame), len(fb_parameters))
+            pd.testing.assert_frame_equal(fb_parameters.frame(timesteps[1]), frame[frame.timestep == timesteps[1]])
+
+            # Masked CNECs are removed for each timestep, positions correspond to the unmasked frame. 
+            positions = fb_parameters.to_frame(index="position").index
+            fb_parameters.keep(positions[::2])
+            pd.testing.assert_frame_equal(fb_parameters.to_frame(), frame.iloc[::2])
+            
+            fb_parameters.to_csv(self.wdir.joinpath("fb_parameters.csv"), index_label='index')
+            frame.iloc[::2].to_csv(self.wdir.joinpath("fb_parameters_frame.csv"), index_label='index')
+            with open(self.wdir.joinpath("fb_parameters.csv")) as file, \
+                open(self.wdir.joinpath("fb_parameters_frame.csv")) as frame_file:
+                self.assertEqual(file.read(), frame_file.read())
+
+            mato.create_grid_representation(flowbased_parameters=fb_parameters)
+            self.assertIs(mato.grid_representation.grid, fb_parameters)
+
+            # POMATO returns the DataFrame, the container is used as grid representation.
+            pd.testing.assert_frame_equal(mato.create_flowbased_parameters(basecase, timesteps=timesteps), frame)
+            self.assertIsInstance(mato.grid_representation.grid, pomato.fbmc.FBParameters)
+        finally:
+            mato.logger.handlers[0].close()
+
+    def test_fb_parameter_stages(self):
+        mato = pomato.POMATO(wdir=self.wdir, options_file="profiles/nrel118.json",
+                             logging_level=logging.ERROR, file_logger=False)
+        mato.load_data('data_input/nrel_118_original.zip')
+        mato.data.process_results(self.wdir.joinpath("opf_market"), mato.grid)
+        basecase = mato.data.results["opf_market"]
+        timesteps = basecase.model_horizon[:2]
+        mato.options["fbmc"]["gsk"] = "gmax"
+        try:
+            mato.fbmc.create_fb_parameters(basecase, timesteps)
+            self.assertEqual(set(mato.fbmc.stages), {"cne", "cbco", "reference_flows", "zonal_ptdf"})
+
+            # Changing minRAM and FRM only reruns the RAM adjustment.
+            mato.options["fbmc"]["minram"] = 0.3
+            mato.options["fbmc"]["frm"] = 0.1
+            with mock.patch.object(mato.fbmc, "return_critical_branches") as cne, \
+                mock.patch.object(mato.fbmc, "create_fbmc_cbco") as cbco, \
+                mock.patch.object(mato.fbmc, "create_reference_flows") as reference_flows, \
+                mock.patch.object(mato.fbmc, "create_zonal_cbco_ptdf") as zonal_ptdf:
+                fb_parameters = mato.fbmc.create_fb_parameters(basecase, timesteps).to_frame()
+            for stage in [cne, cbco, reference_flows, zonal_ptdf]:
+                stage.assert_not_called()
+
+            # Changing the GSK reruns the zonal ptdf. 
+            mato.options["fbmc"]["gsk"] = "flat"
+            with mock.patch.object(mato.fbmc, "create_reference_flows") as reference_flows:
+                mato.fbmc.create_fb_parameters(basecase, timesteps)
+            reference_flows.assert_not_called()
+            self.assertEqual(mato.fbmc.stages["zonal_ptdf"][0][-1], "flat")
+
+            mato.options["fbmc"]["gsk"] = "gmax"
+            mato.fbmc.stages = {}
+            pd.testing.assert_frame_equal(fb_parameters, mato.fbmc.create_flowbased_parameters(basecase, timesteps))
+            # The basecase is identified by its title and results, it is not kept in the cache.
+            for key, _ in mato.fbmc.stages.values():
+                self.assertNotIn(basecase, key)
+        finally:
+            mato.logger.handlers[0].close()
+
+    def test_fb_parameter_stage_keys(self):
+        mato = pomato.POMATO(wdir=self.wdir, options_file="profiles/nrel118.json",
+                             logging_level=logging.ERROR, file_logger=False)
+        mato.load_data('data_input/nrel_118_original.zip')
+        mato.data.process_results(self.wdir.joinpath("opf_market"), mato.grid)
+        basecase = mato.data.results["opf_market"]
+        timesteps = basecase.model_horizon[:2]
+
+        def uncached_fb_parameters():
+            stages, mato.fbmc.stages = mato.fbmc.stages, {}
+            fb_parameters = mato.fbmc.create_flowbased_parameters(basecase, timesteps)
+            mato.fbmc.stages = stages
+            return fb_parameters
+
+        capacity = mato.grid.lines.capacity.copy()
+        try:
+            mato.fbmc.create_fb_parameters(basecase, timesteps)
+            mato.options["fbmc"]["only_crossborder"] = True
+            fb_parameters = mato.fbmc.create_flowbased_parameters(basecase, timesteps)
+            pd.testing.assert_frame_equal(fb_parameters, uncached_fb_parameters())
+
+            # Capacities change the selection of outages. 
+            mato.grid.lines.loc[mato.grid.lines.index[::2], "capacity"] *= 0.2
+            fb_parameters_capacity = mato.fbmc.create_flowbased_parameters(basecase, timesteps)
+            self.assertNotEqual(len(fb_parameters), len(fb_parameters_capacity))
+            pd.testing.assert_frame_equal(fb_parameters_capacity, uncached_fb_parameters())
+        finally:
+            mato.grid.lines.loc[:, "capacity"] = capacity
+            mato.logger.handlers[0].close()
+
+    def test_parallel_fb_parameters(self):
+        mato = pomato.POMATO(wdir=self.wdir, options_file="profiles/nrel118.json",
+                             logging_level=logging.ERROR, file_logger=False)
+        mato.load_data('data_input/nrel_118_original.zip')
+        mato.data.process_results(self.wdir.joinpath("opf_market"), mato.grid)
+        basecase = mato.data.results["opf_market"]
+        timesteps = basecase.model_horizon[:5]
+        mato.options["fbmc"]["gsk"] = "dynamic"
+        mato.options["fbmc"]["minram"] = 0.1
+        try:
+            self.assertFalse(mato.fbmc.parallel_timesteps(timesteps))
+            fb_parameters = mato.fbmc.create_flowbased_parameters(basecase, timesteps)
+
+            mato.options["fbmc"]["workers"] = 2
+            mato.options["fbmc"]["chunk_size"] = 2
+            self.assertTrue(mato.fbmc.parallel_timesteps(timesteps))
+            mato.fbmc.stages = {}
+            fb_parameters_parallel = mato.fbmc.create_flowbased_parameters(basecase, timesteps)
+            pd.testing.assert_frame_equal(fb_parameters, fb_parameters_parallel, atol=1e-8)
+
+            # The result does not depend on the number of workers. 
+            mato.options["fbmc"]["workers"] = 3
+            mato.fbmc.stages = {}
+            pd.testing.assert_frame_equal(fb_parameters_parallel, 
+                                          mato.fbmc.create_flowbased_parameters(basecase, timesteps), 
+                                          check_exact=True)
+        finally:
+            mato.logger.handlers[0].close()
@@ -7,6 +7,7 @@ import shutil
 import sys
 import tempfile
 import unittest
+from unittest import mock
 from pathlib import Path
 
 import numpy as np
@@ -135,6 +136,55 @@ class TestPomatoGridModel(unittest.TestCase):
         self.assertTrue(self.grid_model.julia_dir.joinpath("cbco_data/I_py_save.csv").is_file())
         self.assertTrue(self.grid_model.julia_dir.joinpath("cbco_data/x_bounds_py_save.csv").is_file())
     
+    def test_cnec_data_chunks(self):
+        A, b, info = self.grid_model.create_cnec_data(0.05)
+        self.grid_model.options["grid"]["memory_budget"] = 0.1
+        A_chunks, b_chunks, info_chunks = self.grid_model.create_cnec_data(0.05)
+        np.testing.assert_allclose(A_chunks, A)
+        np.testing.assert_allclose(b_chunks, b)
+        pd.testing.assert_frame_equal(info_chunks, info)
+
+        folder = self.wdir.joinpath("chunks")
+        folder.mkdir()
+        self.grid_model.write_cbco_info(folder, "chunks", chunks=self.grid_model.iter_cnec_chunks(0.05))
+        np.testing.assert_allclose(np.loadtxt(folder.joinpath("A_chunks.csv"), delimiter=","), A)
+        np.testing.assert_allclose(np.loadtxt(folder.joinpath("b_chunks.csv"), delimiter=","), b)
+        Ab_info = pd.read_csv(folder.joinpath("Ab_info.csv"), index_col=0)
+        self.assertEqual(list(Ab_info.cb), list(info.cb))
+        self.assertEqual(list(Ab_info.co), list(info.co))
+
+    def test_cnec_data_n_2(self):
+        _, b, info = self.grid_model.create_cnec_data(0.05)
+        self.grid_model.options["grid"]["n_2_sensitivity"] = 0.2
+        try:
+            A_n_2, b_n_2, info_n_2 = self.grid_model.create_cnec_data(0.05)
+        finally:
+            self.grid_model.options["grid"]["n_2_sensitivity"] = None
+        n_2 = info_n_2.co.str.contains("+", regex=False).values
+        self.assertTrue(n_2.any())
+        pd.testing.assert_frame_equal(info_n_2[~n_2], info)
+        cb, co, _ = self.grid.screen_n_2_contingencies(0.2)
+        self.assertEqual(np.sum(n_2), len(cb))
+        np.testing.assert_allclose(A_n_2[n_2], self.grid.create_n_2_ptdf(0.2).loc[:, self.grid.nodes.index].values)
+
+    def test_nodal_injection_limits(self):
+        data, options = self.grid_model.data, self.grid_model.options
+        nodal_injection_limits = self.grid_model.create_nodal_injection_limits()
+        self.assertEqual(nodal_injection_limits.shape, (len(data.nodes), 1))
+
+        infeasibility = options["infeasibility"]["electricity"]["bound"]
+        net_export = data.net_export[data.net_export.net_export > 0]
+        for k, node in enumerate(data.nodes.index):
+            plants = data.plants[data.plants.node == node]
+            demand = data.demand_el.loc[data.demand_el.node == node, "demand_el"]
+            nex = net_export.loc[net_export.node == node, "net_export"].astype(float)
+            dc = data.dclines.capacity[(data.dclines.node_i == node) | (data.dclines.node_j == node)].astype(float).sum()
+            upper = max(plants.g_max.sum() - demand.min() + max(0, nex.max()) + dc + infeasibility, 0)
+            lower = max(demand.max() + plants.g_max[plants.plant_type.isin(options["plant_types"]["es"] 
+                                                                           + options["plant_types"]["ph"])].sum()
+                        - min(0, nex.min()) + dc + infeasibility, 0)
+            self.assertAlmostEqual(nodal_injection_limits[k, 0], max(upper, lower), places=8)
+
     def test_scopf_invalid_option(self):
         self.grid_model.options["type"] = "scopf"
         self.grid_model.options["grid"]["redundancy_removal_option"] = "invalid_option"
@@ -161,3 +211,270 @@ class TestPomatoGridModel(unittest.TestCase):
             self.assertTrue(self.grid_model.julia_dir.joinpath("cbco_data/x_bounds_py.csv").is_file())
               
         self.grid_model.julia_instance.join()
+
+    def test_python_clarkson(self):
+        import scipy.optimize
+        # N-0 constraints without duplicates, as duplicates are either both redundant
+        # (brute force) or one is essential (Clarkson).
+        Ab = np.unique(np.hstack([self.grid.ptdf, self.grid.lines.capacity.values[:, np.newaxis]*0.5]), axis=0)
+        A, b = Ab[:, :-1], Ab[:, -1]
+        x_bounds = self.grid_model.create_nodal_injection_limits()
+        essential = pomato.grid.RedundancyRemoval(A, b, x_bounds).run()
+
+        # A constraint is essential if it can be violated under all other constraints.
+        expected = []
+        bounds = np.hstack([-x_bounds, x_bounds])
+        for k in range(len(b)):
+            others = np.arange(len(b)) != k
+            result = scipy.optimize.linprog(-A[k], A_ub=A[others], b_ub=b[others], A_eq=np.ones((1, A.shape[1])), 
+                                            b_eq=[0], bounds=bounds, method="highs")
+            if -result.fun > b[k] + 1e-6:
+                expected.append(k)
+        self.assertEqual(essential, expected)
+        self.assertEqual(pomato.grid.RedundancyRemoval(A, b, x_bounds).run(workers=2, batch_size=50), expected)
+
+        self.grid_model.options["grid"]["redundancy_removal_engine"] = "python"
+        try:
+            self.assertEqual(self.grid_model.clarkson_algorithm(A=A, b=b, x_bounds=x_bounds), expected)
+
+            # FBMC domain: essential set for each timestep, returns the index of the FB parameters.
+            gsk = self.grid_model.data.nodes.zone.astype(str).values[:, np.newaxis] == self.grid_model.data.zones.index.values.astype(str)
+            gsk = gsk / gsk.sum(axis=0)
+            zonal_ptdf = np.vstack([np.dot(A, gsk), -np.dot(A, gsk)])
+            fb_parameters = pd.concat([pd.DataFrame(zonal_ptdf, columns=self.grid_model.data.zones.index)
+                                       .assign(ram=np.hstack([b, b])*factor, timestep=timestep)
+                                       for timestep, factor in [("t0001", 1), ("t0002", 0.5)]], ignore_index=True)
+            cbco = self.grid_model.clarkson_algorithm(args={"fbmc_domain": True}, Ab_info=fb_parameters)
+            for timestep in ["t0001", "t0002"]:
+                domain = fb_parameters[fb_parameters.timestep == timestep]
+                essential = pomato.grid.RedundancyRemoval(domain[self.grid_model.data.zones.index].values, 
+                                                          domain.ram.values).run()
+                self.assertEqual([c for c in cbco if c in domain.index], list(domain.index[essential]))
+        finally:
+            self.grid_model.options["grid"]["redundancy_removal_engine"] = "julia"
+
+    def test_prescreen_constraints(self):
+        import scipy.optimize
+        Ab = np.unique(np.hstack([self.grid.ptdf, self.grid.lines.capacity.values[:, np.newaxis]*0.5]), axis=0)
+        A0, b0 = Ab[:, :-1], Ab[:, -1]
+        x_bounds = self.grid_model.create_nodal_injection_limits()
+        n = len(b0)
+        # Dominated multiples of rows 0-9, multiples dominating rows 10-19 and zero rows.
+        A = np.vstack([A0, 2*A0[:10], 3*A0[10:20], np.zeros((3, A0.shape[1]))])
+        b = np.hstack([b0, 2*b0[:10] + 1, 3*b0[10:20] - 1, np.ones(3)])
+        candidates = self.grid_model.prescreen_constraints(A, b)
+        self.assertTrue(np.all(np.isin(np.arange(10), candidates)))
+        self.assertFalse(np.any(np.isin(np.arange(n, n + 10), candidates)))
+        self.assertFalse(np.any(np.isin(np.arange(10, 20), candidates)))
+        self.assertTrue(np.all(np.isin(np.arange(n + 10, n + 20), candidates)))
+        self.assertFalse(np.any(np.isin(np.arange(n + 20, n + 23), candidates)))
+        
+        # Rows removed by the bounds test cannot bind within the bounds.
+        candidates_bounds = self.grid_model.prescreen_constraints(A0, b0, x_bounds)
+        candidates_dominance = self.grid_model.prescreen_constraints(A0, b0)
+        self.assertTrue(0 < len(candidates_bounds) < n)
+        self.assertTrue(np.all(np.isin(candidates_bounds, candidates_dominance)))
+        bounds = np.hstack([-x_bounds, x_bounds])
+        for k in np.setdiff1d(candidates_dominance, candidates_bounds):
+            result = scipy.optimize.linprog(-A0[k], A_eq=np.ones((1, A0.shape[1])), b_eq=[0], 
+                                            bounds=bounds, method="highs")
+            self.assertLessEqual(-result.fun, b0[k] + 1e-6)
+        
+        # Grouped constraints are only compared within each group.
+        groups = np.hstack([np.zeros(n), np.ones(10)])
+        candidates = self.grid_model.prescreen_constraints(A[:n + 10], b[:n + 10], groups=groups)
+        self.assertEqual(len(candidates), len(candidates_dominance) + 10)
+
+    def test_prescreen_julia_indices(self):
+        Ab = np.unique(np.hstack([self.grid.ptdf, self.grid.lines.capacity.values[:, np.newaxis]*0.5]), axis=0)
+        A, b = Ab[:, :-1], Ab[:, -1]
+        x_bounds = self.grid_model.create_nodal_injection_limits()
+        expected = pomato.grid.RedundancyRemoval(A, b, x_bounds).run()
+
+        # The julia engine returns positions of the (prescreened) A, b it receives and  
+        # index labels of the (prescreened) Ab_info it receives.
+        def julia_clarkson_algorithm(args, **kwargs):
+            if args.get("fbmc_domain", False):
+                return pomato.grid.GridModel.python_clarkson_algorithm(self.grid_model, args, **kwargs)
+            self.assertLessEqual(len(kwargs["b"]), len(b))
+            return RedundancyRemoval(kwargs["A"], kwargs["b"], kwargs["x_bounds"]).run()
+
+        RedundancyRemoval = pomato.grid.RedundancyRemoval
+        self.grid_model.options["grid"]["cache_redundancy_removal"] = False
+        try:
+            with mock.patch.object(self.grid_model, "julia_clarkson_algorithm", 
+                                   side_effect=julia_clarkson_algorithm):
+                self.assertEqual(self.grid_model.clarkson_algorithm(A=A, b=b, x_bounds=x_bounds), expected)
+                fb_parameters = pd.DataFrame(A[:, :3], columns=self.grid_model.data.zones.index).assign(
+                    ram=b, timestep="t0001")
+                fb_parameters.index = fb_parameters.index + 100
+                cbco = self.grid_model.clarkson_algorithm(args={"fbmc_domain": True}, Ab_info=fb_parameters)
+        finally:
+            self.grid_model.options["grid"]["cache_redundancy_removal"] = True
+        essential = RedundancyRemoval(fb_parameters.loc[:, self.grid_model.data.zones.index].values, 
+                                      fb_parameters.ram.values).run()
+        self.assertEqual(list(cbco), list(fb_parameters.index[essential]))
+
+    def test_redundancy_removal_cache(self):
+        Ab = np.unique(np.hstack([self.grid.ptdf, self.grid.lines.capacity.values[:, np.newaxis]*0.5]), axis=0)
+        A, b = Ab[:, :-1], Ab[:, -1]
+        x_bounds = self.grid_model.create_nodal_injection_limits()
+        self.grid_model.options["grid"]["redundancy_removal_engine"] = "python"
+        try:
+            problem_hash = self.grid_model.redundancy_removal_hash({}, A=A, b=b, x_bounds=x_bounds)
+            self.assertNotEqual(problem_hash, self.grid_model.redundancy_removal_hash({}, A=A, b=b*1.1, 
+                                                                                      x_bounds=x_bounds))
+            self.assertNotEqual(problem_hash, self.grid_model.redundancy_removal_hash({}, A=A, b=b))
+            cbco = self.grid_model.clarkson_algorithm(A=A, b=b, x_bounds=x_bounds)
+            self.assertTrue(self.grid_model.cache_dir.joinpath(f"{problem_hash}.json").is_file())
+
+            # Cached result is returned without running the algorithm, also for a new GridModel.
+            grid_model = pomato.grid.GridModel(self.wdir, self.grid, self.data, self.options)
+            with mock.patch.object(grid_model, "python_clarkson_algorithm") as run_algorithm:
+                self.assertEqual(grid_model.clarkson_algorithm(A=A.copy(), b=b.copy(), x_bounds=x_bounds), cbco)
+                run_algorithm.assert_not_called()
+
+            # Changing the engine invalidates the cache.
+            self.grid_model.options["grid"]["redundancy_removal_engine"] = "julia"
+            self.assertNotEqual(problem_hash, self.grid_model.redundancy_removal_hash({}, A=A, b=b, 
+                                                                                      x_bounds=x_bounds))
+        finally:
+            self.grid_model.options["grid"]["redundancy_removal_engine"] = "julia"
+
+    def test_write_cbco_info_npy(self):
+        A, b, info = self.grid_model.create_cnec_data(0.05)
+        x_bounds = self.grid_model.create_nodal_injection_limits()
+        folder = self.wdir.joinpath("npy_exchange")
+        folder.mkdir()
+        self.grid_model.write_cbco_info(folder, "chunks", chunks=self.grid_model.iter_cnec_chunks(0.05), 
+                                        exchange_format="npy", x_bounds=x_bounds)
+        with open(folder.joinpath("manifest_chunks.json")) as file:
+            manifest = json.load(file)
+        self.assertEqual(manifest["files"]["A"]["shape"], list(A.shape))
+        np.testing.assert_array_equal(np.load(folder.joinpath(manifest["files"]["A"]["file"])), A)
+        np.testing.assert_array_equal(np.load(folder.joinpath("b_chunks.npy")), b)
+        np.testing.assert_array_equal(np.load(folder.joinpath("x_bounds_chunks.npy")), x_bounds)
+        self.assertEqual(np.load(folder.joinpath("I_chunks.npy")).size, 0)
+        Ab_info = pd.read_feather(folder.joinpath("Ab_info.feather"))
+        self.assertEqual(list(Ab_info["index"]), list(info.index))
+        self.assertEqual(list(Ab_info.cb), list(info.cb))
+        self.assertEqual(list(Ab_info.co), list(info.co))
+
+        # DataFrames, e.g. the FB parameters, keep their index.
+        fb_parameters = info.iloc[:10].set_index(info.index[:10] + 100)
+        self.grid_model.write_cbco_info(folder, "py", exchange_format="npy", Ab_info=fb_parameters)
+        Ab_info = pd.read_feather(folder.joinpath("Ab_info.feather")).set_index("index")
+        pd.testing.assert_frame_equal(Ab_info, fb_parameters, check_names=False)
+
+        # The newest cbco result is read, binary or text.
+        pd.DataFrame({"constraints": [3, 1]}).to_csv(folder.joinpath("cbco_01.csv"), index=False)
+        self.assertEqual(self.grid_model.read_cbco_result(folder), [3, 1])
+        np.save(folder.joinpath("cbco_02.npy"), np.array([5, 2]))
+        self.assertEqual(self.grid_model.read_cbco_result(folder), [5, 2])
+
+    def test_warm_start(self):
+        Ab = np.unique(np.hstack([self.grid.ptdf, self.grid.lines.capacity.values[:, np.newaxis]*0.5]), axis=0)
+        A, b = Ab[:, :-1], Ab[:, -1]
+        x_bounds = self.grid_model.create_nodal_injection_limits()
+        # Changing the capacities of some lines changes the essential set. 
+        b_new = b*np.where(np.arange(len(b)) % 3 == 0, 0.7, 1.2)
+        essential = pomato.grid.RedundancyRemoval(A, b, x_bounds).run()
+        expected = pomato.grid.RedundancyRemoval(A, b_new, x_bounds).run()
+        self.assertNotEqual(essential, expected)
+        self.assertEqual(pomato.grid.RedundancyRemoval(A, b_new, x_bounds).run(seed=essential), expected)
+        self.assertEqual(pomato.grid.RedundancyRemoval(A, b_new, x_bounds).run(workers=2, batch_size=50, 
+                                                                                seed=essential), expected)
+        self.assertEqual(self.grid_model.warm_start_clarkson_algorithm(essential, A=A, b=b_new, 
+                                                                       x_bounds=x_bounds), expected)
+
+        # With a cached result for b, b_new is warm started. 
+        self.grid_model.options["grid"]["redundancy_removal_engine"] = "python"
+        self.grid_model.options["grid"]["warm_start"] = True
+        try:
+            structure_hash = self.grid_model.redundancy_removal_hash({}, include_b=False, A=A, b=b, 
+                                                                     x_bounds=x_bounds)
+            self.assertEqual(structure_hash, self.grid_model.redundancy_removal_hash(
+                {}, include_b=False, A=A, b=b_new, x_bounds=x_bounds))
+            self.assertEqual(self.grid_model.clarkson_algorithm(A=A, b=b, x_bounds=x_bounds), essential)
+            with mock.patch.object(self.grid_model, "python_clarkson_algorithm") as run_algorithm:
+                self.assertEqual(self.grid_model.clarkson_algorithm(A=A, b=b_new, x_bounds=x_bounds), expected)
+                run_algorithm.assert_not_called()
+            
+            # FB domain, warm started per timestep with the index labels.
+            fb_parameters = pd.DataFrame(A[:, :3], columns=self.grid_model.data.zones.index).assign(
+                ram=b, timestep="t0001")
+            fb_parameters = pd.concat([fb_parameters, fb_parameters.assign(timestep="t0002")], ignore_index=True)
+            fb_parameters_new = fb_parameters.assign(ram=np.hstack([b_new, b]))
+            cbco = self.grid_model.clarkson_algorithm(args={"fbmc_domain": True}, Ab_info=fb_parameters)
+            seeded_cbco = self.grid_model.warm_start_clarkson_algorithm(cbco, args={"fbmc_domain": True}, 
+                                                                        Ab_info=fb_parameters_new)
+            self.assertEqual(seeded_cbco, self.grid_model.python_clarkson_algorithm(args={"fbmc_domain": True}, 
+                                                                                    Ab_info=fb_parameters_new))
+
+            # The warm start falls back to the python engine, which is logged.
+            self.grid_model.options["grid"]["redundancy_removal_engine"] = "julia"
+            seed_hash = self.grid_model.redundancy_removal_hash({}, include_b=False, A=A, b=b, x_bounds=x_bounds)
+            self.grid_model._cache_cbco(self.grid_model.cache_dir.joinpath(f"seed_{seed_hash}.json"), expected)
+            with mock.patch.object(self.grid_model, "julia_clarkson_algorithm") as run_algorithm, \
+                self.assertLogs(self.grid_model.logger, level="INFO") as logs:
+                self.assertEqual(self.grid_model.clarkson_algorithm(A=A, b=b_new*0.9, x_bounds=x_bounds),
+                                 pomato.grid.RedundancyRemoval(A, b_new*0.9, x_bounds).run())
+                run_algorithm.assert_not_called()
+            self.assertTrue(any("instead of the julia engine" in log for log in logs.output))
+        finally:
+            self.grid_model.options["grid"]["redundancy_removal_engine"] = "julia"
+            self.grid_model.options["grid"]["warm_start"] = False
+
+    def test_memoized_grid_parameters(self):
+        options = copy.deepcopy(self.options)
+        options["type"] = "scopf"
+        options["grid"]["redundancy_removal_option"] = "full"
+        options["grid"]["include_contingencies_redispatch"] = True
+        options["redispatch"]["include"] = True
+        grid_model = pomato.grid.GridModel(self.wdir, self.grid, self.data, options)
+        with mock.patch.object(grid_model, "create_cnec_data", wraps=grid_model.create_cnec_data) as cnec_data:
+            grid_model.create_grid_representation()
+            # Market and redispatch grid are calculated once, but are independent copies.
+            pd.testing.assert_frame_equal(grid_model.grid_representation.grid, 
+                                          grid_model.grid_representation.redispatch_grid)
+            grid_model.grid_representation.grid.loc[:, "ram"] = 0
+            self.assertFalse((grid_model.grid_representation.redispatch_grid.ram == 0).all())
+            grid_model.create_grid_representation()
+            self.assertEqual(cnec_data.call_count, 1)
+            scopf_grid = grid_model.grid_representation.grid
+            self.assertFalse((scopf_grid.ram == 0).all())
+
+            # Grid relevant options or capacities change the parameters.
+            options["grid"]["short_term_rating_factor"] = 0.9
+            grid_model.create_scopf_grid_parameters()
+            self.assertEqual(cnec_data.call_count, 2)
+            options["grid"]["short_term_rating_factor"] = 1
+            pd.testing.assert_frame_equal(grid_model.create_scopf_grid_parameters(), scopf_grid)
+            self.assertEqual(cnec_data.call_count, 2)
+            
+            # Only the last results are kept.
+            for factor in np.linspace(0.5, 0.9, grid_model.grid_parameters_cache_size):
+                options["grid"]["short_term_rating_factor"] = factor
+                grid_model.create_scopf_grid_parameters()
+            options["grid"]["short_term_rating_factor"] = 1
+            self.assertEqual(len(grid_model.grid_parameters), grid_model.grid_parameters_cache_size)
+            grid_model.create_scopf_grid_parameters()
+            self.assertEqual(cnec_data.call_count, 3 + grid_model.grid_parameters_cache_size)
+            
+        nodal_grid = grid_model.create_nodal_grid_parameters()
+        pd.testing.assert_frame_equal(grid_model.create_nodal_grid_parameters(), nodal_grid)
+        grid = pomato.grid.GridTopology()
+        lines = self.data.lines.copy()
+        lines["capacity"] *= 2
+        grid.calculate_parameters(self.data.nodes, lines)
+        grid_model.grid = grid
+        np.testing.assert_allclose(grid_model.create_nodal_grid_parameters().ram.values, 2*nodal_grid.ram.values)
+
+        # The content of the precalculated cbco file is part of the key.
+        options["grid"]["precalc_filename"] = "memoized_precalc"
+        filename = grid_model.julia_dir.joinpath("cbco_data/memoized_precalc.csv")
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame({"constraints": [0, 1]}).to_csv(filename)
+        key = grid_model.grid_parameters_key("scopf")
+        pd.DataFrame({"constraints": [0, 2]}).to_csv(filename)
+        self.assertNotEqual(grid_model.grid_parameters_key("scopf"), key)
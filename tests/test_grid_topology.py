@@ -7,6 +7,7 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import pomato
@@ -147,6 +148,358 @@ class TestPomatoGrid(unittest.TestCase):
         for line in outages:
             self.assertAlmostEqual(post_contingency_flow[self.grid.lines.index.get_loc(line)], 0)
 
+    def test_sparse_topology(self):
+        dense_grid = pomato.grid.GridTopology()
+        dense_grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        options = pomato.tools.default_options()
+        options["grid"]["sparse"] = True
+        grid = pomato.grid.GridTopology(options)
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+
+        self.assertTrue(scipy.sparse.issparse(grid.incidence_matrix))
+        np.testing.assert_allclose(grid.incidence_matrix.toarray(), dense_grid.incidence_matrix)
+        np.testing.assert_allclose(grid.ptdf, dense_grid.ptdf, atol=1e-8)
+        np.testing.assert_allclose(grid.psdf, dense_grid.psdf, atol=1e-8)
+        np.testing.assert_allclose(grid.lodf, dense_grid.lodf, atol=1e-8)
+        self.assertEqual(grid.contingency_groups, dense_grid.contingency_groups)
+
+    def explicit_inverse_ptdf(self, grid):
+        slack_idx = [grid.nodes.index.get_loc(s) for s in grid.nodes.index[grid.nodes.slack]]
+        list_wo_slack = [n for n in range(0, len(grid.nodes)) if n not in slack_idx]
+        line_susceptance, node_susceptance = grid.create_susceptance_matrices()
+        inv = np.zeros((len(grid.nodes), len(grid.nodes)))
+        inv[np.ix_(list_wo_slack, list_wo_slack)] = np.linalg.inv(
+            node_susceptance[np.ix_(list_wo_slack, list_wo_slack)])
+        return np.dot(line_susceptance, inv)
+
+    def test_ptdf_factorization(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        np.testing.assert_allclose(grid.ptdf, self.explicit_inverse_ptdf(grid), atol=1e-8)
+
+        lines, nodes = [0, 5, 42], [0, 10, 117]
+        np.testing.assert_allclose(grid.create_ptdf_rows(lines), grid.ptdf[lines, :], atol=1e-10)
+        np.testing.assert_allclose(grid.create_ptdf_columns(nodes), grid.ptdf[:, nodes], atol=1e-10)
+
+    def test_ptdf_factorization_de(self):
+        data = pomato.data.DataManagement(pomato.tools.default_options(), self.wdir)
+        data.logger.setLevel(logging.ERROR)
+        data.load_data('data_input/DE_2020.zip')
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(data.nodes, data.lines)
+        np.testing.assert_allclose(grid.ptdf, self.explicit_inverse_ptdf(grid), atol=1e-8)
+
+    def assert_precision(self, nodes, lines):
+        """Compare float32 to float64 parameters, errors relative to the line capacity."""
+        options = pomato.tools.default_options()
+        options["grid"]["precision"] = "float32"
+        grid_32 = pomato.grid.GridTopology(options)
+        grid_32.calculate_parameters(nodes.copy(), lines.copy())
+        grid_64 = pomato.grid.GridTopology()
+        grid_64.calculate_parameters(nodes.copy(), lines.copy())
+        self.assertNotEqual(grid_32.topology_hash, grid_64.topology_hash)
+        self.assertEqual(grid_32.ptdf.dtype, np.float32)
+        self.assertEqual(grid_32.lodf.dtype, np.float32)
+        np.testing.assert_array_equal(grid_32.lines.contingency, grid_64.lines.contingency)
+
+        errors = {"ptdf": np.max(np.abs(grid_32.ptdf - grid_64.ptdf)),
+                  "lodf": np.max(np.abs(grid_32.lodf - grid_64.lodf))}
+        cb_32, co_32, ptdf_32 = grid_32.create_filtered_n_1_ptdf_block(0.05)
+        cb_64, co_64, ptdf_64 = grid_64.create_filtered_n_1_ptdf_block(0.05)
+        self.assertEqual(ptdf_32.dtype, np.float32)
+        np.testing.assert_array_equal(cb_32, cb_64)
+        np.testing.assert_array_equal(co_32, co_64)
+        errors["n_1_ptdf"] = np.max(np.abs(ptdf_32 - ptdf_64))
+        # Flows of an injection that loads each line up to its capacity.
+        injection = np.random.default_rng(0).uniform(-1, 1, len(nodes))
+        injection -= injection.mean()
+        flow = np.dot(ptdf_64, injection)
+        injection *= np.min(grid_64.lines.capacity.values[cb_64] / np.maximum(np.abs(flow), 1e-6))
+        errors["n_1_flow"] = np.max(np.abs(np.dot(ptdf_32, injection.astype(np.float32)) - np.dot(ptdf_64, injection))
+                                    / grid_64.lines.capacity.values[cb_64])
+        for parameter, error in errors.items():
+            grid_32.logger.info("Maximum float32 error of %s: %.2e", parameter, error)
+            self.assertLess(error, 1e-6, msg=f"float32 error of {parameter}: {error}")
+        return errors
+
+    def test_precision(self):
+        self.assert_precision(self.data.nodes, self.data.lines)
+
+    def test_precision_de(self):
+        data = pomato.data.DataManagement(pomato.tools.default_options(), self.wdir)
+        data.logger.setLevel(logging.ERROR)
+        data.load_data('data_input/DE_2020.zip')
+        self.assert_precision(data.nodes, data.lines)
+
+    def test_lodf_closed_form(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        lines = list(range(0, len(grid.lines)))
+        lodf = np.hstack([grid.create_lodf(lines, [outage]) for outage in lines])
+        np.testing.assert_allclose(grid.lodf, lodf, atol=1e-10)
+
+        # 0.01 MB budget results in blocks of a few outages
+        lodf_blocked = grid.create_n_1_lodf_matrix(memory_budget=1e-2)
+        np.testing.assert_allclose(lodf_blocked, grid.lodf, atol=1e-12)
+
+    def test_parameter_cache(self):
+        cache_dir = self.wdir.joinpath("grid_cache")
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy(), cache_dir=cache_dir)
+        self.assertTrue(cache_dir.joinpath(grid.topology_hash, "ptdf.npy").is_file())
+        # The lodf is added to the cache, when it is calculated.
+        self.assertFalse(cache_dir.joinpath(grid.topology_hash, "lodf.npy").is_file())
+        grid.lodf
+        self.assertTrue(cache_dir.joinpath(grid.topology_hash, "lodf.npy").is_file())
+
+        cached_grid = pomato.grid.GridTopology()
+        cached_grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy(), cache_dir=cache_dir)
+        self.assertIsInstance(cached_grid.lodf, np.memmap)
+        np.testing.assert_equal(cached_grid.ptdf, grid.ptdf)
+        np.testing.assert_equal(cached_grid.lodf, grid.lodf)
+        self.assertEqual(cached_grid.contingency_groups, grid.contingency_groups)
+        pd.testing.assert_series_equal(cached_grid.lines.contingency, grid.lines.contingency)
+
+        lines = self.data.lines.copy()
+        lines.loc["l1", "x_pu"] *= 2
+        changed_grid = pomato.grid.GridTopology()
+        changed_grid.calculate_parameters(self.data.nodes.copy(), lines, cache_dir=cache_dir)
+        self.assertNotEqual(grid.topology_hash, changed_grid.topology_hash)
+        self.assertNotIsInstance(changed_grid.lodf, np.memmap)
+
+    def test_topology_analysis(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+
+        degrees = [len(grid.lines[(grid.lines.node_i == node) | (grid.lines.node_j == node)])
+                   for node in grid.nodes.index]
+        np.testing.assert_array_equal(grid.node_degrees(), degrees)
+        radial_lines = [1 in np.around(np.abs(grid.ptdf[idx, :]), decimals=3)
+                        for idx in range(len(grid.lines))]
+        np.testing.assert_array_equal(grid.radial_ptdf_rows(np.arange(len(grid.lines)), rows=7), radial_lines)
+
+        for (node_i, node_j), lines in grid.lines.groupby(["node_i", "node_j"], observed=True):
+            np.testing.assert_array_equal(lines.systems, len(lines))
+            np.testing.assert_array_equal(lines.no, np.arange(len(lines)))
+            if len(lines) == 2 and grid.lines.loc[lines.index, "contingency"].all():
+                self.assertEqual(grid.contingency_groups[lines.index[0]], list(lines.index))
+
+    def test_islands(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        # Second island as copy of the network, with renamed nodes and lines.
+        nodes, lines = self.data.nodes.copy(), self.data.lines.copy()
+        nodes.index = "b_" + nodes.index
+        lines.index = "b_" + lines.index
+        for column in ["node_i", "node_j"]:
+            lines[column] = "b_" + lines[column].astype(str)
+        islands = pomato.grid.GridTopology()
+        islands.calculate_parameters(pd.concat([self.data.nodes.copy(), nodes]),
+                                     pd.concat([self.data.lines.copy(), lines]))
+
+        self.assertEqual(len(np.unique(islands.components)), 2)
+        self.assertEqual(islands.nodes.slack.sum(), 2)
+        L, N = len(grid.lines), len(grid.nodes)
+        for block in [slice(0, L), slice(L, 2*L)]:
+            np.testing.assert_allclose(islands.ptdf[block, block.start//L*N:(block.start//L + 1)*N],
+                                       grid.ptdf, atol=1e-10)
+            np.testing.assert_allclose(islands.lodf[block, block], grid.lodf, atol=1e-10)
+        np.testing.assert_equal(islands.ptdf[:L, N:], 0)
+        np.testing.assert_equal(islands.lodf[:L, L:], 0)
+        self.assertEqual(islands.contingency_groups["b_l0"], ["b_" + l for l in grid.contingency_groups["l0"]])
+
+        slack_zones = islands.slack_zones()
+        self.assertEqual(len(slack_zones), 2)
+        self.assertEqual(sorted(sum(slack_zones.values(), [])), sorted(islands.nodes.index))
+        for slack, nodes in slack_zones.items():
+            self.assertTrue(all(node.startswith("b_") == slack.startswith("b_") for node in nodes))
+
+    def test_lodf_impact_index(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        capacity = grid.lines.capacity.values
+        # Sensitivity where the impact of an outage equals the threshold of line 0.
+        tie = abs(grid.lodf[0, 5]*capacity[5])/capacity[0]
+        for sensitivity in [0, 0.01, 0.05, 0.2, 1, tie]:
+            cb, co = grid.lodf_filter_pairs(sensitivity)
+            pairs = []
+            for line in range(len(grid.lines)):
+                condition = abs(np.multiply(grid.lodf[line], capacity)) >= sensitivity*capacity[line]
+                self.assertEqual(list(grid.lodf_filter(line, sensitivity)), list(grid.lines.index[condition]))
+                self.assertEqual(grid.lodf_filter(grid.lines.index[line], sensitivity, as_index=True),
+                                 list(np.flatnonzero(condition)))
+                pairs.extend([(line, outage) for outage in np.flatnonzero(condition)])
+            self.assertEqual(list(zip(cb, co)), pairs)
+
+        # Compact index that counts against the memory budget.
+        index = grid.lodf_impact_index()
+        self.assertEqual(index.outages.dtype, np.int32)
+        self.assertEqual(index.impacts.dtype, np.float32)
+        grid.memory_budget = 2*index.nbytes/1e6
+        grid.lodf = None
+        grid.lodf_rows(np.arange(len(grid.lines)))
+        self.assertGreater(len(grid._row_cache), 1)
+        self.assertLessEqual(sum(value.nbytes for value in grid._row_cache.values()), index.nbytes)
+
+        # Index is recreated when capacities change
+        index = grid.lodf_impact_index()
+        self.assertIs(grid.lodf_impact_index(), index)
+        grid.lines.loc["l1", "capacity"] *= 2
+        self.assertIsNot(grid.lodf_impact_index(), index)
+
+    def test_n_1_ptdf_batch(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        cb, co = grid.lodf_filter_pairs(0.05, np.flatnonzero(grid.lines.contingency))
+        self.assertTrue(any(len(grid.contingency_groups[outage]) > 1 for outage in grid.lines.index[co]))
+        # Include non-contingency outages
+        cb, co = np.hstack([cb, [0, 5]]), np.hstack([co, np.flatnonzero(~grid.lines.contingency)[:2]])
+
+        n_1_ptdf = grid.create_n_1_ptdf_batch(cb, co)
+        reference = np.vstack([grid.create_n_1_ptdf_cbco(int(line), int(outage)) for line, outage in zip(cb, co)])
+        np.testing.assert_allclose(n_1_ptdf, reference, atol=1e-10)
+
+        gsk = np.random.default_rng(0).random((len(grid.nodes), 3))
+        np.testing.assert_allclose(grid.create_n_1_ptdf_batch(cb, co, grid.ptdf @ gsk), reference @ gsk, atol=1e-10)
+
+        data = grid.create_filtered_n_1_ptdf(0.05)
+        self.assertEqual(list(data.columns[:3]), ["cb", "co", "ram"])
+        self.assertEqual(len(data), len(grid.lines) + len(cb) - 2)
+        np.testing.assert_allclose(data.iloc[len(grid.lines):, 3:].values, reference[:-2], atol=1e-10)
+        self.assertTrue((data.co[:len(grid.lines)] == "basecase").all())
+
+    def test_n_1_ptdf_chunks(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        cb, co, ptdf = grid.create_filtered_n_1_ptdf_block(0.02)
+        # 0.01 MB chunks contain 10 rows
+        chunks = list(grid.iter_filtered_n_1_ptdf(0.02, long_term_rating_factor=0.5, memory_budget=1e-2))
+        self.assertGreater(len(chunks), 1)
+        np.testing.assert_equal(np.hstack([chunk[0] for chunk in chunks]), cb)
+        np.testing.assert_equal(np.hstack([chunk[1] for chunk in chunks]), co)
+        np.testing.assert_allclose(np.vstack([chunk[3] for chunk in chunks]), ptdf, atol=1e-12)
+        ram = np.hstack([chunk[2] for chunk in chunks])
+        np.testing.assert_allclose(ram[co < 0], 0.5*grid.lines.capacity.values)
+        np.testing.assert_allclose(ram[co >= 0], grid.lines.capacity.values[cb[co >= 0]])
+
+    def test_n_2_screening(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        sensitivity = 0.1
+        cb, co, coefficients = grid.screen_n_2_contingencies(sensitivity)
+        self.assertTrue(len(cb) > 0)
+        self.assertTrue((co[:, 0] < co[:, 1]).all())
+
+        # Brute force for the outage pairs of a subset of contingencies, without pairs of the same 
+        # contingency group and pairs that disconnect the network.
+        capacity = grid.lines.capacity.values
+        outages = np.flatnonzero(grid.lines.contingency.values)[:25]
+        expected = set()
+        for i, outage_a in enumerate(outages):
+            for outage_b in outages[i + 1:]:
+                if (grid.lines.index[outage_b] in grid.contingency_groups[grid.lines.index[outage_a]]
+                        or np.isclose(1 - grid.lodf[outage_a, outage_b]*grid.lodf[outage_b, outage_a], 0)):
+                    continue
+                lodf = grid.create_lodf(list(range(len(grid.lines))), [int(outage_a), int(outage_b)])
+                critical = ((np.abs(lodf[:, 0])*capacity[outage_a] >= sensitivity*capacity) 
+                            & (np.abs(lodf[:, 1])*capacity[outage_b] >= sensitivity*capacity))
+                critical[[outage_a, outage_b]] = False
+                expected.update((line, outage_a, outage_b) for line in np.flatnonzero(critical))
+        subset = np.isin(co, outages).all(axis=1)
+        self.assertEqual(set(zip(cb[subset], co[subset, 0], co[subset, 1])), expected)
+        for line, outage, coefficient in zip(cb[subset][:50], co[subset][:50], coefficients[subset][:50]):
+            np.testing.assert_allclose(grid.create_lodf([int(line)], outage.tolist())[0], coefficient)
+
+        n_2_ptdf = grid.create_n_2_ptdf(sensitivity)
+        self.assertEqual(list(n_2_ptdf.columns[:3]), ["cb", "co", "ram"])
+        self.assertEqual(n_2_ptdf.loc[0, "co"], "+".join(grid.lines.index[co[0]]))
+        np.testing.assert_allclose(n_2_ptdf.loc[0, grid.nodes.index].values.astype(float), 
+                                   grid.create_n_1_ptdf_outage(co[0].tolist())[cb[0]], atol=1e-8)
+
+    def test_lazy_parameters(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        reference = pomato.grid.GridTopology()
+        reference.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        lodf, psdf = reference.lodf.copy(), reference.psdf.copy()
+
+        # Row blocks of 10 rows and a cache of at most 8 blocks.
+        grid.memory_budget = 186*8*8*10/1e6
+        lines = np.array([5, 3, 150, 5, 70, 185])
+        np.testing.assert_allclose(grid.lodf_rows(lines), lodf[lines], atol=1e-12)
+        np.testing.assert_allclose(grid.psdf_rows(lines), psdf[lines], atol=1e-12)
+        np.testing.assert_allclose(grid.create_psdf_columns(lines), psdf[:, lines], atol=1e-12)
+        np.testing.assert_allclose(grid.lodf_elements(lines, lines[::-1]), lodf[lines, lines[::-1]], atol=1e-12)
+        np.testing.assert_allclose(grid.lodf_rows(np.arange(186)), lodf, atol=1e-12)
+        self.assertLessEqual(sum(block.nbytes for block in grid._row_cache.values()), grid.memory_budget*1e6)
+
+        # N-1 ptdf and filters do not require the full matrices.
+        cb, co, ptdf = grid.create_filtered_n_1_ptdf_block(0.05)
+        self.assertIsNone(grid._lodf)
+        self.assertIsNone(grid._psdf)
+        _, _, ptdf_reference = reference.create_filtered_n_1_ptdf_block(0.05)
+        np.testing.assert_allclose(ptdf, ptdf_reference, atol=1e-12)
+
+        # Topology edits with and without the full matrices.
+        grid.outage_lines(["l20"])
+        reference.outage_lines(["l20"])
+        self.assertIsNone(grid._lodf)
+        self.assert_parameters_equal(grid, reference)
+
+    def assert_parameters_equal(self, grid, reference):
+        np.testing.assert_allclose(grid.ptdf, reference.ptdf, atol=1e-8)
+        np.testing.assert_allclose(grid.psdf, reference.psdf, atol=1e-8)
+        np.testing.assert_allclose(grid.lodf, reference.lodf, atol=1e-8)
+        np.testing.assert_array_equal(grid.lines.contingency, reference.lines.contingency)
+
+    def test_topology_edits(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        reference = pomato.grid.GridTopology()
+        reference.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        initial_hash = grid.topology_hash
+
+        # Outage equals the contingency ptdf and full recalculation of psdf/lodf
+        outages = ["l0", "l20"]
+        ptdf_outage = grid.create_n_1_ptdf_outage(outages)
+        grid.outage_lines(outages)
+        np.testing.assert_allclose(grid.ptdf, ptdf_outage, atol=1e-8)
+        np.testing.assert_allclose(grid.psdf, grid.create_psdf_matrix(), atol=1e-8)
+        np.testing.assert_allclose(grid.lodf, grid.create_n_1_lodf_matrix(), atol=1e-8)
+        self.assertFalse(grid.lines.loc[outages, "contingency"].any())
+        self.assertNotEqual(grid.topology_hash, initial_hash)
+        self.assertRaises(ValueError, grid.outage_lines, ["l0"])
+
+        # Reactance change on an in service line, compared to recalculation
+        grid.change_reactance({"l5": 2*grid.lines.loc["l5", "x_pu"]})
+        recalculated_ptdf = grid.create_ptdf_matrix()
+        np.testing.assert_allclose(grid.ptdf, recalculated_ptdf, atol=1e-8)
+        np.testing.assert_allclose(grid.psdf, grid.create_psdf_matrix(), atol=1e-8)
+        np.testing.assert_allclose(grid.lodf, grid.create_n_1_lodf_matrix(), atol=1e-8)
+
+        grid.shift_phase_on_line({"l1": 0.1})
+        grid.restore_lines(outages)
+        grid.rollback(4)
+        self.assertEqual(grid.topology_hash, initial_hash)
+        self.assertEqual(len(grid.topology_edits), 0)
+        self.assert_parameters_equal(grid, reference)
+        pd.testing.assert_series_equal(grid.lines.x_pu, reference.lines.x_pu)
+
+        # Restoring outages returns to the initial parameters
+        grid.outage_lines(outages)
+        grid.restore_lines(outages)
+        self.assert_parameters_equal(grid, reference)
+
+    def test_topology_edit_disconnecting(self):
+        grid = pomato.grid.GridTopology()
+        grid.calculate_parameters(self.data.nodes.copy(), self.data.lines.copy())
+        node_i, node_j = grid.line_node_positions()
+        lines = np.arange(len(grid.lines))
+        radial = np.isclose(grid.ptdf[lines, node_i] - grid.ptdf[lines, node_j], 1)
+        radial_line = grid.lines.index[radial][0]
+        self.assertRaises(ValueError, grid.outage_lines, [radial_line])
+        self.assertEqual(len(grid.topology_edits), 0)
+
     def test_phase_shift(self):
         
         line = "l1"